@@ -0,0 +1,214 @@
+from datetime import date
+
+from sqlalchemy import Column, Date, Float, Integer, MetaData, String, Table, delete, func, insert, or_, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import SalesRollup, Order, OrderItem, Product, Category, Brand
+
+# group_by value (also the rollup dimension) -> table holding the display name
+DIMENSIONS = {
+    "product": Product,
+    "category": Category,
+    "brand": Brand,
+}
+ROLLUP_BATCH_SIZE = 1000
+
+
+def rollup_rows(day: date, total: float, lines: list[tuple]) -> dict:
+    """
+    Rollup increments for one order. `lines` are
+    (product_id, category_id, brand_id, quantity, unit_price) tuples.
+    An order counts once per key however many of its lines share that key.
+    """
+    rows = {(day, "total", 0): [1, sum(line[3] for line in lines), total]}
+    for product_id, category_id, brand_id, quantity, price in lines:
+        for dimension, key in (("product", product_id), ("category", category_id), ("brand", brand_id)):
+            row = rows.setdefault((day, dimension, key or 0), [1, 0, 0.0])
+            row[1] += quantity
+            row[2] += quantity * price
+    return rows
+
+
+def merge_rows(into: dict, rows: dict):
+    for key, (orders, units, revenue) in rows.items():
+        row = into.setdefault(key, [0, 0, 0.0])
+        row[0] += orders
+        row[1] += units
+        row[2] += revenue
+
+
+async def upsert_rollups(db: AsyncSession, rows: dict, table: Table = SalesRollup.__table__):
+    """
+    Add the increments to the stored rollups in a single INSERT .. ON CONFLICT.
+    Rows are written in key order so concurrent orders lock them in the same order.
+    """
+    if not rows:
+        return
+    insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    statement = insert(table).values([
+        {"day": day, "dimension": dimension, "key": key, "orders": o, "units": u, "revenue": r}
+        for (day, dimension, key), (o, u, r) in sorted(rows.items())
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.dimension, table.c.key],
+        set_={
+            "orders": table.c.orders + statement.excluded.orders,
+            "units": table.c.units + statement.excluded.units,
+            "revenue": table.c.revenue + statement.excluded.revenue,
+        },
+    )
+    await db.execute(statement)
+
+
+async def record_order(db: AsyncSession, day: date, total: float, lines: list[tuple]):
+    """
+    Called by create_order inside its transaction, so the rollups commit or
+    roll back together with the order.
+    """
+    await upsert_rollups(db, rollup_rows(day, total, lines))
+
+
+# rebuild_rollups fills this copy of sales_rollups, then swaps its rows in
+ROLLUP_STAGING = Table(
+    "sales_rollups_rebuild", MetaData(),
+    Column("day", Date, primary_key=True),
+    Column("dimension", String, primary_key=True),
+    Column("key", Integer, primary_key=True),
+    Column("orders", Integer, nullable=False),
+    Column("units", Integer, nullable=False),
+    Column("revenue", Float, nullable=False),
+)
+
+
+async def _orders_rollup(db: AsyncSession, orders: list) -> dict:
+    """
+    Merged rollup increments for `orders` (rows of id, created_at, total_amount).
+    """
+    lines = {}
+    result = await db.execute(
+        select(
+            OrderItem.order_id, OrderItem.product_id, Product.category_id, Product.brand_id,
+            OrderItem.quantity, OrderItem.price_at_time
+        )
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .where(OrderItem.order_id.in_([o.id for o in orders]))
+    )
+    for order_id, *line in result:
+        lines.setdefault(order_id, []).append((line[0], line[1], line[2], line[3] or 0, line[4] or 0.0))
+    rows = {}
+    for order in orders:
+        merge_rows(rows, rollup_rows(order.created_at.date(), order.total_amount or 0.0, lines.get(order.id, [])))
+    return rows
+
+
+async def rebuild_rollups(db: AsyncSession, batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """
+    Recompute every rollup from orders and order_items. Products are
+    attributed to their current category and brand. Returns the number of
+    orders processed.
+
+    Orders up to max(orders.id) at the start are summed into a staging table,
+    a batch per transaction, while orders keep coming in and updating
+    sales_rollups as usual. The swap then runs in one short transaction that
+    holds off new orders' rollup writes: it replaces sales_rollups with the
+    staging rows and adds the orders the batches did not see (newer than the
+    cutoff, or still uncommitted when their batch was read), so every order
+    is counted exactly once.
+    """
+    postgres = db.bind.dialect.name == "postgresql"
+    await db.run_sync(lambda session: ROLLUP_STAGING.drop(session.connection(), checkfirst=True))
+    await db.run_sync(lambda session: ROLLUP_STAGING.create(session.connection()))
+    await db.commit()
+
+    cutoff = (await db.execute(select(func.max(Order.id)))).scalar() or 0
+    # Ids up to the cutoff the batches did not see, as (first, last) ranges
+    gaps = []
+    last_id, processed = 0, 0
+    while True:
+        result = await db.execute(
+            select(Order.id, Order.created_at, Order.total_amount)
+            .where(Order.id > last_id, Order.id <= cutoff)
+            .order_by(Order.id)
+            .limit(batch_size)
+        )
+        orders = result.all()
+        if not orders:
+            break
+        for order in orders:
+            if order.id > last_id + 1:
+                gaps.append((last_id + 1, order.id - 1))
+            last_id = order.id
+        await upsert_rollups(db, await _orders_rollup(db, orders), ROLLUP_STAGING)
+        await db.commit()
+        processed += len(orders)
+    if last_id < cutoff:
+        gaps.append((last_id + 1, cutoff))
+
+    # Swap. Postgres: the table lock waits for orders already writing rollups
+    # and blocks new ones until commit. SQLite: the DELETE takes the database
+    # write lock, which does the same.
+    if postgres:
+        await db.execute(text(f"LOCK TABLE {SalesRollup.__tablename__} IN EXCLUSIVE MODE"))
+    await db.execute(delete(SalesRollup))
+    await db.execute(insert(SalesRollup).from_select(
+        [c.name for c in ROLLUP_STAGING.c], select(*ROLLUP_STAGING.c)
+    ))
+    missed = (await db.execute(
+        select(Order.id, Order.created_at, Order.total_amount)
+        .where(or_(Order.id > cutoff, *[Order.id.between(first, last) for first, last in gaps]))
+    )).all()
+    if missed:
+        await upsert_rollups(db, await _orders_rollup(db, missed))
+    await db.run_sync(lambda session: ROLLUP_STAGING.drop(session.connection()))
+    await db.commit()
+    return processed + len(missed)
+
+
+async def sales_report(
+    db: AsyncSession,
+    group_by: str = "day",
+    date_from: date | None = None,
+    date_to: date | None = None,
+    limit: int = 100,
+) -> list[dict]:
+    """
+    Revenue per day (the latest `limit` days, oldest first), or per
+    product/category/brand over the range (highest revenue first). Reads only
+    the rollup table.
+    """
+    dimension = "total" if group_by == "day" else group_by
+    conditions = [SalesRollup.dimension == dimension]
+    if date_from is not None:
+        conditions.append(SalesRollup.day >= date_from)
+    if date_to is not None:
+        conditions.append(SalesRollup.day <= date_to)
+
+    if group_by == "day":
+        result = await db.execute(
+            select(SalesRollup.day, SalesRollup.orders, SalesRollup.units, SalesRollup.revenue)
+            .where(*conditions)
+            .order_by(SalesRollup.day.desc())
+            .limit(limit)
+        )
+        # The latest `limit` days, returned oldest first
+        return [row._asdict() for row in reversed(result.all())]
+
+    table = DIMENSIONS[group_by]
+    revenue = func.sum(SalesRollup.revenue).label("revenue")
+    result = await db.execute(
+        select(
+            SalesRollup.key.label("id"),
+            table.name,
+            func.sum(SalesRollup.orders).label("orders"),
+            func.sum(SalesRollup.units).label("units"),
+            revenue,
+        )
+        .outerjoin(table, table.id == SalesRollup.key)
+        .where(*conditions)
+        .group_by(SalesRollup.key, table.name)
+        .order_by(revenue.desc(), SalesRollup.key)
+        .limit(limit)
+    )
+    return [{**row._asdict(), "id": row.id or None} for row in result]
@@ -1,5 +1,10 @@
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import hmac
+import os
 from fastapi import Depends, FastAPI, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
@@ -9,21 +14,78 @@ from sqlalchemy.future import select
 from database import get_db
 from models import User
 from schemas import TokenData
+from cache import ReadCache
 
 # SECRET_KEY should be in env vars in production
 SECRET_KEY = "supersecretkeyshouldbechanged"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Authenticated users are cached briefly so a request does not need its own
+# SELECT. Every user write invalidates the whole cache ("users" table version).
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_TABLES = ("users",)
+
+user_cache = ReadCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# bcrypt takes ~250 ms of CPU per call. It runs on a small thread pool (the
+# bcrypt extension releases the GIL) so logins never stall the event loop.
+# Once MAX_PENDING calls are queued, new ones get a 429 instead of piling up.
+# PASSWORD_HASH_WORKERS=0 hashes inline on the event loop.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt") if PASSWORD_HASH_WORKERS > 0 else None
+_hash_pending = 0
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def _run_hashing(func, *args):
+    global _hash_pending
+    if _hash_executor is None:
+        return func(*args)
+    if _hash_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many sign-in attempts in progress, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_pending -= 1
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_hashing(get_password_hash, password)
+
+def token_version(user: User) -> str:
+    """
+    Fingerprint of the user's password hash carried in the token as "ver".
+    Changing the password changes it, which revokes tokens issued before.
+    """
+    digest = hmac.new(SECRET_KEY.encode(), (user.hashed_password or "").encode(), hashlib.sha256)
+    return digest.hexdigest()[:16]
+
+def token_claims(user: User) -> dict:
+    return {"sub": user.username, "uid": user.id, "ver": token_version(user)}
+
+def _detached_copy(user: User) -> User:
+    # A plain column snapshot that is not bound to any session, so it can be
+    # shared between requests without being expired by someone else's commit.
+    return User(**{column.key: getattr(user, column.key) for column in User.__table__.columns})
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -58,12 +120,29 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: As
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
+
+    # Tokens issued before user ids and versions were added carry neither and
+    # always take the database path.
+    user_id = payload.get("uid")
+    version = payload.get("ver")
+    cache_key = (user_id, version)
+    if user_id is not None and version is not None:
+        cached = user_cache.get(cache_key, USER_TABLES)
+        if cached is not None:
+            return cached
+    versions = user_cache.versions.get(*USER_TABLES)
     
     result = await db.execute(select(User).where(User.username == token_data.username))
     user = result.scalars().first()
     
     if user is None:
         raise credentials_exception
+    if version is not None and (user.id != user_id or token_version(user) != version):
+        raise credentials_exception
+
+    user = _detached_copy(user)
+    if version is not None:
+        user_cache.set(cache_key, USER_TABLES, user, versions)
     return user
 
 async def get_current_active_user(current_user: Annotated[User, Depends(get_current_user)]):
@@ -0,0 +1,173 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# Catalog tables change a few times a day, so entries can live for a while:
+# every write bumps the table version, which retires the old entries at once.
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "512"))
+# With read replicas, a value loaded this soon after a write to one of its
+# tables (made here or announced by another process) may come from a replica
+# that has not applied the write yet: it is served, but not cached
+CATALOG_CACHE_SETTLE = (
+    float(os.getenv("CATALOG_CACHE_SETTLE", os.getenv("READ_YOUR_WRITES_SECONDS", "5")))
+    if os.getenv("DATABASE_REPLICA_URLS", "").strip() else 0.0
+)
+
+
+class TableVersions:
+    """
+    Per-table write counters. A write to a table bumps its version, so anything
+    derived from an older version (cache entries, ETags) is known to be stale.
+    """
+    def __init__(self):
+        self._versions: dict[str, int] = {}
+        self._modified: dict[str, datetime] = {}
+        self._started = datetime.now(timezone.utc).replace(microsecond=0)
+        # Monotonic time of each table's last bump, and of the last bump_all()
+        self._bumped: dict[str, float] = {}
+        self._bumped_all = float("-inf")
+        # Added to every table's version by bump_all(); both only grow, so the
+        # sum changes whenever either does
+        self._epoch = 0
+        self._listeners = []
+
+    def get(self, *tables: str) -> tuple:
+        return tuple(self._versions.get(t, 0) + self._epoch for t in tables)
+
+    def bump(self, *tables: str, notify: bool = True):
+        """
+        Mark `tables` as written. Listeners (the invalidation bus) hear about it
+        unless notify=False, which is how writes made by other processes are applied.
+        """
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        bumped = time.monotonic()
+        for table in tables:
+            self._versions[table] = self._versions.get(table, 0) + 1
+            self._modified[table] = now
+            self._bumped[table] = bumped
+        if notify:
+            for listener in self._listeners:
+                listener(tables)
+
+    def bump_all(self):
+        # For when writes may have been missed, e.g. after losing the invalidation bus
+        self._epoch += 1
+        self._started = datetime.now(timezone.utc).replace(microsecond=0)
+        self._modified.clear()
+        self._bumped_all = time.monotonic()
+
+    def add_listener(self, listener):
+        """
+        `listener(tables)` is called on every local bump; it must not block.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def last_modified(self, *tables: str) -> datetime:
+        # Tables untouched since startup report the process start time
+        return max((self._modified.get(t, self._started) for t in tables), default=self._started)
+
+    def bumped_within(self, seconds: float, *tables: str) -> bool:
+        cutoff = time.monotonic() - seconds
+        return self._bumped_all > cutoff or any(self._bumped.get(t, float("-inf")) > cutoff for t in tables)
+
+    def reset(self):
+        self._versions.clear()
+        self._modified.clear()
+        self._bumped.clear()
+        self._bumped_all = float("-inf")
+        self._epoch = 0
+
+
+table_versions = TableVersions()
+
+
+class ReadCache:
+    """
+    In-memory LRU cache with a TTL whose entries are tagged with the versions of
+    the tables they were built from. An entry is only served while none of those
+    tables has been written since; invalidating is a version bump, not a scan.
+    Values loaded within `settle` seconds of a write to their tables are
+    returned without being cached.
+    """
+    def __init__(self, maxsize: int = 512, ttl: float = 300, versions: TableVersions = table_versions,
+                 settle: float = 0.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.versions = versions
+        self.settle = settle
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key, tables: tuple):
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, versions, value = entry
+            if versions == self.versions.get(*tables) and expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, tables: tuple, value, versions: tuple | None = None):
+        """
+        Store `value`. Pass the `versions` captured before loading it so a write that
+        lands while the value was being built leaves the entry already stale.
+        """
+        if not self.enabled:
+            return
+        if versions is None:
+            versions = self.versions.get(*tables)
+        self._entries[key] = (time.monotonic() + self.ttl, versions, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key, tables: tuple, loader):
+        """
+        Return the cached value for `key`, or await `loader()` and cache its result.
+        """
+        value = self.get(key, tables)
+        if value is None:
+            versions = self.versions.get(*tables)
+            value = await loader()
+            if value is not None and not (self.settle and self.versions.bumped_within(self.settle, *tables)):
+                self.set(key, tables, value, versions)
+        return value
+
+    def invalidate(self, *tables: str):
+        self.versions.bump(*tables)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+catalog_cache = ReadCache(maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL, settle=CATALOG_CACHE_SETTLE)
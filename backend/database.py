@@ -1,28 +1,229 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+import itertools
+import math
 import os
+import time
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./pos.db")
+from fastapi import Depends, Request, Response
 
-# Fix Render's postgres:// to postgresql:// if needed
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+asyncpg://", 1)
-elif DATABASE_URL.startswith("postgresql://") and "+asyncpg" not in DATABASE_URL:
-    DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+def normalize_url(url: str) -> str:
+    # Fix Render's postgres:// to postgresql:// if needed
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql://") and "+asyncpg" not in url:
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
 
-connect_args = {"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+DATABASE_URL = normalize_url(os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./pos.db"))
 
-engine = create_async_engine(
-    DATABASE_URL,
-    connect_args=connect_args,
-    echo=True
-)
+# Optional read replicas (comma separated). Read-only GET handlers are spread
+# across them; everything else stays on DATABASE_URL.
+DATABASE_REPLICA_URLS = [
+    normalize_url(url.strip()) for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+# "round_robin" or "least_connections"
+REPLICA_SELECTION = os.getenv("REPLICA_SELECTION", "round_robin")
+# After a write, the client that made it reads from the primary for this long
+# so replica lag never hides its change. The write's response carries
+# X-Read-Primary-Until (a Unix time), which the client sends back on its reads
+# until then; a header, because the frontends call the API cross-site, where
+# cookies are not stored or sent.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_PRIMARY_HEADER = "X-Read-Primary"
+READ_PRIMARY_UNTIL_HEADER = "X-Read-Primary-Until"
+# POSTs that change nothing a later read could miss
+NON_WRITE_PATHS = {"/token"}
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+# Log every SQL statement (very noisy; for local debugging only)
+DATABASE_ECHO = _env_bool("DATABASE_ECHO", "false")
+
+# Connection pool. Size + overflow is the most connections one worker will open,
+# so keep (workers x that) under the server's max_connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", "true")
+# Recycle connections before the server or a proxy drops idle ones (-1 disables)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Compiled SQL cache shared by all connections, and asyncpg's per-connection
+# prepared statement cache. Set DB_STATEMENT_CACHE_SIZE=0 behind pgbouncer in
+# transaction mode, which cannot keep prepared statements.
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "500"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+# How long a SQLite writer waits for the lock before "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":"))
+
+
+def engine_options(url: str) -> dict:
+    """
+    Keyword arguments for create_async_engine, driven by the DB_* settings above.
+    """
+    options = {"echo": DATABASE_ECHO, "query_cache_size": DB_QUERY_CACHE_SIZE}
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    elif "asyncpg" in url:
+        connect_args = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+        if DB_STATEMENT_CACHE_SIZE == 0:
+            connect_args["statement_cache_size"] = 0
+        options["connect_args"] = connect_args
+    # In-memory SQLite lives on a single static connection; there is nothing to size
+    if not _is_memory_sqlite(url):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+
+def configure_sqlite(engine):
+    """
+    WAL lets readers run while a write is in progress, and busy_timeout makes
+    writers queue for the lock instead of failing straight away.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not _is_memory_sqlite(str(engine.url)):
+            cursor.execute("PRAGMA journal_mode=WAL")
+            # Durable at checkpoints; the usual pairing with WAL
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+
+def pool_report(engine) -> dict:
+    """
+    Effective pool configuration, for the startup log.
+    """
+    pool = engine.pool
+    report = {
+        "dialect": engine.dialect.name,
+        "driver": engine.dialect.driver,
+        "pool": type(pool).__name__,
+        "query_cache_size": DB_QUERY_CACHE_SIZE,
+    }
+    if hasattr(pool, "size"):
+        report.update(
+            pool_size=pool.size(),
+            max_overflow=pool._max_overflow,
+            pool_timeout=pool._timeout,
+            pool_recycle=pool._recycle,
+            pool_pre_ping=pool._pre_ping,
+        )
+    if engine.dialect.driver == "asyncpg":
+        report["statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+    if engine.dialect.name == "sqlite":
+        report["busy_timeout_ms"] = SQLITE_BUSY_TIMEOUT_MS
+    return report
+
+
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+configure_sqlite(engine)
 
 SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AsyncSession)
 
 class Base(DeclarativeBase):
     pass
 
+def create_missing_indexes(conn):
+    """
+    create_all only creates indexes together with new tables, so indexes added to
+    existing models are created here for databases that already exist.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
 async def get_db():
     async with SessionLocal() as session:
         yield session
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.engine = create_async_engine(url, **engine_options(url))
+        configure_sqlite(self.engine)
+        self.sessions = async_sessionmaker(autocommit=False, autoflush=False, bind=self.engine, class_=AsyncSession)
+        self.in_use = 0
+
+
+class ReplicaSet:
+    """
+    Picks a replica per read request, either in turn or the one serving the
+    fewest requests right now.
+    """
+    def __init__(self, urls: list[str], selection: str = "round_robin"):
+        if selection not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown REPLICA_SELECTION: {selection}")
+        self.replicas = [Replica(url) for url in urls]
+        self.selection = selection
+        self._turn = itertools.count()
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def choose(self) -> Replica:
+        if self.selection == "least_connections":
+            return min(self.replicas, key=lambda r: r.in_use)
+        return self.replicas[next(self._turn) % len(self.replicas)]
+
+
+replicas = ReplicaSet(DATABASE_REPLICA_URLS, REPLICA_SELECTION)
+
+
+def _pinned_until(request: Request) -> float:
+    try:
+        return float(request.headers.get(READ_PRIMARY_UNTIL_HEADER, ""))
+    except ValueError:
+        return 0.0
+
+
+def read_from_primary(request: Request) -> bool:
+    return bool(request.headers.get(READ_PRIMARY_HEADER)) or _pinned_until(request) > time.time()
+
+
+def pin_to_primary(request: Request, response: Response):
+    """
+    After a successful write, tell this client to send its reads to the
+    primary for READ_YOUR_WRITES_SECONDS. Other clients keep reading from the
+    replicas.
+    """
+    if not replicas or request.method in ("GET", "HEAD", "OPTIONS") or response.status_code >= 400:
+        return
+    if request.url.path in NON_WRITE_PATHS:
+        return
+    response.headers[READ_PRIMARY_UNTIL_HEADER] = str(math.ceil(time.time() + READ_YOUR_WRITES_SECONDS))
+
+
+async def get_read_db(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Session for read-only handlers: a replica when one is configured, otherwise
+    the primary session (which only connects if it is used).
+    """
+    if not replicas or read_from_primary(request):
+        yield db
+        return
+    replica = replicas.choose()
+    replica.in_use += 1
+    try:
+        async with replica.sessions() as session:
+            yield session
+    finally:
+        replica.in_use -= 1
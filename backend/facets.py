@@ -0,0 +1,87 @@
+from sqlalchemy import case, func, literal, null, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import Product
+
+# Lower bounds of the price ranges shown in the sidebar; the last one is open-ended
+PRICE_BUCKETS = [0, 100, 500, 1000, 5000, 10000]
+
+
+def catalog_conditions(
+    category_ids: list[int] | None = None,
+    brand_ids: list[int] | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    in_stock: bool | None = None,
+) -> dict:
+    """
+    WHERE clauses for the catalog filters, keyed by facet so each facet's counts
+    can leave out its own filter (picking a brand should not hide other brands).
+    """
+    conditions = {}
+    if category_ids:
+        conditions["category"] = [Product.category_id.in_(category_ids)]
+    if brand_ids:
+        conditions["brand"] = [Product.brand_id.in_(brand_ids)]
+    price = []
+    if min_price is not None:
+        price.append(Product.price >= min_price)
+    if max_price is not None:
+        price.append(Product.price <= max_price)
+    if price:
+        conditions["price"] = price
+    if in_stock is not None:
+        conditions["in_stock"] = [Product.stock > 0 if in_stock else Product.stock <= 0]
+    return conditions
+
+
+def all_conditions(conditions: dict, exclude: str | None = None) -> list:
+    return [c for facet, clauses in conditions.items() if facet != exclude for c in clauses]
+
+
+def _price_bucket():
+    whens = [(Product.price < upper, index) for index, upper in enumerate(PRICE_BUCKETS[1:])]
+    return case(*whens, else_=len(PRICE_BUCKETS) - 1)
+
+
+async def facet_counts(db: AsyncSession, conditions: dict) -> dict:
+    """
+    Count products per category, brand, price range and stock status in a single
+    aggregate query (one UNION ALL branch per facet). Nothing is fetched row by row.
+    """
+    count = func.count(Product.id)
+    in_stock = case((Product.stock > 0, 1), else_=0)
+    bucket = _price_bucket()
+    branches = [
+        select(literal("total").label("facet"), null().label("value"), count.label("count"))
+        .where(*all_conditions(conditions)),
+        select(literal("category"), Product.category_id, count)
+        .where(*all_conditions(conditions, "category")).group_by(Product.category_id),
+        select(literal("brand"), Product.brand_id, count)
+        .where(*all_conditions(conditions, "brand")).group_by(Product.brand_id),
+        # Unpriced products are in no range (the CASE would put them in the last one)
+        select(literal("price"), bucket, count)
+        .where(Product.price.is_not(None), *all_conditions(conditions, "price")).group_by(bucket),
+        select(literal("in_stock"), in_stock, count)
+        .where(*all_conditions(conditions, "in_stock")).group_by(in_stock),
+    ]
+    result = await db.execute(union_all(*branches))
+
+    facets = {"total": 0, "categories": [], "brands": [], "price_ranges": [], "in_stock": 0, "out_of_stock": 0}
+    for facet, value, n in result:
+        if facet == "total":
+            facets["total"] = n
+        elif facet == "category":
+            facets["categories"].append({"value": value, "count": n})
+        elif facet == "brand":
+            facets["brands"].append({"value": value, "count": n})
+        elif facet == "price":
+            upper = PRICE_BUCKETS[value + 1] if value + 1 < len(PRICE_BUCKETS) else None
+            facets["price_ranges"].append({"min": PRICE_BUCKETS[value], "max": upper, "count": n})
+        elif facet == "in_stock":
+            facets["in_stock" if value else "out_of_stock"] = n
+    facets["categories"].sort(key=lambda f: -f["count"])
+    facets["brands"].sort(key=lambda f: -f["count"])
+    facets["price_ranges"].sort(key=lambda f: f["min"])
+    return facets
@@ -0,0 +1,104 @@
+import functools
+import os
+import types
+import typing
+
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+# Opt-in: list endpoints skip response_model validation and encode with orjson.
+# Their data comes from our own database through the same schemas, so the
+# validation only costs CPU; the output is byte-for-byte the same JSON shape.
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() in ("1", "true", "yes")
+
+
+def _default(obj):
+    # Validated models, e.g. cached before FAST_JSON was switched on
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    orjson-encoded JSON. Content is usually built by to_dict().
+    """
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def _nested_model(annotation):
+    """
+    (model, is_list) for fields holding a model, a list of models, or either
+    of those or None; (None, False) for anything else.
+    """
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType):
+        for arg in typing.get_args(annotation):
+            if arg is not type(None):
+                return _nested_model(arg)
+        return None, False
+    if origin is list:
+        model, _ = _nested_model(typing.get_args(annotation)[0])
+        return model, model is not None
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    return None, False
+
+
+_MISSING = object()
+
+
+@functools.cache
+def _plan(model: type[BaseModel]) -> tuple:
+    plan = []
+    for name, field in model.model_fields.items():
+        default = _MISSING if field.is_required() else field.get_default(call_default_factory=True)
+        plan.append((name, *_nested_model(field.annotation), default))
+    return tuple(plan)
+
+
+def to_dict(model: type[BaseModel], obj, fields: frozenset | None = None) -> dict:
+    """
+    The JSON-ready dict `model` would produce from `obj` (an ORM object or a
+    row), built without validation. Nested models and lists of models are
+    built the same way. Column values are read straight from an ORM object's
+    __dict__, skipping the instrumented attribute lookups, so attributes that
+    were not loaded fall back to the field default instead of lazy loading.
+    `fields` limits the top-level keys (sparse fieldsets).
+    """
+    values = obj.__dict__ if hasattr(obj, "_sa_instance_state") else None
+    result = {}
+    for name, nested, is_list, default in _plan(model):
+        if fields is not None and name not in fields:
+            continue
+        value = values.get(name, _MISSING) if values is not None else getattr(obj, name, _MISSING)
+        if value is _MISSING:
+            if default is _MISSING:
+                continue
+            value = default
+        elif nested is not None and value is not None:
+            value = [to_dict(nested, v) for v in value] if is_list else to_dict(nested, value)
+        result[name] = value
+    return result
+
+
+def build(model: type[BaseModel], obj):
+    return to_dict(model, obj) if FAST_JSON else model.model_validate(obj)
+
+
+def fast_response(content, response: Response) -> FastJSONResponse:
+    """
+    Encode `content` directly, keeping the status and headers (ETag, cursor)
+    already set on the endpoint's `response` parameter, which FastAPI would
+    otherwise drop when an endpoint returns its own Response.
+    """
+    result = FastJSONResponse(content, status_code=response.status_code or 200)
+    result.headers.raw.extend((k, v) for k, v in response.headers.raw if k not in (b"content-length", b"content-type"))
+    return result
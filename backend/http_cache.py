@@ -0,0 +1,81 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+from cache import ReadCache, table_versions
+from fast_json import dumps
+
+# "no-cache" lets browsers and a CDN keep the body but revalidate every time,
+# which is a cheap 304 when nothing changed. Override per route, e.g.
+# CACHE_CONTROL_CATALOG="public, max-age=0, s-maxage=60, stale-while-revalidate=300"
+CACHE_CONTROL_DEFAULT = os.getenv("CACHE_CONTROL_DEFAULT", "public, no-cache")
+
+CACHE_CONTROL = {
+    route: os.getenv(f"CACHE_CONTROL_{route.upper()}", CACHE_CONTROL_DEFAULT)
+    for route in ("catalog", "settings", "brands")
+}
+
+
+def content_etag(payload) -> str:
+    # A hash of the body, so every worker and every instance gives identical
+    # content the same ETag
+    return '"' + hashlib.sha256(dumps(payload)).hexdigest()[:32] + '"'
+
+
+async def load_tagged(cache: ReadCache, key, tables: tuple, loader) -> tuple:
+    """
+    Like cache.get_or_load, but returns (value, etag); the ETag is computed
+    once per cache fill and kept with the entry. (None, None) when the loader
+    found nothing.
+    """
+    async def tagged():
+        value = await loader()
+        return None if value is None else (value, content_etag(value))
+    return await cache.get_or_load(key, tables, tagged) or (None, None)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, so W/"x" matches "x"
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def conditional_get(request: Request, response: Response, route: str, tables: tuple, etag: str) -> Response | None:
+    """
+    Validate the request against `etag` and the last write to `tables`.
+    Returns a ready 304 response when the client copy is still fresh; otherwise sets
+    ETag, Last-Modified and Cache-Control on `response` and returns None so the
+    handler returns the body as usual.
+
+    Last-Modified has whole-second resolution, so it is left out while the
+    last write is in the current second: another write in that second would
+    get the same value and If-Modified-Since would wrongly answer 304. The
+    ETag always takes precedence when both validators are sent.
+    """
+    last_modified = table_versions.last_modified(*tables)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL.get(route, CACHE_CONTROL_DEFAULT)}
+    settled = last_modified < datetime.now(timezone.utc).replace(microsecond=0)
+    if settled:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, headers["ETag"])
+    else:
+        fresh = False
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and settled:
+            try:
+                fresh = last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                fresh = False
+
+    if fresh:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import tempfile
+import uuid
+
+from sqlalchemy.engine import make_url
+
+from cache import TableVersions, table_versions
+from database import DATABASE_URL
+
+logger = logging.getLogger("invalidation")
+
+# How table writes reach the caches of the other worker processes:
+#   postgres - LISTEN/NOTIFY on the primary database (any number of hosts)
+#   local    - Unix datagram sockets in INVALIDATION_SOCKET_DIR (workers on one host)
+#   none     - single process
+#   auto     - postgres when DATABASE_URL is Postgres, local otherwise
+INVALIDATION_BACKEND = os.getenv("INVALIDATION_BACKEND", "auto")
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "cache_invalidation")
+INVALIDATION_SOCKET_DIR = os.getenv(
+    "INVALIDATION_SOCKET_DIR", os.path.join(tempfile.gettempdir(), "pos-cache-invalidation")
+)
+INVALIDATION_RECONNECT_SECONDS = float(os.getenv("INVALIDATION_RECONNECT_SECONDS", "5"))
+
+
+class InvalidationBus:
+    """
+    Publishes every local table version bump to the other processes, and
+    applies theirs here. Caches key their entries on table versions, so a
+    remote bump retires exactly the entries built from the written tables.
+    This base class is the no-op backend.
+    """
+    name = "none"
+
+    def __init__(self, versions: TableVersions = table_versions):
+        self.versions = versions
+        # Lets a process recognise, and skip, its own events
+        self.origin = uuid.uuid4().hex
+        self.received = 0
+        self.published = 0
+
+    async def start(self):
+        self.versions.add_listener(self.publish)
+
+    async def stop(self):
+        self.versions.remove_listener(self.publish)
+
+    def encode(self, tables) -> bytes:
+        return json.dumps({"origin": self.origin, "tables": list(tables)}).encode()
+
+    def publish(self, tables):
+        pass
+
+    def receive(self, message: bytes | str):
+        try:
+            event = json.loads(message)
+            origin, tables = event["origin"], event["tables"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed invalidation event", extra={"fields": {"message": str(message)[:200]}})
+            return
+        if origin == self.origin:
+            return
+        self.received += 1
+        self.versions.bump(*tables, notify=False)
+        logger.debug("Applied remote invalidation", extra={"fields": {"tables": tables, "origin": origin}})
+
+
+class LocalSocketBus(InvalidationBus):
+    """
+    One Unix datagram socket per process in a shared directory. Publishing
+    sends the event to every other socket there; sockets left behind by dead
+    processes are removed on the first failed send.
+    """
+    name = "local"
+
+    def __init__(self, directory: str = INVALIDATION_SOCKET_DIR, versions: TableVersions = table_versions):
+        super().__init__(versions)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}-{self.origin[:8]}.sock")
+        self._socket: socket.socket | None = None
+
+    async def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        self._socket.setblocking(False)
+        asyncio.get_running_loop().add_reader(self._socket.fileno(), self._read)
+        await super().start()
+
+    async def stop(self):
+        await super().stop()
+        if self._socket is not None:
+            asyncio.get_running_loop().remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _read(self):
+        while True:
+            try:
+                message = self._socket.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.receive(message)
+
+    def publish(self, tables):
+        if self._socket is None:
+            return
+        message = self.encode(tables)
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self.path or not name.endswith(".sock"):
+                continue
+            try:
+                self._socket.sendto(message, path)
+                self.published += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Nobody listening any more
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                # Receiver's queue is full; its cache TTL bounds how stale it gets
+                logger.warning("Invalidation event dropped", extra={"fields": {"peer": name, "tables": list(tables)}})
+
+
+class PostgresBus(InvalidationBus):
+    """
+    LISTEN/NOTIFY on one dedicated asyncpg connection. Events sent while the
+    connection is down are lost, so every (re)connect invalidates everything.
+    """
+    name = "postgres"
+
+    def __init__(self, url: str = DATABASE_URL, channel: str = INVALIDATION_CHANNEL,
+                 versions: TableVersions = table_versions):
+        super().__init__(versions)
+        self.dsn = make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self._connection = None
+        self._lock: asyncio.Lock | None = None
+        self._task: asyncio.Task | None = None
+        self._pending: set[asyncio.Task] = set()
+
+    async def start(self):
+        self._lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+        await super().start()
+
+    async def stop(self):
+        await super().stop()
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        import asyncpg
+
+        connected_before = False
+        while True:
+            lost = asyncio.Event()
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(self.channel, lambda _c, _p, _ch, payload: self.receive(payload))
+                self._connection = connection
+                # Anything cached while not listening may have missed a write
+                self.versions.bump_all()
+                if connected_before:
+                    logger.warning("Invalidation bus reconnected, caches flushed")
+                connected_before = True
+                try:
+                    await lost.wait()
+                finally:
+                    self._connection = None
+                    await connection.close()
+                logger.warning("Invalidation bus connection lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Invalidation bus connection failed")
+            await asyncio.sleep(INVALIDATION_RECONNECT_SECONDS)
+
+    async def _notify(self, payload: str):
+        connection = self._connection
+        if connection is None:
+            logger.warning("Invalidation event dropped, bus not connected", extra={"fields": {"payload": payload}})
+            return
+        try:
+            # One query at a time on an asyncpg connection
+            async with self._lock:
+                await connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+            self.published += 1
+        except Exception:
+            logger.exception("Invalidation event not published")
+
+    def publish(self, tables):
+        task = asyncio.create_task(self._notify(self.encode(tables).decode()))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+
+def create_bus(backend: str = INVALIDATION_BACKEND, url: str = DATABASE_URL) -> InvalidationBus:
+    if backend == "auto":
+        if make_url(url).get_backend_name() == "postgresql":
+            backend = "postgres"
+        else:
+            backend = "local" if hasattr(socket, "AF_UNIX") else "none"
+    if backend == "postgres":
+        return PostgresBus(url)
+    if backend == "local":
+        return LocalSocketBus()
+    if backend == "none":
+        return InvalidationBus()
+    raise ValueError(f"Unknown INVALIDATION_BACKEND: {backend}")
+
+
+invalidation_bus = create_bus()
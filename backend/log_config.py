@@ -0,0 +1,118 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Fraction of successful requests that get an access log line. Per-route
+# overrides are path prefixes, e.g. LOG_SAMPLE_RATES="/catalog/=0.05,/static/=0".
+# Server errors are always logged.
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+
+def _parse_sample_rates(raw: str) -> list[tuple[str, float]]:
+    rates = []
+    for part in raw.split(","):
+        prefix, _, rate = part.partition("=")
+        if prefix.strip() and rate.strip():
+            rates.append((prefix.strip(), float(rate)))
+    # Longest prefix wins
+    return sorted(rates, key=lambda r: len(r[0]), reverse=True)
+
+
+LOG_SAMPLE_RATES = _parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+access_logger = logging.getLogger("access")
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. Structured fields are passed as extra={"fields": {...}}.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without ever blocking the event loop.
+    When the queue is full the record is dropped and counted.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def configure_logging():
+    """
+    Route all logging through a bounded queue to a background thread that writes
+    JSON lines to stdout. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [DroppingQueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    # uvicorn's access log duplicates the structured request log, and httpx
+    # logs every outbound call at INFO
+    logging.getLogger("uvicorn.access").disabled = True
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def sample_rate(path: str) -> float:
+    for prefix, rate in LOG_SAMPLE_RATES:
+        if path.startswith(prefix):
+            return rate
+    return LOG_SAMPLE_RATE
+
+
+def log_request(method: str, path: str, route: str | None, status: int, duration: float, **fields):
+    if status < 500:
+        rate = sample_rate(path)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return
+    access_logger.log(
+        logging.ERROR if status >= 500 else logging.INFO,
+        "request",
+        extra={"fields": {
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": status,
+            "duration_ms": round(duration * 1000, 2),
+            **fields,
+        }},
+    )
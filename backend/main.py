@@ -1,19 +1,22 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import case, insert, update
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.orm import selectinload, load_only, lazyload
 from typing import Annotated, List
-from datetime import timedelta
+from datetime import date, timedelta
 import contextlib
+import logging
 import shutil
 import os
+import time
 import uuid
 
-from database import get_db, engine, Base, SessionLocal
-from models import User, Brand, StoreLocation, Category, Product, Order, OrderItem, Wishlist, SiteSetting
+from database import READ_PRIMARY_UNTIL_HEADER, get_db, get_read_db, pin_to_primary, replicas, engine, Base, SessionLocal, create_missing_indexes, pool_report
+from models import User, Brand, StoreLocation, Category, Product, Order, OrderItem, Wishlist
 from schemas import (
     UserCreate, UserResponse, Token, UserPasswordUpdate, UserUpdate, UserLogin,
     CategoryCreate, CategoryResponse,
@@ -21,24 +24,67 @@ from schemas import (
     BrandCreate, BrandResponse, StoreLocationCreate, StoreLocationResponse, ProductResponseFull,
     SiteSettingCreate, SiteSettingResponse,
     PasswordResetRequest, PasswordResetConfirm,
-    WishlistResponse, WishlistCreate,
-    OrderCreate, OrderResponse
+    WishlistResponse, WishlistCreate, WishlistBatch, WishlistBatchResult,
+    OrderCreate, OrderResponse,
+    CatalogFacets, SalesRow
+)
+from auth import (
+    get_password_hash, get_password_hash_async, verify_password_async, create_access_token, get_current_active_user,
+    token_claims, user_cache, ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from auth import get_password_hash, verify_password, create_access_token, get_current_active_user, ACCESS_TOKEN_EXPIRE_MINUTES
 from facebook_capi import fb_capi
-import asyncio
+from services.facebook_post import facebook_service
+from services.facebook_capi import CAPI_BATCH_MAX_EVENTS, CAPI_MAX_IN_FLIGHT
+from services.graph import graph_client, close_graph_client
+from services.images import shutdown_pool as shutdown_image_pool
+from services.storage import StorageService, UPLOAD_MAX_BYTES, too_large, upload_slot
+from outbox import OutboxWorker, enqueue, outbox_stats, retry_dead
+from log_config import configure_logging, log_request
+import metrics
+from analytics import record_order, sales_report
+from order_export import export_query, csv_chunks, ndjson_chunks, MEDIA_TYPES
+from pagination import paginate, set_next_cursor, NEXT_CURSOR_HEADER
+from cache import catalog_cache
+from http_cache import conditional_get, content_etag, load_tagged
+from static_files import CachedStaticFiles
+from site_settings import settings_store
+from invalidation import invalidation_bus
+import wishlist
+import fast_json
+from fast_json import FastJSONResponse, to_dict, fast_response
+from search import search_index
+from facets import catalog_conditions, all_conditions, facet_counts
+
+configure_logging()
+logger = logging.getLogger("api")
+metrics.instrument_engine(engine)
+for replica in replicas.replicas:
+    metrics.instrument_engine(replica.engine)
+
+# Outbound calls to Facebook are queued in the outbox table and sent from here
+outbox_worker = OutboxWorker(SessionLocal)
+# CAPI events go out a batch per request, at most CAPI_MAX_IN_FLIGHT requests at a time
+outbox_worker.register(
+    "facebook_capi", fb_capi.deliver_batch, concurrency=CAPI_MAX_IN_FLIGHT, batch_size=CAPI_BATCH_MAX_EVENTS
+)
+outbox_worker.register("facebook_post", facebook_service.deliver, concurrency=1)
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
+    logger.info("Database pool configured", extra={"fields": pool_report(engine)})
+    for replica in replicas.replicas:
+        logger.info("Read replica configured", extra={"fields": {**pool_report(replica.engine), "selection": replicas.selection}})
+
     # Startup: create tables
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_missing_indexes)
     
     # Check for admin
     async with SessionLocal() as db:
         result = await db.execute(select(User).limit(1))
         if not result.scalars().first():
-            print("🌱 No users found. Creating default admin...")
+            logger.info("No users found, creating default admin")
             admin = User(
                 username="admin", 
                 hashed_password=get_password_hash("admin1234"), 
@@ -48,17 +94,35 @@ async def lifespan(app: FastAPI):
             )
             db.add(admin)
             await db.commit()
-            print("✅ Default admin created: admin / admin1234")
-            
-    yield
+            logger.info("Default admin created", extra={"fields": {"username": "admin"}})
 
-app = FastAPI(title="POS & Admin API", version="1.0.0", lifespan=lifespan)
+        # Catch the search index up with products written outside the API (seeding, restores)
+        if await search_index.rebuild_if_stale(db):
+            logger.info("Product search index rebuilt")
+
+    # Keeps the caches of every worker in step with writes made by the others
+    await invalidation_bus.start()
+    logger.info("Cache invalidation bus started", extra={"fields": {"backend": invalidation_bus.name}})
+
+    # One keep-alive client for every Graph API call
+    graph_client()
+    outbox_worker.start()
+    yield
+    await outbox_worker.stop()
+    await invalidation_bus.stop()
+    await close_graph_client()
+    shutdown_image_pool()
+
+app = FastAPI(
+    title="POS & Admin API", version="1.0.0", lifespan=lifespan,
+    default_response_class=FastJSONResponse if fast_json.FAST_JSON else JSONResponse,
+)
 
 # Mount static files for uploads
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-app.mount("/static", StaticFiles(directory=UPLOAD_DIR), name="static")
+app.mount("/static", CachedStaticFiles(directory=UPLOAD_DIR), name="static")
 
 # CORS configuration
 origins = [
@@ -80,52 +144,88 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, READ_PRIMARY_UNTIL_HEADER],
     allow_origin_regex="https?://.*\.onrender\.com", # Allow any onrender subdomains
 )
 
+# Room for the multipart boundaries and headers around the file itself
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
 @app.middleware("http")
-async def log_requests(request: Request, call_next):
-    origin = request.headers.get("origin")
-    print(f"DEBUG: Incoming {request.method} {request.url} from origin: {origin}")
-    response = await call_next(request)
-    return response
+async def guard_uploads(request: Request, call_next):
+    # Runs before the multipart body is read, so oversized or surplus uploads
+    # are turned away without receiving them
+    if request.method != "POST" or request.url.path != "/upload/":
+        return await call_next(request)
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD:
+        error = too_large()
+        return JSONResponse({"detail": error.detail}, status_code=error.status_code)
+    try:
+        with upload_slot():
+            return await call_next(request)
+    except HTTPException as error:
+        return JSONResponse({"detail": error.detail}, status_code=error.status_code, headers=error.headers)
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    # Access log and metrics share one middleware and one timing
+    start = time.perf_counter()
+    query_counter = metrics.start_request()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        pin_to_primary(request, response)
+        return response
+    finally:
+        duration = time.perf_counter() - start
+        route = getattr(request.scope.get("route"), "path", None)
+        metrics.finish_request(request.method, route, status_code, duration, query_counter)
+        log_request(
+            request.method,
+            request.url.path,
+            route,
+            status_code,
+            duration,
+            queries=query_counter[0],
+            origin=request.headers.get("origin"),
+        )
 
-from services.storage import StorageService
 
 @app.post("/upload/")
-async def upload_image(request: Request, file: UploadFile = File(...)):
-    url = await StorageService.upload_file(file, str(request.base_url))
-    return {"url": url}
+async def upload_image(request: Request, file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+    # Manifest of the generated variants; "url" is still the image to store on the product
+    return await StorageService.upload_file(file, str(request.base_url), db)
 
 @app.post("/token", response_model=Token)
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     db: AsyncSession = Depends(get_db)
 ):
-    print(f"DEBUG LOGIN: Attempt for username='{form_data.username}'")
     result = await db.execute(select(User).where(User.username == form_data.username))
     user = result.scalars().first()
     
     if not user:
-        print(f"DEBUG LOGIN: User '{form_data.username}' NOT FOUND")
+        logger.info("Login failed", extra={"fields": {"username": form_data.username, "reason": "unknown_user"}})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
         
-    if not verify_password(form_data.password, user.hashed_password):
-        print(f"DEBUG LOGIN: Password mismatch for user '{form_data.username}'")
+    if not await verify_password_async(form_data.password, user.hashed_password):
+        logger.info("Login failed", extra={"fields": {"username": form_data.username, "reason": "bad_password"}})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
         
-    print(f"DEBUG LOGIN: Success for user '{form_data.username}'")
+    logger.info("Login succeeded", extra={"fields": {"username": user.username}})
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -134,7 +234,7 @@ async def verify_user_password(
     body: UserPasswordUpdate, 
     current_user: User = Depends(get_current_active_user)
 ):
-    if not verify_password(body.password, current_user.hashed_password):
+    if not await verify_password_async(body.password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect password")
     return {"message": "Password verified"}
 
@@ -144,23 +244,21 @@ async def verify_super_credentials(
     db: AsyncSession = Depends(get_db)
 ):
     # Check if user exists
-    print(f"DEBUG LOGIN ATTEMPT: username='{body.username}'")
     result = await db.execute(select(User).where(User.username == body.username))
     user = result.scalars().first()
     
     if not user:
-        print("DEBUG FAILURE: User not found")
+        logger.info("Super credential check failed", extra={"fields": {"username": body.username, "reason": "unknown_user"}})
         raise HTTPException(status_code=400, detail="Invalid credentials")
     
-    if not verify_password(body.password, user.hashed_password):
-        print("DEBUG FAILURE: Password verification failed")
+    if not await verify_password_async(body.password, user.hashed_password):
+        logger.info("Super credential check failed", extra={"fields": {"username": body.username, "reason": "bad_password"}})
         raise HTTPException(status_code=400, detail="Invalid credentials")
         
     if not user.is_super_admin:
-        print(f"DEBUG FAILURE: User {user.username} is not super admin")
+        logger.info("Super credential check failed", extra={"fields": {"username": body.username, "reason": "not_super_admin"}})
         raise HTTPException(status_code=403, detail="User is not a Super Admin")
         
-    print("DEBUG SUCCESS: Verified!")
     return {"message": "Verified", "is_super_admin": True}
 
 @app.post("/users/", response_model=UserResponse)
@@ -179,7 +277,7 @@ async def create_user(
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     
-    hashed_pwd = get_password_hash(user.password)
+    hashed_pwd = await get_password_hash_async(user.password)
     db_user = User(
         username=user.username, 
         hashed_password=hashed_pwd, 
@@ -235,6 +333,7 @@ async def update_user(
         setattr(db_user, key, value)
     
     await db.commit()
+    user_cache.invalidate("users")
     await db.refresh(db_user)
     return db_user
 
@@ -265,8 +364,9 @@ async def update_user_password(
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
         
-    db_user.hashed_password = get_password_hash(password_update.password)
+    db_user.hashed_password = await get_password_hash_async(password_update.password)
     await db.commit()
+    user_cache.invalidate("users")
     await db.refresh(db_user)
     return db_user
 
@@ -292,6 +392,7 @@ async def delete_user(
         
     await db.delete(db_user)
     await db.commit()
+    user_cache.invalidate("users")
     return {"message": "User deleted successfully"}
 
 # --- Password Recovery ---
@@ -328,7 +429,7 @@ async def forgot_password(
     await db.commit()
     
     # In a real app, send email/SMS here
-    print(f"DEBUG: Password reset code for {request.email}: {code}")
+    logger.info("Password reset code issued", extra={"fields": {"email": request.email, "code": code}})
     
     return {"message": "If the email exists, a code has been sent."}
 
@@ -350,11 +451,12 @@ async def reset_password(
         raise HTTPException(status_code=400, detail="Code expired")
         
     # Reset password
-    user.hashed_password = get_password_hash(request.new_password)
+    user.hashed_password = await get_password_hash_async(request.new_password)
     user.reset_token = None
     user.reset_token_expiry = None
     
     await db.commit()
+    user_cache.invalidate("users")
     return {"message": "Password updated successfully"}
 
 @app.get("/")
@@ -374,12 +476,15 @@ async def create_category(category: CategoryCreate, db: AsyncSession = Depends(g
     except Exception:
         await db.rollback()
         raise HTTPException(status_code=400, detail="Category already exists")
+    catalog_cache.invalidate("categories")
     return db_category
 
 @app.get("/categories/", response_model=List[CategoryResponse])
 async def read_categories(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Category).offset(skip).limit(limit))
-    return result.scalars().all()
+    async def load():
+        result = await db.execute(select(Category).offset(skip).limit(limit))
+        return [CategoryResponse.model_validate(c) for c in result.scalars().all()]
+    return await catalog_cache.get_or_load(("categories", skip, limit), ("categories",), load)
 
 @app.delete("/categories/{category_id}")
 async def delete_category(category_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_active_user)):
@@ -388,19 +493,30 @@ async def delete_category(category_id: int, db: AsyncSession = Depends(get_db),
     if not db_category:
         raise HTTPException(status_code=404, detail="Category not found")
     
+    # Products of this category are re-indexed without the category name
+    result = await db.execute(select(Product.id).where(Product.category_id == category_id))
+    affected_ids = result.scalars().all()
+
     await db.delete(db_category)
+    await db.flush()
+    await search_index.index_products(db, affected_ids)
     await db.commit()
+    catalog_cache.invalidate("categories", "products")
     return {"message": "Category deleted successfully"}
 
 # --- Products ---
 
-from services.facebook_post import facebook_service
-
 @app.post("/products/", response_model=ProductResponse)
 async def create_product(product: ProductCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_active_user)):
     db_product = Product(**product.model_dump())
     db.add(db_product)
+    await db.flush()
+    await search_index.index_product(db, db_product.id)
+    # Facebook Auto-Post goes out through the outbox once this commits
+    if facebook_service.enabled:
+        enqueue(db, "facebook_post", facebook_service.build_post(db_product))
     await db.commit()
+    outbox_worker.notify()
     await db.refresh(db_product)
     
     # Re-fetch with eager loading for response
@@ -411,9 +527,7 @@ async def create_product(product: ProductCreate, db: AsyncSession = Depends(get_
         .where(Product.id == db_product.id)
     )
     fetched_product = result.scalars().first()
-    
-    # Trigger Facebook Auto-Post (Async)
-    asyncio.create_task(facebook_service.post_product(fetched_product))
+    catalog_cache.invalidate("products")
     
     return fetched_product
 
@@ -428,7 +542,10 @@ async def update_product(product_id: int, product_update: ProductUpdate, db: Asy
     for key, value in update_data.items():
         setattr(db_product, key, value)
     
+    await db.flush()
+    await search_index.index_product(db, product_id)
     await db.commit()
+    catalog_cache.invalidate("products")
     
     # Re-fetch with eager loading
     result = await db.execute(
@@ -456,17 +573,30 @@ async def delete_product(product_id: int, db: AsyncSession = Depends(get_db), cu
         )
 
     await db.delete(db_product)
+    await search_index.remove_products(db, [product_id])
     await db.commit()
+    catalog_cache.invalidate("products")
     return {"message": "Product deleted successfully"}
 
 @app.get("/products/", response_model=List[ProductResponse])
-async def read_products(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    # Perform a join so we can access category data if needed
-    result = await db.execute(select(Product).offset(skip).limit(limit))
-    return result.scalars().all()
+async def read_products(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Keyset pagination on id; skip/limit still works when no cursor is sent
+    keys = [Product.id]
+    result = await db.execute(paginate(select(Product), keys, cursor, skip, limit))
+    products = result.scalars().all()
+    set_next_cursor(response, products, keys, limit)
+    if fast_json.FAST_JSON:
+        return fast_response([to_dict(ProductResponse, p) for p in products], response)
+    return products
 
 @app.get("/products/{product_id}", response_model=ProductResponse)
-async def read_product(product_id: int, db: AsyncSession = Depends(get_db)):
+async def read_product(product_id: int, db: AsyncSession = Depends(get_read_db)):
     result = await db.execute(
         select(Product)
         .options(selectinload(Product.category))
@@ -479,8 +609,10 @@ async def read_product(product_id: int, db: AsyncSession = Depends(get_db)):
 
 @app.get("/orders/", response_model=List[OrderResponse])
 async def read_orders(
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
+    cursor: str | None = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -490,8 +622,33 @@ async def read_orders(
     if not current_user.is_admin:
         query = query.where(Order.user_id == current_user.id)
         
-    result = await db.execute(query.offset(skip).limit(limit))
-    return result.scalars().all()
+    keys = [Order.created_at, Order.id]
+    result = await db.execute(paginate(query, keys, cursor, skip, limit))
+    orders = result.scalars().all()
+    set_next_cursor(response, orders, keys, limit)
+    if fast_json.FAST_JSON:
+        return fast_response([to_dict(OrderResponse, o) for o in orders], response)
+    return orders
+
+@app.get("/orders/export")
+async def export_orders(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    status: str | None = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    query = export_query(created_from, created_to, status)
+    chunks = csv_chunks(db, query) if format == "csv" else ndjson_chunks(db, query)
+    filename = f"orders-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 # --- Orders / POS ---
 
@@ -502,6 +659,7 @@ async def create_order(
     db: AsyncSession = Depends(get_db)
 ):
     # Try to get user from token if present
+    user = None
     user_id = None
     auth_header = request.headers.get('Authorization')
     if auth_header and auth_header.startswith("Bearer "):
@@ -515,14 +673,66 @@ async def create_order(
                  user_id = user.id
 
     # 1. Validate products and calculate total
-    # 1. Validate products and calculate total
-    total_amount = 0.0
+    # Repeated lines for the same product are merged so stock is checked once per product
+    quantities = {}
+    for item in order.items:
+        if item.quantity < 1:
+            raise HTTPException(status_code=400, detail=f"Invalid quantity for product {item.product_id}")
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    if not quantities:
+        raise HTTPException(status_code=400, detail="Order has no items")
+
+    # Every referenced product in a single query
+    result = await db.execute(
+        select(Product.id, Product.name, Product.price, Product.category_id, Product.brand_id)
+        .where(Product.id.in_(quantities))
+    )
+    products = {row.id: row for row in result}
+    for product_id in quantities:
+        if product_id not in products:
+            raise HTTPException(status_code=404, detail=f"Product {product_id} not found")
+
+    total_amount = sum(products[pid].price * qty for pid, qty in quantities.items())
     
-    # Create order with customer details
+    # 2. Deduct stock for all products in one conditional UPDATE. The stock check
+    # happens in the database, so concurrent checkouts cannot oversell: a product
+    # without enough stock left simply does not match and the row count falls short.
+    requested = case(quantities, value=Product.id)
+    result = await db.execute(
+        update(Product)
+        .where(Product.id.in_(quantities), Product.stock >= requested)
+        .values(stock=Product.stock - requested)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(quantities):
+        await db.rollback()
+        result = await db.execute(select(Product.id, Product.stock).where(Product.id.in_(quantities)))
+        available = dict(result.all())
+        shortages = [
+            {
+                "product_id": pid,
+                "name": products[pid].name,
+                "requested": qty,
+                "available": max(available.get(pid) or 0, 0),
+            }
+            for pid, qty in quantities.items()
+            if (available.get(pid) or 0) < qty
+        ]
+        logger.info("Order rejected for stock", extra={"fields": {"items": shortages}})
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "message": "Not enough stock for " + ", ".join(s["name"] for s in shortages),
+                "items": shortages,
+            },
+        )
+
+    # 3. Create order with customer details
     db_order = Order(
         status="pending", # Default to pending for COD
         user_id=user_id,
         payment_method="cod",
+        total_amount=total_amount,
         customer_email=order.email,
         customer_first_name=order.firstName,
         customer_last_name=order.lastName,
@@ -534,38 +744,57 @@ async def create_order(
     db.add(db_order)
     await db.flush() # get ID
 
-    for item in order.items:
-        result = await db.execute(select(Product).where(Product.id == item.product_id))
-        product = result.scalars().first()
-        if not product:
-            await db.rollback()
-            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-        
-        if product.stock < item.quantity:
-            await db.rollback()
-            raise HTTPException(status_code=400, detail=f"Not enough stock for {product.name}")
-        
-        # Deduct stock
-        product.stock -= item.quantity
-        
-        # Add order item
-        line_total = product.price * item.quantity
-        total_amount += line_total
-        
-        db_item = OrderItem(
-            order_id=db_order.id,
-            product_id=product.id,
-            quantity=item.quantity,
-            price_at_time=product.price
-        )
-        db.add(db_item)
+    # 4. All order items in one bulk INSERT
+    await db.execute(
+        insert(OrderItem),
+        [
+            {
+                "order_id": db_order.id,
+                "product_id": pid,
+                "quantity": qty,
+                "price_at_time": products[pid].price,
+            }
+            for pid, qty in quantities.items()
+        ]
+    )
+    
 
-    db_order.total_amount = total_amount
+    # 5. Daily sales rollups, committed with the order
+    await record_order(db, db_order.created_at.date(), total_amount, [
+        (pid, products[pid].category_id, products[pid].brand_id, qty, products[pid].price)
+        for pid, qty in quantities.items()
+    ])
     
     # Cache ID to prevent MissingGreenlet on re-access after commit
     order_id = db_order.id
+
+    # 6. Meta CAPI Purchase event, delivered by the outbox worker after commit
+    if fb_capi.enabled:
+        user_data = {
+            "em": [order.email],
+            "fn": [order.firstName],
+            "ln": [order.lastName],
+            "ct": [order.city],
+            "country": [order.country],
+            "zp": [order.zip],
+        }
+        if user and user.phone_number:
+            user_data["ph"] = [user.phone_number]
+        enqueue(db, "facebook_capi", fb_capi.build_event("Purchase", {
+            "currency": "AED",
+            "value": total_amount,
+            "order_id": str(order_id),
+            "content_ids": [str(pid) for pid in quantities],
+            "content_type": "product"
+        }, user_data))
     
     await db.commit()
+    outbox_worker.notify()
+    # Stock levels changed
+    catalog_cache.invalidate("products")
+    logger.info("Order created", extra={"fields": {
+        "order_id": order_id, "user_id": user_id, "total": total_amount, "lines": len(quantities)
+    }})
     
     # Re-fetch order with items eagerly loaded to satisfy Pydantic schema
     # preventing MissingGreenlet error
@@ -576,67 +805,42 @@ async def create_order(
     )
     return result.scalars().first()
 
-    # --- Trigger Meta CAPI (Async) ---
-    try:
-        # Determine user data for matching
-        user_c_data = {}
-        if user:
-            user_c_data = {
-                "em": [user.email] if user.email else [],
-                "ph": [user.phone_number] if user.phone_number else [],
-                "fn": [user.first_name] if user.first_name else [],
-                "ln": [user.last_name] if user.last_name else [],
-            }
-        
-        event_data = {
-            "currency": "AED", 
-            "value": total_amount,
-            "order_id": str(order_id),
-            "content_ids": [str(i.product_id) for i in order.items],
-            "content_type": "product"
-        }
-        
-        # Fire and forget (schedule as background task)
-        # In a real production app, use BackgroundTasks or Celery
-        asyncio.create_task(fb_capi.send_event("Purchase", event_data, user_c_data))
-    except Exception as e:
-        print(f"Failed to trigger CAPI: {e}")
-
 
 # --- Brands ---
 
 @app.get("/brands/", response_model=List[BrandResponse])
-async def read_brands(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Brand))
-    return result.scalars().all()
+async def read_brands(request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
+    async def load():
+        result = await db.execute(select(Brand))
+        return [BrandResponse.model_validate(b) for b in result.scalars().all()]
+    brands, etag = await load_tagged(catalog_cache, ("brands",), ("brands",), load)
+    return conditional_get(request, response, "brands", ("brands",), etag) or brands
 
 # --- Site Settings (CMS) ---
+# Read from the primary: the snapshot is kept for the whole process, and a
+# miss is rare enough that sending it to a replica saves nothing
 
 @app.get("/settings/", response_model=List[SiteSettingResponse])
-async def read_settings(db: AsyncSession = Depends(get_db)):
-    # from models import SiteSetting # Already imported
-    result = await db.execute(select(SiteSetting))
-    return result.scalars().all()
+async def read_settings(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    snapshot = await settings_store.get(db)
+    return conditional_get(request, response, "settings", ("settings",), snapshot.etag) or snapshot.items
+
+@app.get("/settings/{key}", response_model=SiteSettingResponse)
+async def read_setting(key: str, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    snapshot = await settings_store.get(db)
+    not_modified = conditional_get(request, response, "settings", ("settings",), snapshot.etag)
+    if not_modified:
+        return not_modified
+    value = snapshot.values.get(key)
+    if value is None:
+        raise HTTPException(status_code=404, detail="Setting not found")
+    return {"key": key, "value": value}
 
 @app.put("/settings/", response_model=List[SiteSettingResponse])
 async def update_settings(settings: List[SiteSettingCreate], db: AsyncSession = Depends(get_db)):
-    # from models import SiteSetting
-    
-    # Upsert logic
-    for setting in settings:
-        result = await db.execute(select(SiteSetting).where(SiteSetting.key == setting.key))
-        db_setting = result.scalars().first()
-        if db_setting:
-            db_setting.value = setting.value
-        else:
-            new_setting = SiteSetting(key=setting.key, value=setting.value)
-            db.add(new_setting)
-    
-    await db.commit()
-    
-    # Return all settings
-    result = await db.execute(select(SiteSetting))
-    return result.scalars().all()
+    # Later entries win when a key is repeated
+    snapshot = await settings_store.update(db, {s.key: s.value for s in settings})
+    return snapshot.items
 
 @app.post("/brands/", response_model=BrandResponse)
 async def create_brand(brand: BrandResponse, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_active_user)):
@@ -644,6 +848,7 @@ async def create_brand(brand: BrandResponse, db: AsyncSession = Depends(get_db),
     db.add(db_brand)
     await db.commit()
     await db.refresh(db_brand)
+    catalog_cache.invalidate("brands")
     return db_brand
 
 @app.delete("/brands/{brand_id}")
@@ -653,16 +858,25 @@ async def delete_brand(brand_id: int, db: AsyncSession = Depends(get_db), curren
     if not db_brand:
         raise HTTPException(status_code=404, detail="Brand not found")
     
+    # Products of this brand are re-indexed without the brand name
+    result = await db.execute(select(Product.id).where(Product.brand_id == brand_id))
+    affected_ids = result.scalars().all()
+
     await db.delete(db_brand)
+    await db.flush()
+    await search_index.index_products(db, affected_ids)
     await db.commit()
+    catalog_cache.invalidate("brands", "products")
     return {"message": "Brand deleted successfully"}
 
 # --- Store Locations ---
 
 @app.get("/stores/", response_model=List[StoreLocationResponse])
-async def read_stores(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(StoreLocation))
-    return result.scalars().all()
+async def read_stores(db: AsyncSession = Depends(get_read_db)):
+    async def load():
+        result = await db.execute(select(StoreLocation))
+        return [StoreLocationResponse.model_validate(s) for s in result.scalars().all()]
+    return await catalog_cache.get_or_load(("stores",), ("stores",), load)
 
 @app.post("/stores/", response_model=StoreLocationResponse)
 async def create_store(store: StoreLocationCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_active_user)):
@@ -670,6 +884,7 @@ async def create_store(store: StoreLocationCreate, db: AsyncSession = Depends(ge
     db.add(db_store)
     await db.commit()
     await db.refresh(db_store)
+    catalog_cache.invalidate("stores")
     return db_store
 
 @app.delete("/stores/{store_id}")
@@ -681,46 +896,253 @@ async def delete_store(store_id: int, db: AsyncSession = Depends(get_db), curren
     
     await db.delete(db_store)
     await db.commit()
+    catalog_cache.invalidate("stores")
     return {"message": "Store deleted successfully"}
 
 # --- Enhanced Products with Brand (for Catalog) ---
 
+# Tables a catalog response is built from
+CATALOG_TABLES = ("products", "brands", "categories")
+
+def catalog_filters(
+    category_id: List[int] = Query(default=[]),
+    brand_id: List[int] = Query(default=[]),
+    min_price: float | None = None,
+    max_price: float | None = None,
+    in_stock: bool | None = None,
+):
+    """
+    Shared catalog filters. Returns a cache key for the filter set and the
+    WHERE clauses keyed by facet.
+    """
+    key = (tuple(sorted(category_id)), tuple(sorted(brand_id)), min_price, max_price, in_stock)
+    return key, catalog_conditions(category_id, brand_id, min_price, max_price, in_stock)
+
+def catalog_fields(
+    fields: str | None = Query(
+        None, description="Comma separated product fields to return, e.g. name,price,image_url,brand; id is always included"
+    ),
+):
+    """
+    Sparse fieldset for catalog listings: None for the full product.
+    """
+    if fields is None:
+        return None
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - ProductResponseFull.model_fields.keys()
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return frozenset(requested | {"id"})
+
+def product_load_options(fields: frozenset | None) -> list:
+    """
+    Loader options selecting only the columns behind `fields`, and loading
+    brand and category only when asked for.
+    """
+    if fields is None:
+        return [selectinload(Product.brand), selectinload(Product.category)]
+    relations = {"brand": (Product.brand, Product.brand_id), "category": (Product.category, Product.category_id)}
+    columns = {getattr(Product, f) for f in fields if f not in relations}
+    options = []
+    for name, (relation, foreign_key) in relations.items():
+        if name in fields:
+            # The related rows are looked up by the foreign key, so it is loaded too
+            columns.add(foreign_key)
+            options.append(selectinload(relation))
+        else:
+            options.append(lazyload(relation))
+    return [load_only(*columns), *options]
+
+def catalog_item(product: Product, fields: frozenset | None):
+    if fields is None:
+        return fast_json.build(ProductResponseFull, product)
+    return to_dict(ProductResponseFull, product, fields)
+
+async def load_facets(db: AsyncSession, filters: tuple) -> tuple:
+    filter_key, conditions = filters
+
+    async def load():
+        return await facet_counts(db, conditions)
+
+    return await load_tagged(catalog_cache, ("facets", filter_key), CATALOG_TABLES, load)
+
 @app.get("/catalog/", response_model=List[ProductResponseFull])
-async def read_catalog(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+async def read_catalog(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    filters: tuple = Depends(catalog_filters),
+    fields: frozenset | None = Depends(catalog_fields),
+    include_facets: bool = Query(
+        False, description='Return {"items": [...], "facets": {...}} with the counts of GET /catalog/facets'
+    ),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Products matching the filters. The list stays the default body so existing
+    clients are unaffected; with include_facets=true the page and the sidebar
+    counts come back together in one round trip.
+    """
     # Eager load brand and category for rich responses
-    result = await db.execute(
-        select(Product)
-        .options(selectinload(Product.brand), selectinload(Product.category))
-        .offset(skip)
-        .limit(limit)
-    )
-    return result.scalars().all()
+    keys = [Product.id]
+    filter_key, conditions = filters
+
+    async def load():
+        query = (
+            select(Product)
+            .where(*all_conditions(conditions))
+            .options(*product_load_options(fields))
+        )
+        result = await db.execute(paginate(query, keys, cursor, skip, limit))
+        return [catalog_item(p, fields) for p in result.scalars().all()]
+
+    cache_key = ("catalog", skip, limit, cursor, filter_key, fields)
+    products, etag = await load_tagged(catalog_cache, cache_key, CATALOG_TABLES, load)
+    if include_facets:
+        facets, facets_etag = await load_facets(db, filters)
+        etag = content_etag([etag, facets_etag])
+    not_modified = conditional_get(request, response, "catalog", CATALOG_TABLES, etag)
+    if not_modified:
+        return not_modified
+    set_next_cursor(response, products, keys, limit)
+    if include_facets:
+        return fast_response({"items": products, "facets": facets}, response)
+    # Partial products do not fit the response model, so they skip it
+    if fast_json.FAST_JSON or fields is not None:
+        return fast_response(products, response)
+    return products
+
+@app.get("/catalog/facets", response_model=CatalogFacets)
+async def read_catalog_facets(
+    request: Request,
+    response: Response,
+    filters: tuple = Depends(catalog_filters),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Sidebar counts alone, for clients that fetch them separately from the page.
+    """
+    facets, etag = await load_facets(db, filters)
+    return conditional_get(request, response, "catalog", CATALOG_TABLES, etag) or facets
+
+@app.get("/catalog/search", response_model=List[ProductResponseFull])
+async def search_catalog(
+    q: str,
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 20,
+    fields: frozenset | None = Depends(catalog_fields),
+    db: AsyncSession = Depends(get_read_db)
+):
+    async def load():
+        product_ids = await search_index.search(db, q, skip, limit)
+        if not product_ids:
+            return []
+        result = await db.execute(
+            select(Product)
+            .where(Product.id.in_(product_ids))
+            .options(*product_load_options(fields))
+        )
+        # Keep the ranking order of the index
+        by_id = {p.id: p for p in result.scalars().all()}
+        return [catalog_item(by_id[pid], fields) for pid in product_ids if pid in by_id]
+
+    cache_key = ("search", q.strip().lower(), skip, limit, fields)
+    products, etag = await load_tagged(catalog_cache, cache_key, CATALOG_TABLES, load)
+    not_modified = conditional_get(request, response, "catalog", CATALOG_TABLES, etag)
+    if not_modified:
+        return not_modified
+    if fast_json.FAST_JSON or fields is not None:
+        return fast_response(products, response)
+    return products
 
 @app.get("/catalog/{product_id}", response_model=ProductResponseFull)
-async def read_catalog_product(product_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(
-        select(Product)
-        .where(Product.id == product_id)
-        .options(selectinload(Product.brand), selectinload(Product.category))
-    )
-    product = result.scalars().first()
+async def read_catalog_product(product_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
+    async def load():
+        result = await db.execute(
+            select(Product)
+            .where(Product.id == product_id)
+            .options(selectinload(Product.brand), selectinload(Product.category))
+        )
+        product = result.scalars().first()
+        return ProductResponseFull.model_validate(product) if product else None
+
+    product, etag = await load_tagged(catalog_cache, ("catalog_product", product_id), CATALOG_TABLES, load)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return conditional_get(request, response, "catalog", CATALOG_TABLES, etag) or product
+
+def _cache_metrics():
+    caches = {"catalog": catalog_cache, "users": user_cache}
+    yield "cache_hits_total", "counter", "Read cache hits", [({"cache": n}, c.hits) for n, c in caches.items()]
+    yield "cache_misses_total", "counter", "Read cache misses", [({"cache": n}, c.misses) for n, c in caches.items()]
+    yield "cache_entries", "gauge", "Entries held by the read cache", [({"cache": n}, c.stats()["entries"]) for n, c in caches.items()]
+    yield "cache_invalidations_received_total", "counter", "Table invalidations applied from other processes", [({}, invalidation_bus.received)]
+
+metrics.registry.add_collector(_cache_metrics)
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics(request: Request):
+    if metrics.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authorized")
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/analytics/sales", response_model=List[SalesRow])
+async def read_sales_analytics(
+    group_by: str = Query("day", pattern="^(day|product|category|brand)$"),
+    date_from: date | None = None,
+    date_to: date | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return await sales_report(db, group_by, date_from, date_to, limit)
+
+@app.get("/outbox/stats")
+async def read_outbox_stats(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return await outbox_stats(db)
+
+@app.post("/outbox/retry")
+async def retry_outbox_events(event_id: int | None = None, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    """
+    Requeue dead-lettered events (all of them, or just event_id)
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    requeued = await retry_dead(db, event_id)
+    outbox_worker.notify()
+    return {"requeued": requeued}
+
+@app.get("/cache/stats")
+async def read_cache_stats(current_user: User = Depends(get_current_active_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {"catalog": catalog_cache.stats()}
 
 # --- Wishlist ---
 
-@app.get("/wishlist/", response_model=List[WishlistResponse])
-async def read_wishlist(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+@app.get("/wishlist/", response_model=List[WishlistResponse] | List[int])
+async def read_wishlist(
+    fields: str | None = Query(None, pattern="^ids$", description="'ids' returns only the product ids"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    if fields == "ids":
+        return await wishlist.product_ids(db, current_user.id)
     result = await db.execute(
-        select(Wishlist)
-        .where(Wishlist.user_id == current_user.id)
-        .options(
-            joinedload(Wishlist.product).joinedload(Product.category),
-            joinedload(Wishlist.product).joinedload(Product.brand)
-        )
+        wishlist.wishlist_query().where(Wishlist.user_id == current_user.id).order_by(Wishlist.id)
     )
-    return result.scalars().all()
+    items = result.scalars().all()
+    if fast_json.FAST_JSON:
+        return FastJSONResponse([to_dict(WishlistResponse, item) for item in items])
+    return items
 
 @app.post("/wishlist/", response_model=WishlistResponse)
 async def add_to_wishlist(
@@ -728,30 +1150,37 @@ async def add_to_wishlist(
     db: AsyncSession = Depends(get_db), 
     current_user: User = Depends(get_current_active_user)
 ):
-    # Check if already exists
-    result = await db.execute(
-        select(Wishlist)
-        .where(Wishlist.user_id == current_user.id)
-        .where(Wishlist.product_id == item.product_id)
-    )
-    if result.scalars().first():
+    wishlist_id = await wishlist.add_product(db, current_user.id, item.product_id)
+    if wishlist_id is None:
+        if not await wishlist.product_exists(db, item.product_id):
+            raise HTTPException(status_code=404, detail="Product not found")
         raise HTTPException(status_code=400, detail="Product already in wishlist")
-
-    db_wishlist = Wishlist(user_id=current_user.id, product_id=item.product_id)
-    db.add(db_wishlist)
     await db.commit()
-    
-    # Refresh to get product relationship
-    result = await db.execute(
-        select(Wishlist)
-        .where(Wishlist.id == db_wishlist.id)
-        .options(
-            joinedload(Wishlist.product).joinedload(Product.category),
-            joinedload(Wishlist.product).joinedload(Product.brand)
-        )
-    )
+
+    result = await db.execute(wishlist.wishlist_query().where(Wishlist.id == wishlist_id))
     return result.scalars().first()
 
+@app.post("/wishlist/batch", response_model=WishlistBatchResult)
+async def add_to_wishlist_batch(
+    batch: WishlistBatch,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    # Merges a guest wishlist at login; products already there or unknown are skipped
+    added = await wishlist.add_products(db, current_user.id, batch.product_ids)
+    await db.commit()
+    return {"added": added, "product_ids": await wishlist.product_ids(db, current_user.id)}
+
+@app.delete("/wishlist/batch", response_model=WishlistBatchResult)
+async def remove_from_wishlist_batch(
+    batch: WishlistBatch,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    removed = await wishlist.remove_products(db, current_user.id, batch.product_ids)
+    await db.commit()
+    return {"removed": removed, "product_ids": await wishlist.product_ids(db, current_user.id)}
+
 @app.delete("/wishlist/{product_id}")
 async def remove_from_wishlist(
     product_id: int, 
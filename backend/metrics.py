@@ -0,0 +1,185 @@
+import bisect
+import contextvars
+import os
+import time
+
+from sqlalchemy import event
+
+# Everything here is updated from the event loop thread only, so plain ints
+# and lists are enough; no locks on the hot path.
+
+# Optional bearer token required to scrape /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        for values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, values)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value: float):
+        self._values[label_values] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, *label_values, value: float):
+        series = self._values.get(label_values)
+        if series is None:
+            series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for values, series in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labels, values, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            cumulative += series[len(self.buckets)]
+            labels = _format_labels(self.labels, values, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, values)} {series[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """
+        `collect()` is called at scrape time and returns (name, kind, help, [(labels dict, value)]).
+        """
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collect in self._collectors:
+            for name, kind, help_text, samples in collect():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+http_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"))
+db_queries = registry.register(Counter(
+    "db_queries_total", "SQL statements executed"))
+db_queries_per_request = registry.register(Histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request", ("route",), QUERY_COUNT_BUCKETS))
+db_pool_wait = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection", (), WAIT_BUCKETS))
+outbound_duration = registry.register(Histogram(
+    "outbound_request_duration_seconds", "Latency of calls to external services", ("service",)))
+outbound_requests = registry.register(Counter(
+    "outbound_requests_total", "Calls to external services by outcome", ("service", "outcome")))
+outbound_batch_size = registry.register(Histogram(
+    "outbound_batch_size", "Events per batched call to external services", ("service",), BATCH_SIZE_BUCKETS))
+
+# Per-request SQL statement counter; the middleware installs a fresh one per request
+_query_counter: contextvars.ContextVar[list | None] = contextvars.ContextVar("query_counter", default=None)
+
+
+def start_request() -> list:
+    counter = [0]
+    _query_counter.set(counter)
+    http_in_flight.inc()
+    return counter
+
+
+def finish_request(method: str, route: str | None, status: int, duration: float, counter: list):
+    route = route or "unmatched"
+    http_in_flight.dec()
+    http_requests.inc(method, route, status)
+    http_duration.observe(method, route, value=duration)
+    db_queries_per_request.observe(route, value=counter[0])
+
+
+def observe_outbound(service: str, duration: float, ok: bool):
+    outbound_duration.observe(service, value=duration)
+    outbound_requests.inc(service, "success" if ok else "failure")
+
+
+def instrument_engine(engine):
+    """
+    Count SQL statements and time pool checkouts on an AsyncEngine.
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        db_queries.inc()
+        counter = _query_counter.get()
+        if counter is not None:
+            counter[0] += 1
+
+    # The pool has no "checkout started" event, so time the pool's own getter
+    pool = sync_engine.pool
+    do_get = pool._do_get
+
+    def _timed_do_get():
+        start = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            db_pool_wait.observe(value=time.perf_counter() - start)
+
+    pool._do_get = _timed_do_get
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text, JSON
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Date, DateTime, Text, JSON, Index, DDL, event
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -74,6 +74,12 @@ class Product(Base):
     brand = relationship("Brand", back_populates="products", lazy="selectin") # New link
     order_items = relationship("OrderItem", back_populates="product")
 
+    __table_args__ = (
+        # Catalog filters: category or brand, then a price range
+        Index("ix_products_category_price", "category_id", "price"),
+        Index("ix_products_brand_price", "brand_id", "price"),
+    )
+
 class Order(Base):
     __tablename__ = "orders"
 
@@ -97,6 +103,13 @@ class Order(Base):
     items = relationship("OrderItem", back_populates="order")
     user = relationship("User", back_populates="orders")
 
+    __table_args__ = (
+        # Keyset pagination key for /orders/
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        # Date range + status filters of /orders/export
+        Index("ix_orders_created_at_status", "created_at", "status"),
+    )
+
 class OrderItem(Base):
     __tablename__ = "order_items"
 
@@ -125,3 +138,76 @@ class Wishlist(Base):
 
     user = relationship("User")
     product = relationship("Product")
+
+    __table_args__ = (
+        # One row per product per user; adds are INSERT .. ON CONFLICT DO NOTHING
+        Index("uq_wishlists_user_product", "user_id", "product_id", unique=True),
+    )
+
+# Rows duplicated before the unique index existed are collapsed to the oldest
+# one, right before create_missing_indexes adds it to an existing database
+event.listen(
+    next(i for i in Wishlist.__table__.indexes if i.name == "uq_wishlists_user_product"),
+    "before_create",
+    DDL(
+        "DELETE FROM wishlists WHERE id NOT IN "
+        "(SELECT MIN(id) FROM wishlists GROUP BY user_id, product_id)"
+    ),
+)
+
+class SalesRollup(Base):
+    """
+    Daily sales totals, updated by every order. dimension is "total" (key 0),
+    "product", "category" or "brand" (key is that row's id, 0 when unset).
+    """
+    __tablename__ = "sales_rollups"
+
+    day = Column(Date, primary_key=True)
+    dimension = Column(String, primary_key=True)
+    key = Column(Integer, primary_key=True)
+    orders = Column(Integer, default=0, nullable=False)
+    units = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        # Reports scan one dimension over a date range
+        Index("ix_sales_rollups_dimension_day", "dimension", "day"),
+    )
+
+class OutboxEvent(Base):
+    """
+    Calls to external services (Facebook CAPI, page posts), written in the same
+    transaction as the change that caused them and delivered by the outbox worker.
+    """
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True)
+    endpoint = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String, default="pending", nullable=False)  # pending, dead
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # The worker's claim query
+        Index("ix_outbox_events_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+class StoredBlob(Base):
+    """
+    One row per distinct uploaded file, keyed by the SHA-256 of its bytes.
+    Re-uploading the same file returns the stored manifest instead of storing it again.
+    Whether a blob is still in use is worked out by scanning for its URLs when
+    garbage is collected, not kept here.
+    """
+    __tablename__ = "stored_blobs"
+
+    hash = Column(String, primary_key=True)
+    url = Column(String, nullable=False)
+    manifest = Column(JSON, nullable=False)
+    size = Column(Integer, nullable=False)
+    # Times the file was uploaded, including the first
+    upload_count = Column(Integer, default=1, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import Order, OrderItem, Product
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = int(os.getenv("ORDER_EXPORT_BATCH_SIZE", "1000"))
+
+ORDER_FIELDS = [
+    "id", "created_at", "status", "payment_method", "total_amount",
+    "customer_email", "customer_first_name", "customer_last_name",
+    "customer_address", "customer_city", "customer_country", "customer_zip",
+]
+ITEM_FIELDS = ["product_id", "product_name", "quantity", "price_at_time"]
+CSV_HEADER = ["order_" + f if f == "id" else f for f in ORDER_FIELDS] + ITEM_FIELDS
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+def export_query(created_from: datetime | None = None, created_to: datetime | None = None, status: str | None = None):
+    """
+    One row per order item (orders without items get a single row of NULLs),
+    in order of creation. The date range and status are served by
+    ix_orders_created_at_status.
+    """
+    query = (
+        select(
+            *[getattr(Order, f) for f in ORDER_FIELDS],
+            OrderItem.product_id, Product.name.label("product_name"),
+            OrderItem.quantity, OrderItem.price_at_time,
+        )
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .order_by(Order.created_at, Order.id, OrderItem.id)
+    )
+    if created_from is not None:
+        query = query.where(Order.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(Order.created_at < created_to)
+    if status is not None:
+        query = query.where(Order.status == status)
+    return query
+
+
+async def _rows(db: AsyncSession, query):
+    # stream() keeps a server-side cursor open and fetches in batches, so
+    # memory stays flat however many orders match
+    result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for partition in result.partitions():
+        yield partition
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+# Spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ("=", "+", "-", "@")
+
+
+def _csv_value(value):
+    # Customer-entered text is quoted with a leading ' so it opens as text
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return _value(value)
+
+
+async def csv_chunks(db: AsyncSession, query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    async for partition in _rows(db, query):
+        writer.writerows([_csv_value(v) for v in row] for row in partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def ndjson_chunks(db: AsyncSession, query):
+    """
+    One JSON object per order with its items nested. Rows arrive grouped by
+    order, so only the order being assembled is held in memory.
+    """
+    split = len(ORDER_FIELDS)
+    current = None
+    async for partition in _rows(db, query):
+        lines = []
+        for row in partition:
+            if current is None or current["id"] != row[0]:
+                if current is not None:
+                    lines.append(json.dumps(current, ensure_ascii=False))
+                current = dict(zip(ORDER_FIELDS, map(_value, row[:split])))
+                current["items"] = []
+            if row[split] is not None:
+                current["items"].append(dict(zip(ITEM_FIELDS, row[split:])))
+        if lines:
+            yield "\n".join(lines) + "\n"
+    if current is not None:
+        yield json.dumps(current, ensure_ascii=False) + "\n"
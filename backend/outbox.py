@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import OutboxEvent
+
+logger = logging.getLogger("outbox")
+
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# Attempts before an event is dead-lettered
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+# Retry delay doubles from the base up to the cap (seconds)
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "5"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "900"))
+# A claimed event becomes claimable again after this long, in case the worker
+# holding it died mid-delivery
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+
+
+def _parse_concurrency(raw: str) -> dict[str, int]:
+    limits = {}
+    for part in raw.split(","):
+        endpoint, _, limit = part.partition("=")
+        if endpoint.strip() and limit.strip():
+            limits[endpoint.strip()] = int(limit)
+    return limits
+
+
+# Per-endpoint overrides of the concurrency a handler registers with,
+# e.g. OUTBOX_CONCURRENCY="facebook_capi=4,facebook_post=1"
+OUTBOX_CONCURRENCY = _parse_concurrency(os.getenv("OUTBOX_CONCURRENCY", ""))
+
+
+class PermanentError(Exception):
+    """
+    Raised by a handler when retrying cannot help (bad payload, revoked token);
+    the event is dead-lettered straight away.
+    """
+
+
+def enqueue(db: AsyncSession, endpoint: str, payload: dict):
+    """
+    Add an event to the caller's transaction. It is only sent once that
+    transaction commits, and is never lost if the process restarts.
+    """
+    db.add(OutboxEvent(endpoint=endpoint, payload=payload))
+
+
+def backoff(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+    # Jitter so a recovering endpoint is not hit by every retry at once
+    return delay * random.uniform(0.5, 1.0)
+
+
+class _Handler:
+    def __init__(self, send, concurrency: int, batch_size: int | None):
+        self.send = send
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.batch_size = batch_size
+
+
+class OutboxWorker:
+    """
+    Drains the outbox in the background: claims due events, delivers them
+    through the handler registered for their endpoint, then deletes them,
+    schedules a retry, or dead-letters them.
+    """
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.handlers: dict[str, _Handler] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def register(self, endpoint: str, send, concurrency: int = 1, batch_size: int | None = None):
+        """
+        `send(payload)` is awaited per event and should raise on failure.
+        With `batch_size`, `send(payloads)` gets up to that many payloads at
+        once and returns one outcome per payload: None when it was delivered,
+        or the exception it failed with. `concurrency` counts calls to `send`.
+        """
+        self.handlers[endpoint] = _Handler(send, OUTBOX_CONCURRENCY.get(endpoint, concurrency), batch_size)
+
+    def notify(self):
+        # New events were committed; skip the rest of the poll interval
+        self._wakeup.set()
+
+    async def _claim(self) -> list:
+        now = datetime.utcnow()
+        async with self.sessions() as db:
+            result = await db.execute(
+                select(OutboxEvent.id, OutboxEvent.endpoint, OutboxEvent.payload, OutboxEvent.attempts)
+                .where(
+                    OutboxEvent.status == "pending",
+                    OutboxEvent.next_attempt_at <= now,
+                    OutboxEvent.endpoint.in_(self.handlers),
+                )
+                .order_by(OutboxEvent.next_attempt_at, OutboxEvent.id)
+                .limit(OUTBOX_BATCH_SIZE)
+                # Other workers skip rows being claimed here (Postgres; SQLite has one writer)
+                .with_for_update(skip_locked=True)
+            )
+            events = result.all()
+            if events:
+                # Pushing next_attempt_at out is the lease
+                await db.execute(
+                    update(OutboxEvent)
+                    .where(OutboxEvent.id.in_([e.id for e in events]))
+                    .values(
+                        attempts=OutboxEvent.attempts + 1,
+                        next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                    )
+                )
+            await db.commit()
+        return events
+
+    async def _deliver(self, handler: _Handler, events: list) -> list:
+        """
+        Send `events` (one, or a batch) and return their (event, error) outcomes.
+        """
+        async with handler.semaphore:
+            try:
+                if handler.batch_size:
+                    errors = await handler.send([e.payload for e in events])
+                else:
+                    await handler.send(events[0].payload)
+                    errors = [None]
+            except Exception as e:
+                errors = [e] * len(events)
+        return list(zip(events, errors))
+
+    async def _settle(self, outcomes: list):
+        """
+        Record every outcome of a claim in one transaction, one statement per
+        kind of outcome rather than one per event.
+        """
+        delivered, retries, dead = [], {}, {}
+        for event, error in outcomes:
+            attempts = event.attempts + 1
+            fields = {"event_id": event.id, "endpoint": event.endpoint, "attempts": attempts}
+            if error is None:
+                delivered.append(event.id)
+                logger.debug("Outbox event delivered", extra={"fields": fields})
+                continue
+            message = str(error) if isinstance(error, PermanentError) else f"{type(error).__name__}: {error}"
+            if not isinstance(error, PermanentError) and attempts < OUTBOX_MAX_ATTEMPTS:
+                retries.setdefault((attempts, message[:1000]), []).append(event.id)
+                logger.warning("Outbox delivery failed, will retry", extra={"fields": {**fields, "error": message}})
+            else:
+                dead.setdefault(message[:1000], []).append(event.id)
+                logger.error("Outbox event dead-lettered", extra={"fields": {**fields, "error": message}})
+
+        async with self.sessions() as db:
+            if delivered:
+                await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(delivered)))
+            for (attempts, message), ids in retries.items():
+                # Events that failed together (usually one batch) retry together
+                await db.execute(
+                    update(OutboxEvent).where(OutboxEvent.id.in_(ids)).values(
+                        next_attempt_at=datetime.utcnow() + timedelta(seconds=backoff(attempts)),
+                        last_error=message,
+                    )
+                )
+            for message, ids in dead.items():
+                await db.execute(
+                    update(OutboxEvent).where(OutboxEvent.id.in_(ids)).values(status="dead", last_error=message)
+                )
+            await db.commit()
+
+    async def run_once(self) -> int:
+        """
+        Claim and deliver one batch. Returns the number of events handled.
+        """
+        events = await self._claim()
+        if not events:
+            return 0
+        deliveries = []
+        for endpoint, handler in self.handlers.items():
+            claimed = [e for e in events if e.endpoint == endpoint]
+            size = handler.batch_size or 1
+            deliveries += [self._deliver(handler, claimed[i:i + size]) for i in range(0, len(claimed), size)]
+        outcomes = [outcome for results in await asyncio.gather(*deliveries) for outcome in results]
+        await self._settle(outcomes)
+        return len(events)
+
+    async def _run(self):
+        while True:
+            try:
+                handled = await self.run_once()
+            except Exception:
+                logger.exception("Outbox worker iteration failed")
+                handled = 0
+            if handled:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+async def outbox_stats(db: AsyncSession) -> dict:
+    result = await db.execute(
+        select(OutboxEvent.endpoint, OutboxEvent.status, func.count())
+        .group_by(OutboxEvent.endpoint, OutboxEvent.status)
+    )
+    stats = {}
+    for endpoint, status, count in result:
+        stats.setdefault(endpoint, {})[status] = count
+    return stats
+
+
+async def retry_dead(db: AsyncSession, event_id: int | None = None) -> int:
+    """
+    Put dead-lettered events (one, or all of them) back in the queue.
+    """
+    statement = (
+        update(OutboxEvent)
+        .where(OutboxEvent.status == "dead")
+        .values(status="pending", attempts=0, next_attempt_at=datetime.utcnow())
+    )
+    if event_id is not None:
+        statement = statement.where(OutboxEvent.id == event_id)
+    result = await db.execute(statement)
+    await db.commit()
+    return result.rowcount
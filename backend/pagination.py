@@ -0,0 +1,74 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+# Header carrying the opaque cursor for the next page. The list endpoints keep
+# returning a plain JSON array so existing clients are unaffected.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: list) -> str:
+    """
+    Encode the sort key of the last row of a page into an opaque, URL-safe token.
+    """
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    """
+    Decode a cursor produced by encode_cursor for the given key columns.
+    Raises a 400 if the token is malformed or does not match the key shape.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor does not match the sort key")
+        decoded = []
+        for column, value in zip(columns, values):
+            if column.type.python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif column.type.python_type is int and not isinstance(value, int):
+                raise ValueError("cursor id must be an integer")
+            decoded.append(value)
+        return decoded
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _after(columns: list, values: list):
+    # Row-value comparison, (a, b) > (:a, :b). Both Postgres and SQLite (3.15+)
+    # turn this into a range seek on the composite index of the key columns,
+    # which the expanded OR form does not get on SQLite.
+    if len(columns) == 1:
+        return columns[0] > values[0]
+    return tuple_(*columns) > tuple_(*values)
+
+
+def paginate(query, columns: list, cursor: str | None = None, skip: int = 0, limit: int = 100):
+    """
+    Apply keyset pagination on `columns` (e.g. [Product.id] or [Order.created_at, Order.id]).
+    When no cursor is given, falls back to the legacy skip/limit behaviour.
+    """
+    query = query.order_by(*columns)
+    if cursor:
+        query = query.where(_after(columns, decode_cursor(cursor, columns)))
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+def set_next_cursor(response: Response, rows: list, columns: list, limit: int):
+    """
+    Expose the cursor for the page after `rows`, if there may be one.
+    """
+    if limit and len(rows) == limit:
+        last = rows[-1]
+        # Rows are ORM objects or models, or plain dicts on the FAST_JSON path
+        values = [last[c.key] for c in columns] if isinstance(last, dict) else [getattr(last, c.key) for c in columns]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(values)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, ConfigDict
-from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field
+from datetime import date, datetime
 
 class Token(BaseModel):
     access_token: str
@@ -184,6 +184,33 @@ class ProductResponseFull(BaseModel):
     brand: BrandResponse | None = None
     model_config = ConfigDict(from_attributes=True)
 
+# --- Catalog Facets ---
+class FacetCount(BaseModel):
+    value: int | None = None
+    count: int
+
+class PriceRangeCount(BaseModel):
+    min: float
+    max: float | None = None
+    count: int
+
+class CatalogFacets(BaseModel):
+    total: int
+    categories: list[FacetCount]
+    brands: list[FacetCount]
+    price_ranges: list[PriceRangeCount]
+    in_stock: int
+    out_of_stock: int
+
+# --- Sales Analytics ---
+class SalesRow(BaseModel):
+    day: date | None = None
+    id: int | None = None
+    name: str | None = None
+    orders: int
+    units: int
+    revenue: float
+
 class StartLocationResponse(StoreLocationBase):
     id: int
     model_config = ConfigDict(from_attributes=True)
@@ -211,3 +238,13 @@ class WishlistResponse(BaseModel):
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+class WishlistBatch(BaseModel):
+    # A guest wishlist merged at login; capped to keep the IN list sane
+    product_ids: list[int] = Field(max_length=500)
+
+class WishlistBatchResult(BaseModel):
+    added: int = 0
+    removed: int = 0
+    # The wishlist after the change
+    product_ids: list[int]
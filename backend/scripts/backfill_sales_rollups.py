@@ -0,0 +1,36 @@
+"""
+Rebuild the daily sales rollups from orders and order_items. Needed once after
+deploying the rollup table, or after editing orders directly in the database.
+
+Usage (from backend/):
+    python -m scripts.backfill_sales_rollups --batch-size 1000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine, SessionLocal, Base, create_missing_indexes
+from analytics import rebuild_rollups, ROLLUP_BATCH_SIZE
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=ROLLUP_BATCH_SIZE)
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_missing_indexes)
+    t0 = time.perf_counter()
+    async with SessionLocal() as db:
+        processed = await rebuild_rollups(db, args.batch_size)
+    print(f"Rebuilt sales rollups from {processed} orders in {time.perf_counter() - t0:.2f}s")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""
+Throughput of mixed catalog reads and checkouts under concurrent load, with the
+engine defaults versus the tuned pool (WAL, busy timeout, DB_* pool settings).
+
+Usage (from backend/):
+    python -m scripts.bench_db_pool --concurrency 50 --seconds 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from main import app
+from database import Base, get_db, engine_options, configure_sqlite, pool_report
+from models import Category, Product
+from cache import catalog_cache
+
+customer = {
+    "email": "bench@example.com", "firstName": "B", "lastName": "B",
+    "address": "1 Rue", "city": "Rabat", "country": "MA", "zip": "10000"
+}
+
+
+def percentile(samples: list[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[max(int(len(samples) * q) - 1, 0)]
+
+
+async def seed(engine) -> list[int]:
+    sessions = async_sessionmaker(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with sessions() as db:
+        category = Category(name="Bench")
+        db.add(category)
+        await db.flush()
+        products = [Product(name=f"P{i}", price=10 + i, stock=1_000_000, category_id=category.id) for i in range(200)]
+        db.add_all(products)
+        await db.flush()
+        ids = [p.id for p in products]
+        await db.commit()
+    return ids
+
+
+async def run(label: str, engine, args) -> None:
+    product_ids = await seed(engine)
+    sessions = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    async def per_request_db():
+        async with sessions() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = per_request_db
+    latencies, errors = [], {}
+    deadline = time.perf_counter() + args.seconds
+
+    async def worker(client: AsyncClient):
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                if random.random() < args.write_ratio:
+                    response = await client.post("/orders/", json={
+                        "items": [{"product_id": random.choice(product_ids), "quantity": 1}], **customer
+                    })
+                else:
+                    # Product reads bypass the catalog cache, so every one hits the pool
+                    response = await client.get(f"/products/{random.choice(product_ids)}")
+                status = response.status_code
+            except Exception as exc:
+                status = type(exc).__name__
+            if status == 200:
+                latencies.append((time.perf_counter() - t0) * 1000)
+            else:
+                errors[status] = errors.get(status, 0) + 1
+
+    catalog_cache.clear()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        await asyncio.gather(*[worker(client) for _ in range(args.concurrency)])
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+    print(
+        f"{label:<8} {len(latencies) / args.seconds:8.1f} req/s  "
+        f"p50 {statistics.median(latencies):7.2f} ms  p99 {percentile(latencies, 0.99):8.2f} ms  "
+        f"errors {errors or 0}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    default_url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'default.db')}"
+    await run("default", create_async_engine(default_url), args)
+
+    tuned_url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'tuned.db')}"
+    tuned = create_async_engine(tuned_url, **engine_options(tuned_url))
+    configure_sqlite(tuned)
+    print("         ", pool_report(tuned))
+    await run("tuned", tuned, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""
+Bulk upload throughput of the image pipeline, and how much each mode stalls
+the event loop while it works.
+
+Usage (from backend/):
+    python -m scripts.bench_image_pipeline --images 24 --concurrency 8
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+import services.images as images
+
+
+def make_photo(width: int, height: int, seed: int) -> bytes:
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width // 8, height // 8))
+    image.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(image.width * image.height)])
+    image = image.resize((width, height), Image.Resampling.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=92)
+    return buffer.getvalue()
+
+
+async def loop_lag(stop: asyncio.Event) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - t0 - 0.01)
+    return worst * 1000
+
+
+async def run(label: str, photos: list[bytes], concurrency: int, process) -> None:
+    work_dir = tempfile.mkdtemp()
+    sources = []
+    for i, data in enumerate(photos):
+        sources.append(os.path.join(work_dir, f"source-{i}.jpg"))
+        with open(sources[-1], "wb") as out:
+            out.write(data)
+    semaphore = asyncio.Semaphore(concurrency)
+    output = 0
+
+    async def one(source: str):
+        nonlocal output
+        async with semaphore:
+            result = await process(source, tempfile.mkdtemp(dir=work_dir))
+            output += sum(v["size"] for v in result["variants"])
+
+    stop = asyncio.Event()
+    lag = asyncio.create_task(loop_lag(stop))
+    t0 = time.perf_counter()
+    await asyncio.gather(*[one(p) for p in sources])
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    print(
+        f"{label:<8} {len(photos) / elapsed:6.2f} images/s  {elapsed:6.2f}s  "
+        f"worst loop stall {await lag:8.1f} ms  in {sum(map(len, photos)) / 1e6:6.1f} MB -> out {output / 1e6:5.1f} MB"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    args = parser.parse_args()
+
+    photos = [make_photo(args.width, args.height, seed) for seed in range(args.images)]
+
+    async def inline(source, out_dir):
+        return images.process_image(source, out_dir)
+
+    async def threaded(source, out_dir):
+        return await asyncio.to_thread(images.process_image, source, out_dir)
+
+    await run("inline", photos, args.concurrency, inline)
+    await run("thread", photos, args.concurrency, threaded)
+    await run("process", photos, args.concurrency, images.process_upload)
+    images.shutdown_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
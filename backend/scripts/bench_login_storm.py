@@ -0,0 +1,108 @@
+"""
+Catalog latency during a login storm, with bcrypt hashed inline on the event
+loop versus on the bounded hashing pool.
+
+Usage (from backend/):
+    python -m scripts.bench_login_storm --logins 40 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+import auth
+from main import app
+from database import Base, get_db
+from models import User, Category, Product
+from cache import catalog_cache
+
+
+async def probe_catalog(client: AsyncClient, stop: asyncio.Event) -> list[float]:
+    samples = []
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        response = await client.get("/catalog/")
+        assert response.status_code == 200
+        samples.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(0.005)
+    return samples
+
+
+async def login_storm(client: AsyncClient, logins: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def login():
+        async with semaphore:
+            response = await client.post("/token", data={"username": "storm", "password": "storm-password"})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*[login() for _ in range(logins)])
+    return statuses
+
+
+def percentile(samples: list[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[max(int(len(samples) * q) - 1, 0)]
+
+
+async def run(client: AsyncClient, label: str, args) -> None:
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_catalog(client, stop))
+    await asyncio.sleep(0.5)
+    t0 = time.perf_counter()
+    statuses = await login_storm(client, args.logins, args.concurrency)
+    storm_seconds = time.perf_counter() - t0
+    stop.set()
+    samples = await probe
+    print(
+        f"{label:<8} logins {args.logins} in {storm_seconds:5.2f}s {statuses}  "
+        f"catalog p50 {statistics.median(samples):7.2f} ms  p99 {percentile(samples, 0.99):8.2f} ms  "
+        f"max {max(samples):8.2f} ms  ({len(samples)} requests)"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    url = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_async_engine(url)
+    sessions = async_sessionmaker(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with sessions() as db:
+        db.add(User(username="storm", hashed_password=auth.get_password_hash("storm-password"), email="s@example.com"))
+        category = Category(name="Bench")
+        db.add(category)
+        await db.flush()
+        db.add_all([Product(name=f"P{i}", price=i, stock=1, category_id=category.id) for i in range(50)])
+        await db.commit()
+
+    async def per_request_db():
+        async with sessions() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = per_request_db
+    catalog_cache.clear()
+    pool = auth._hash_executor
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        auth._hash_executor = None
+        await run(client, "inline", args)
+        auth._hash_executor = pool
+        await run(client, "pooled", args)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""
+Deep-page latency: OFFSET pagination vs keyset (cursor) pagination on orders.
+
+Usage (from backend/):
+    python -m scripts.bench_pagination --orders 200000 --page-size 100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.future import select
+
+from database import Base
+from models import Order
+from pagination import paginate, encode_cursor
+
+
+async def seed(session_factory, count: int):
+    start = datetime(2024, 1, 1)
+    batch = []
+    async with session_factory() as db:
+        for i in range(count):
+            batch.append({
+                "total_amount": float(i % 500),
+                "created_at": start + timedelta(seconds=i * 7),
+                "status": "completed",
+                "payment_method": "cod",
+            })
+            if len(batch) == 5000:
+                await db.execute(insert(Order), batch)
+                batch = []
+        if batch:
+            await db.execute(insert(Order), batch)
+        await db.commit()
+
+
+async def time_page(session_factory, query, repeats: int) -> float:
+    samples = []
+    async with session_factory() as db:
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            rows = (await db.execute(query)).scalars().all()
+            samples.append((time.perf_counter() - t0) * 1000)
+            db.expunge_all()
+    assert rows
+    return statistics.median(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    engine = create_async_engine(url)
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    print(f"Seeding {args.orders} orders into {url} ...")
+    await seed(session_factory, args.orders)
+
+    keys = [Order.created_at, Order.id]
+    print(f"{'page':>8} {'offset ms':>10} {'keyset ms':>10} {'speedup':>8}")
+    for depth in (0.01, 0.25, 0.5, 0.9, 0.99):
+        skip = int(args.orders * depth)
+        offset_query = paginate(select(Order), keys, None, skip, args.page_size)
+
+        # Build the cursor a client would hold after reading `skip` rows
+        async with session_factory() as db:
+            anchor = (await db.execute(select(Order).order_by(*keys).offset(skip - 1).limit(1))).scalars().first()
+        cursor = encode_cursor([anchor.created_at, anchor.id])
+        keyset_query = paginate(select(Order), keys, cursor, 0, args.page_size)
+
+        offset_ms = await time_page(session_factory, offset_query, args.repeats)
+        keyset_ms = await time_page(session_factory, keyset_query, args.repeats)
+        print(f"{skip // args.page_size:>8} {offset_ms:>10.2f} {keyset_ms:>10.2f} {offset_ms / keyset_ms:>7.1f}x")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""
+Per-item cost of turning ORM products into a /catalog/ response body: the
+default path (model_validate, FastAPI's response_model validation and
+serialization, stdlib json) versus the FAST_JSON path (plain dicts + orjson).
+
+Usage (from backend/):
+    python -m scripts.bench_serialization --items 100 --rounds 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from fast_json import to_dict, dumps
+from models import Brand, Category, Product
+from schemas import ProductResponseFull
+
+
+def catalog_page(count: int) -> list[Product]:
+    category = Category(id=1, name="Watches", image_url="/static/c.webp")
+    brand = Brand(id=1, name="Tissot", logo_url="/static/b.webp")
+    return [
+        Product(
+            id=i, name=f"Watch {i}", description="Sapphire crystal, 100 m water resistance. " * 4,
+            price=199.0 + i, stock=i % 7, image_url=f"/static/{i:032x}.webp",
+            additional_images=[f"/static/{i:031x}a.webp", f"/static/{i:031x}b.webp"],
+            specs={"case": "steel", "diameter_mm": 40, "movement": "automatic"},
+            rating=4.5, review_count=12, category_id=1, brand_id=1, category=category, brand=brand,
+        )
+        for i in range(count)
+    ]
+
+
+async def default_path(field, products) -> bytes:
+    models = [ProductResponseFull.model_validate(p) for p in products]
+    content = await serialize_response(field=field, response_content=models)
+    return JSONResponse(content).body
+
+
+def fast_path(products) -> bytes:
+    return dumps([to_dict(ProductResponseFull, p) for p in products])
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    products = catalog_page(args.items)
+    # The field FastAPI builds for response_model=List[ProductResponseFull]
+    field = create_model_field(name="response", type_=list[ProductResponseFull], mode="serialization")
+
+    assert json.loads(await default_path(field, products)) == json.loads(fast_path(products))
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        await default_path(field, products)
+    default = (time.perf_counter() - start) / (args.rounds * args.items)
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        fast_path(products)
+    fast = (time.perf_counter() - start) / (args.rounds * args.items)
+
+    print(f"{args.items} products x {args.rounds} rounds")
+    print(f"  default   {default * 1e6:7.1f} us/item")
+    print(f"  FAST_JSON {fast * 1e6:7.1f} us/item   ({default / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""
+Per-request cost of resolving the current user from a bearer token,
+with and without the authenticated-user cache.
+
+Usage (from backend/):
+    python -m scripts.bench_user_cache --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database import Base
+from models import User
+from auth import create_access_token, get_current_user, token_claims, user_cache
+
+
+async def measure(session_factory, token: str, requests: int, cached: bool) -> list[float]:
+    samples = []
+    for _ in range(requests):
+        if not cached:
+            user_cache.clear()
+        # One session per request, as get_db does
+        async with session_factory() as db:
+            t0 = time.perf_counter()
+            await get_current_user(token, db)
+            samples.append((time.perf_counter() - t0) * 1e6)
+    return samples
+
+
+def summary(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    return f"median {statistics.median(samples):8.1f} us   p99 {p99:8.1f} us"
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine = create_async_engine(url)
+    session_factory = async_sessionmaker(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with session_factory() as db:
+        user = User(username="bench", hashed_password="$2b$12$" + "x" * 53, email="bench@example.com", is_active=True)
+        db.add(user)
+        await db.commit()
+        await db.refresh(user)
+        token = create_access_token(token_claims(user))
+
+    # Warm up connections and code paths
+    await measure(session_factory, token, 50, cached=False)
+
+    uncached = await measure(session_factory, token, args.requests, cached=False)
+    user_cache.clear()
+    cached = await measure(session_factory, token, args.requests, cached=True)
+
+    print(f"database lookup: {summary(uncached)}")
+    print(f"cached lookup:   {summary(cached)}")
+    saved = statistics.median(uncached) - statistics.median(cached)
+    print(f"saved per authenticated request: {saved:.1f} us (median)")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
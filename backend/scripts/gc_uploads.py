@@ -0,0 +1,40 @@
+"""
+Delete uploaded images that no product, category, brand or setting references.
+Uploads newer than --min-age-hours are kept (they may not be attached yet).
+
+Usage (from backend/):
+    python -m scripts.gc_uploads --dry-run
+    python -m scripts.gc_uploads --min-age-hours 48
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine, SessionLocal, Base, create_missing_indexes
+from services.storage import collect_garbage
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--min-age-hours", type=float, default=24)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_missing_indexes)
+    async with SessionLocal() as db:
+        result = await collect_garbage(db, timedelta(hours=args.min_age_hours), args.dry_run)
+    verb = "Would delete" if args.dry_run else "Deleted"
+    print(f"{verb} {result['blobs']} blobs, {len(result['files'])} files")
+    for name in result["files"]:
+        print(f"  {name}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
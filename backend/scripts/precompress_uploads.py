@@ -0,0 +1,112 @@
+"""
+Write .gz (and .br, when the brotli package is installed) copies of the
+compressible files in uploads/, which /static then serves to clients that
+accept them. Images in WebP/AVIF/JPEG/PNG are already compressed and are
+skipped; so is any file whose compressed copy would not be at least 10%
+smaller. Files with an up-to-date copy are not compressed again.
+
+Usage (from backend/):
+    python -m scripts.precompress_uploads
+    python -m scripts.precompress_uploads --workers 8 --force
+"""
+import argparse
+import gzip
+import mimetypes
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.storage import UPLOAD_DIR
+from static_files import PRECOMPRESSED_SUFFIXES
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    "image/svg+xml", "image/bmp", "image/x-ms-bmp", "image/tiff", "image/x-icon", "image/vnd.microsoft.icon",
+    "application/json", "application/javascript", "application/xml", "application/pdf",
+}
+# Below this the response headers outweigh any saving
+MIN_SIZE = 512
+MIN_SAVING = 0.9
+
+
+def compressible(path: str) -> bool:
+    media_type, encoding = mimetypes.guess_type(path)
+    if encoding or media_type is None:
+        return False
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def compressors() -> list:
+    result = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        result.append((".br", lambda data: brotli.compress(data, quality=11)))
+    return result
+
+
+def precompress(path: str, force: bool) -> dict:
+    """
+    Compress one file into its siblings. Returns bytes in and out per suffix written.
+    """
+    source_mtime = os.path.getmtime(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    written = {}
+    for suffix, compress in compressors():
+        target = path + suffix
+        if not force and os.path.exists(target) and os.path.getmtime(target) >= source_mtime:
+            continue
+        compressed = compress(data)
+        if len(compressed) > len(data) * MIN_SAVING:
+            # Not worth serving; drop a stale copy so it is not served either
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        # Written under a temporary name so /static never serves a partial file
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as out:
+            out.write(compressed)
+        os.replace(tmp, target)
+        written[suffix] = (len(data), len(compressed))
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", default=UPLOAD_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--force", action="store_true", help="recompress files with an up-to-date copy")
+    args = parser.parse_args()
+
+    paths = []
+    for name in sorted(os.listdir(args.dir)):
+        path = os.path.join(args.dir, name)
+        if (
+            not name.endswith(PRECOMPRESSED_SUFFIXES) and os.path.isfile(path)
+            and os.path.getsize(path) >= MIN_SIZE and compressible(path)
+        ):
+            paths.append(path)
+    if brotli is None:
+        print("brotli is not installed; writing .gz only")
+
+    start = time.perf_counter()
+    totals = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for result in pool.map(precompress, paths, [args.force] * len(paths), chunksize=8):
+            for suffix, (size_in, size_out) in result.items():
+                count, total_in, total_out = totals.get(suffix, (0, 0, 0))
+                totals[suffix] = (count + 1, total_in + size_in, total_out + size_out)
+
+    print(f"{len(paths)} compressible files in {time.perf_counter() - start:.2f}s")
+    for suffix, (count, total_in, total_out) in sorted(totals.items()):
+        print(f"  {suffix}: wrote {count} files, {total_in / 1024:.0f} KB -> {total_out / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
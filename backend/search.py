@@ -0,0 +1,161 @@
+import os
+import re
+
+from sqlalchemy import DDL, event, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import Base
+from models import Product, Brand, Category
+
+# Text search configuration used on Postgres. 'simple' does no stemming, which
+# suits a catalog that mixes French, Arabic and English product names.
+SEARCH_TEXT_CONFIG = os.getenv("SEARCH_TEXT_CONFIG", "simple")
+MAX_QUERY_TERMS = 8
+REINDEX_BATCH_SIZE = 500
+
+# The index lives outside the ORM models: an FTS5 virtual table on SQLite and a
+# tsvector column with a GIN index on Postgres. Both are created and dropped
+# together with the rest of the schema.
+event.listen(Base.metadata, "after_create", DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+    "name, description, brand, category, specs, tokenize='unicode61 remove_diacritics 2')"
+).execute_if(dialect="sqlite"))
+event.listen(Base.metadata, "after_create", DDL(
+    "CREATE TABLE IF NOT EXISTS product_search ("
+    "product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE, "
+    "document tsvector NOT NULL)"
+).execute_if(dialect="postgresql"))
+event.listen(Base.metadata, "after_create", DDL(
+    "CREATE INDEX IF NOT EXISTS ix_product_search_document ON product_search USING GIN (document)"
+).execute_if(dialect="postgresql"))
+event.listen(Base.metadata, "before_drop", DDL("DROP TABLE IF EXISTS product_search"))
+
+
+def _terms(query: str) -> list[str]:
+    # Only word characters reach the match expression, so user input can never
+    # inject FTS5 or tsquery operators.
+    return re.findall(r"\w+", query.lower())[:MAX_QUERY_TERMS]
+
+
+def _specs_text(specs) -> str:
+    if isinstance(specs, dict):
+        return " ".join(str(v) for v in specs.values() if v is not None)
+    return ""
+
+
+class ProductSearchIndex:
+    """
+    Ranked full-text index over product name, description, brand, category and specs.
+    Writes go through the caller's session so the index commits with the product.
+    """
+
+    @staticmethod
+    def _dialect(db: AsyncSession) -> str:
+        return db.bind.dialect.name
+
+    async def index_products(self, db: AsyncSession, product_ids: list[int]):
+        if not product_ids:
+            return
+        # Plain column query: products pending in the session are read back
+        # without touching relationships that were never loaded.
+        result = await db.execute(
+            select(
+                Product.id, Product.name, Product.description, Product.specs,
+                Brand.name.label("brand"), Category.name.label("category")
+            )
+            .outerjoin(Brand, Brand.id == Product.brand_id)
+            .outerjoin(Category, Category.id == Product.category_id)
+            .where(Product.id.in_(product_ids))
+        )
+        rows = [
+            {
+                "id": row.id,
+                "name": row.name or "",
+                "description": row.description or "",
+                "brand": row.brand or "",
+                "category": row.category or "",
+                "specs": _specs_text(row.specs),
+            }
+            for row in result
+        ]
+        await self.remove_products(db, product_ids)
+        if not rows:
+            return
+        if self._dialect(db) == "postgresql":
+            await db.execute(text(
+                "INSERT INTO product_search (product_id, document) VALUES (:id, "
+                "setweight(to_tsvector(CAST(:config AS regconfig), :name), 'A') || "
+                "setweight(to_tsvector(CAST(:config AS regconfig), :brand || ' ' || :category), 'B') || "
+                "setweight(to_tsvector(CAST(:config AS regconfig), :description), 'C') || "
+                "setweight(to_tsvector(CAST(:config AS regconfig), :specs), 'D'))"
+            ), [{**row, "config": SEARCH_TEXT_CONFIG} for row in rows])
+        else:
+            await db.execute(text(
+                "INSERT INTO product_search (rowid, name, description, brand, category, specs) "
+                "VALUES (:id, :name, :description, :brand, :category, :specs)"
+            ), rows)
+
+    async def index_product(self, db: AsyncSession, product_id: int):
+        await self.index_products(db, [product_id])
+
+    async def remove_products(self, db: AsyncSession, product_ids: list[int]):
+        column = "product_id" if self._dialect(db) == "postgresql" else "rowid"
+        await db.execute(
+            text(f"DELETE FROM product_search WHERE {column} = :id"),
+            [{"id": pid} for pid in product_ids]
+        )
+
+    async def rebuild(self, db: AsyncSession):
+        """
+        Re-index every product, in batches. Used at startup when the index is
+        out of step with the products table (e.g. after seeding or a restore).
+        """
+        await db.execute(text("DELETE FROM product_search"))
+        last_id = 0
+        while True:
+            result = await db.execute(
+                select(Product.id).where(Product.id > last_id).order_by(Product.id).limit(REINDEX_BATCH_SIZE)
+            )
+            ids = result.scalars().all()
+            if not ids:
+                break
+            await self.index_products(db, ids)
+            last_id = ids[-1]
+        await db.commit()
+
+    async def rebuild_if_stale(self, db: AsyncSession) -> bool:
+        indexed = (await db.execute(text("SELECT count(*) FROM product_search"))).scalar()
+        products = (await db.execute(select(func.count(Product.id)))).scalar()
+        if indexed == products:
+            return False
+        await self.rebuild(db)
+        return True
+
+    async def search(self, db: AsyncSession, query: str, skip: int = 0, limit: int = 20) -> list[int]:
+        """
+        Return product ids matching every term of `query` (as prefixes), best match first.
+        """
+        terms = _terms(query)
+        if not terms:
+            return []
+        if self._dialect(db) == "postgresql":
+            statement = text(
+                "SELECT product_id FROM product_search, to_tsquery(CAST(:config AS regconfig), :query) AS q "
+                "WHERE document @@ q ORDER BY ts_rank(document, q) DESC, product_id "
+                "LIMIT :limit OFFSET :skip"
+            )
+            params = {"config": SEARCH_TEXT_CONFIG, "query": " & ".join(f"{t}:*" for t in terms)}
+        else:
+            # bm25 weights per column: name, description, brand, category, specs
+            statement = text(
+                "SELECT rowid FROM product_search WHERE product_search MATCH :query "
+                "ORDER BY bm25(product_search, 10.0, 2.0, 5.0, 5.0, 1.0), rowid "
+                "LIMIT :limit OFFSET :skip"
+            )
+            params = {"query": " ".join(f'"{t}"*' for t in terms)}
+        result = await db.execute(statement, {**params, "limit": limit, "skip": skip})
+        return [row[0] for row in result]
+
+
+search_index = ProductSearchIndex()
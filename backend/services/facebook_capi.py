@@ -1,46 +1,121 @@
-import httpx
+import hashlib
+import logging
 import os
 import time
 
+import metrics
+from outbox import PermanentError
+from services.graph import GraphValidationError, graph_client, graph_url, raise_for_graph_status, FACEBOOK_API_VERSION
+
+logger = logging.getLogger("facebook_capi")
+
+# The outbox hands events over in batches of up to CAPI_BATCH_MAX_EVENTS
+# (CAPI accepts 1000), each sent as one request
+CAPI_BATCH_MAX_EVENTS = min(int(os.getenv("CAPI_BATCH_MAX_EVENTS", "500")), 1000)
+# Batch requests in flight at once
+CAPI_MAX_IN_FLIGHT = int(os.getenv("CAPI_MAX_IN_FLIGHT", "2"))
+
+# Customer fields Meta requires to be normalized and SHA-256 hashed
+HASHED_USER_FIELDS = ("em", "ph", "fn", "ln", "ct", "country", "zp")
+
+
+def hash_user_data(user_data: dict) -> dict:
+    hashed = {}
+    for field, values in user_data.items():
+        if field in HASHED_USER_FIELDS:
+            values = [
+                hashlib.sha256(str(v).strip().lower().encode()).hexdigest()
+                for v in values if v
+            ]
+        if values:
+            hashed[field] = values
+    return hashed
+
+
 class FacebookCAPIService:
     def __init__(self):
         self.pixel_id = os.getenv("FACEBOOK_PIXEL_ID")
         self.access_token = os.getenv("FACEBOOK_ACCESS_TOKEN")
-        self.api_version = "v19.0"
+        self.api_version = FACEBOOK_API_VERSION
         self.enabled = bool(self.pixel_id and self.access_token)
 
-    async def send_event(self, event_name: str, event_data: dict, user_data: dict = None):
+    def build_event(self, event_name: str, event_data: dict, user_data: dict = None) -> dict:
         """
-        Send an event to Meta Conversions API
+        A server event as CAPI expects it. event_time is fixed here, when the
+        event happened, not when it is eventually delivered.
         """
-        if not self.enabled:
-            print(f"Meta CAPI disabled (missing credentials). Event '{event_name}' skipped.")
-            return
-
-        url = f"https://graph.facebook.com/{self.api_version}/{self.pixel_id}/events"
-        
-        payload = {
-            "data": [
-                {
-                    "event_name": event_name,
-                    "event_time": int(time.time()),
-                    "action_source": "website",
-                    "user_data": user_data or {"client_user_agent": "Maison-Backend"},
-                    "custom_data": event_data
-                }
-            ],
-            "access_token": self.access_token
+        return {
+            "event_name": event_name,
+            "event_time": int(time.time()),
+            "action_source": "website",
+            "user_data": hash_user_data(user_data or {}) or {"client_user_agent": "Maison-Backend"},
+            "custom_data": event_data
         }
 
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(url, json=payload)
-                if response.status_code == 200:
-                    print(f"Meta CAPI: Event '{event_name}' sent successfully.")
-                else:
-                    print(f"Meta CAPI Error: {response.status_code} - {response.text}")
-            except Exception as e:
-                print(f"Meta CAPI Exception: {str(e)}")
+    async def send_events(self, events: list[dict]) -> dict:
+        """
+        Send events to Meta Conversions API in one request over the shared
+        client. Raises on failure so the outbox can retry or dead-letter them.
+        """
+        if not self.enabled:
+            raise PermanentError("Meta CAPI disabled (missing credentials)")
+
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = await graph_client().post(
+                graph_url(f"{self.pixel_id}/events"),
+                json={"data": events, "access_token": self.access_token}
+            )
+            raise_for_graph_status(response)
+            ok = True
+        finally:
+            duration = time.perf_counter() - start
+            metrics.observe_outbound("facebook_capi", duration, ok)
+            metrics.outbound_batch_size.observe("facebook_capi", value=len(events))
+        result = response.json()
+        logger.info("Meta CAPI batch sent", extra={"fields": {
+            "events": len(events),
+            "events_received": result.get("events_received"),
+            "fbtrace_id": result.get("fbtrace_id"),
+            "duration_ms": round(duration * 1000, 2),
+        }})
+        return result
+
+    async def deliver_batch(self, payloads: list[dict]) -> list:
+        """
+        Outbox batch handler: the payloads are events from build_event, sent in
+        one request. Returns one outcome per event, None or the error it failed
+        with. When Meta rejects the content of a batch, one malformed event
+        fails them all, so the halves are resent one after the other and only
+        the bad events fail, in about 2 log2(n) requests per bad event.
+        Throttling and other failures fail the whole batch, which the outbox
+        retries as it is.
+        """
+        try:
+            await self.send_events(payloads)
+            return [None] * len(payloads)
+        except GraphValidationError as error:
+            if len(payloads) == 1:
+                return [error]
+            logger.warning("Meta CAPI batch rejected, resending it in halves",
+                           extra={"fields": {"events": len(payloads), "error": str(error)}})
+            middle = len(payloads) // 2
+            return await self.deliver_batch(payloads[:middle]) + await self.deliver_batch(payloads[middle:])
+        except Exception as error:
+            return [error] * len(payloads)
+
+    async def deliver(self, payload: dict):
+        """Outbox handler for a single event."""
+        [error] = await self.deliver_batch([payload])
+        if error is not None:
+            raise error
+
+    async def send_event(self, event_name: str, event_data: dict, user_data: dict = None):
+        """
+        Send a single event right away, bypassing the outbox
+        """
+        await self.send_events([self.build_event(event_name, event_data, user_data)])
 
 # Singleton instance
 fb_capi = FacebookCAPIService()
@@ -0,0 +1,85 @@
+import os
+
+import httpx
+
+from outbox import PermanentError
+
+# Base URL of the Graph API; point it at a local stand-in for testing
+FACEBOOK_GRAPH_URL = os.getenv("FACEBOOK_GRAPH_URL", "https://graph.facebook.com").rstrip("/")
+FACEBOOK_API_VERSION = os.getenv("FACEBOOK_API_VERSION", "v19.0")
+GRAPH_TIMEOUT = float(os.getenv("FACEBOOK_GRAPH_TIMEOUT", "10"))
+GRAPH_MAX_CONNECTIONS = int(os.getenv("FACEBOOK_GRAPH_MAX_CONNECTIONS", "10"))
+
+_client: httpx.AsyncClient | None = None
+
+
+def graph_client() -> httpx.AsyncClient:
+    """
+    The keep-alive client shared by every Graph API call. The app lifespan
+    opens it at startup; scripts get one lazily on first use.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=GRAPH_TIMEOUT,
+            limits=httpx.Limits(max_connections=GRAPH_MAX_CONNECTIONS, max_keepalive_connections=GRAPH_MAX_CONNECTIONS),
+        )
+    return _client
+
+
+def use_graph_client(client: httpx.AsyncClient):
+    """Swap the shared client, e.g. for one on an httpx.MockTransport in tests."""
+    global _client
+    _client = client
+
+
+async def close_graph_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def graph_url(path: str) -> str:
+    return f"{FACEBOOK_GRAPH_URL}/{FACEBOOK_API_VERSION}/{path}"
+
+
+# Graph error codes that mean "try again later" whatever the HTTP status:
+# unknown/temporary (1, 2), API and page rate limits (4, 17, 32, 341, 613)
+RETRYABLE_GRAPH_CODES = {1, 2, 4, 17, 32, 341, 613}
+# "Invalid parameter": something in the request body was rejected
+INVALID_PARAMETER_CODE = 100
+
+
+class GraphValidationError(PermanentError):
+    """The Graph API rejected the request's content (as opposed to its credentials)."""
+
+
+def graph_error(response: httpx.Response) -> dict:
+    """The "error" object of a Graph API error body, or {} if there is none."""
+    try:
+        error = response.json().get("error")
+    except (ValueError, AttributeError):
+        return {}
+    return error if isinstance(error, dict) else {}
+
+
+def raise_for_graph_status(response: httpx.Response):
+    """
+    Rate limits, transient errors and server errors are worth retrying. Graph
+    reports throttling with a 400 or 403 and an error code, so the body
+    decides before the status does. Any other 4xx means the request itself is
+    wrong (bad token, bad payload) and never will succeed.
+    """
+    if response.status_code < 400:
+        return
+    message = f"Graph API {response.status_code}: {response.text[:500]}"
+    error = graph_error(response)
+    if (
+        response.status_code == 429 or response.status_code >= 500
+        or error.get("code") in RETRYABLE_GRAPH_CODES or error.get("is_transient") is True
+    ):
+        raise RuntimeError(message)
+    if error.get("code") == INVALID_PARAMETER_CODE:
+        raise GraphValidationError(message)
+    raise PermanentError(message)
@@ -0,0 +1,231 @@
+import asyncio
+import hashlib
+import io
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageCms, ImageOps, UnidentifiedImageError
+
+# Widths of the generated variants; images narrower than a width are never upscaled
+IMAGE_VARIANT_WIDTHS = sorted(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,1024,1600").split(",") if w.strip())
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+# AVIF is ~20-30% smaller than WebP but several times slower to encode
+IMAGE_AVIF = os.getenv("IMAGE_AVIF", "false").lower() in ("1", "true", "yes")
+IMAGE_AVIF_QUALITY = int(os.getenv("IMAGE_AVIF_QUALITY", "55"))
+# Refuse decompression bombs well before they exhaust worker memory
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "50000000"))
+# Processes encoding images (0 = encode in a thread of this process)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(os.cpu_count() or 1, 4))))
+
+BLURHASH_COMPONENTS = (4, 3)
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class ImageWorkersUnavailable(RuntimeError):
+    pass
+
+
+# --- Blurhash (https://blurha.sh) ---
+
+def _base83(value: int, length: int) -> str:
+    return "".join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _to_linear(value: int) -> float:
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+_LINEAR = [_to_linear(v) for v in range(256)]
+
+
+def _to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exp: float) -> float:
+    return math.copysign(abs(value) ** exp, value)
+
+
+def blurhash(image: Image.Image, components: tuple[int, int] = BLURHASH_COMPONENTS) -> str:
+    """
+    Encode a blurhash placeholder. Computed from a 32px thumbnail, which gives
+    the same visual result as the full image at a fraction of the cost.
+    """
+    x_comp, y_comp = components
+    small = image.convert("RGB")
+    small.thumbnail((32, 32), Image.Resampling.BOX)
+    width, height = small.size
+    raw = small.tobytes()
+    linear = [(_LINEAR[raw[k]], _LINEAR[raw[k + 1]], _LINEAR[raw[k + 2]]) for k in range(0, len(raw), 3)]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_comp)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_comp)]
+
+    factors = []
+    for j in range(y_comp):
+        for i in range(x_comp):
+            norm = (1 if i == 0 and j == 0 else 2) / (width * height)
+            r = g = b = 0.0
+            for y in range(height):
+                cy = cos_y[j][y]
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[i][x] * cy
+                    pr, pg, pb = linear[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            factors.append((r * norm, g * norm, b * norm))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_comp - 1) + (y_comp - 1) * 9, 1)
+    if ac:
+        quantised = max(0, min(82, int(max(abs(v) for f in ac for v in f) * 166 - 0.5)))
+        max_value = (quantised + 1) / 166
+        result += _base83(quantised, 1)
+    else:
+        max_value = 1
+        result += _base83(0, 1)
+    result += _base83((_to_srgb(dc[0]) << 16) + (_to_srgb(dc[1]) << 8) + _to_srgb(dc[2]), 4)
+    for f in ac:
+        q = [max(0, min(18, int(_sign_pow(v / max_value, 0.5) * 9 + 9.5))) for v in f]
+        result += _base83(q[0] * 19 * 19 + q[1] * 19 + q[2], 2)
+    return result
+
+
+# --- Variants ---
+
+_SRGB = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB"))
+
+
+def _convert_to_srgb(image: Image.Image, icc: bytes | None) -> Image.Image:
+    """
+    Bring the pixels into sRGB. The variants carry no ICC profile, so browsers
+    read them as sRGB: photos in a wider space (Display P3, Adobe RGB) would
+    otherwise come out dull. Images without a usable profile are left as they are.
+    """
+    if not icc or image.mode not in ("RGB", "RGBA"):
+        return image
+    try:
+        profile = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+        if "srgb" in ImageCms.getProfileDescription(profile).lower():
+            return image
+        return ImageCms.profileToProfile(image, profile, _SRGB, outputMode=image.mode)
+    except (ImageCms.PyCMSError, OSError):
+        return image
+
+
+def _encode(image: Image.Image, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    # Nothing from the source (EXIF, GPS, ICC, XMP) is passed on to the encoder;
+    # the pixels were converted to sRGB beforehand
+    if image_format == "avif":
+        image.save(buffer, "AVIF", quality=IMAGE_AVIF_QUALITY)
+    else:
+        image.save(buffer, "WEBP", quality=IMAGE_WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def process_image(source: str, out_dir: str) -> dict:
+    """
+    Decode the upload at `source` and write its variants into `out_dir`, each
+    named by the hash of its bytes. Runs in a worker process, so only paths
+    and small values cross the process boundary.
+    """
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    try:
+        image = Image.open(source)
+        icc = image.info.get("icc_profile")
+        max_width = IMAGE_VARIANT_WIDTHS[-1]
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale, far faster than full
+        # size. Photos stored sideways (EXIF orientation 5-8) turn their height
+        # into the width.
+        if image.getexif().get(0x0112, 1) >= 5:
+            image.draft("RGB", (max_width * image.width // max(image.height, 1), max_width))
+        else:
+            image.draft("RGB", (max_width, max_width * image.height // max(image.width, 1)))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise InvalidImage(f"Not a supported image: {e}") from None
+
+    image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info else "RGB")
+    image = _convert_to_srgb(image, icc)
+    width, height = image.size
+    # Every configured width below the source's, then the source itself capped at the largest
+    widths = sorted({*(w for w in IMAGE_VARIANT_WIDTHS if w < width), min(width, IMAGE_VARIANT_WIDTHS[-1])})
+    formats = ["avif", "webp"] if IMAGE_AVIF else ["webp"]
+
+    variants = []
+    for variant_width in widths:
+        variant_height = max(1, round(height * variant_width / width))
+        resized = image if variant_width == width else image.resize((variant_width, variant_height), Image.Resampling.LANCZOS)
+        for image_format in formats:
+            data = _encode(resized, image_format)
+            name = f"{hashlib.sha256(data).hexdigest()[:32]}.{image_format}"
+            path = os.path.join(out_dir, name)
+            with open(path, "wb") as out:
+                out.write(data)
+            variants.append({
+                "width": variant_width,
+                "height": variant_height,
+                "format": image_format,
+                "name": name,
+                "path": path,
+                "size": len(data),
+            })
+    return {"width": width, "height": height, "blurhash": blurhash(image), "variants": variants}
+
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _executor
+
+
+async def process_upload(source: str, out_dir: str) -> dict:
+    """
+    Build the variants off the event loop: in the process pool, or in a thread
+    when IMAGE_WORKERS=0.
+    A worker that died (OOM kill, segfault in a codec) breaks the whole pool:
+    it is replaced and the upload tried once more before giving up with
+    ImageWorkersUnavailable.
+    """
+    if IMAGE_WORKERS <= 0:
+        return await asyncio.to_thread(process_image, source, out_dir)
+    loop = asyncio.get_running_loop()
+    for _ in range(2):
+        pool = _pool()
+        try:
+            return await loop.run_in_executor(pool, process_image, source, out_dir)
+        except BrokenProcessPool:
+            _discard_pool(pool)
+    raise ImageWorkersUnavailable("Image processing is unavailable, please try again")
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    global _executor
+    # Concurrent uploads see the same broken pool; only the first replaces it
+    if _executor is pool:
+        _executor = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
@@ -1,10 +1,21 @@
 import os
 import shutil
-import uuid
+import hashlib
 import asyncio
-from fastapi import UploadFile
+import contextlib
+import tempfile
+from datetime import datetime, timedelta
+from fastapi import HTTPException, UploadFile, status
 import cloudinary
 import cloudinary.uploader
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import StoredBlob, Product, Category, Brand, SiteSetting
+from services.images import ImageWorkersUnavailable, InvalidImage, process_upload
+from static_files import PRECOMPRESSED_SUFFIXES
 
 # Configure Cloudinary
 # If these env vars are missing, we fall back to local storage
@@ -22,51 +33,302 @@ if USE_CLOUD:
         secure = True
     )
 
+CLOUDINARY_FOLDER = "the-set-web"
+# Uploads and deletions must name the same type; a public id is only unique within one
+CLOUDINARY_RESOURCE_TYPE = "image"
+
 # Local storage setup
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Go up one level from services/
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Scratch space for uploads being processed; on the same filesystem as
+# UPLOAD_DIR so finished files are moved into place, not copied
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR", os.path.join(BASE_DIR, ".upload_tmp"))
+
+# Uploads are read in chunks of this size, so memory per upload is bounded
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+# Uploads processed at once by this process; more get a 429
+UPLOAD_MAX_CONCURRENT = int(os.getenv("UPLOAD_MAX_CONCURRENT", "4"))
+# Cloudinary's minimum chunk size for chunked uploads
+CLOUDINARY_CHUNK_SIZE = 6 * 1024 * 1024
+
+# Leading bytes of the formats the image pipeline accepts
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"BM", "bmp"),
+]
+
+MIME_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+
+def build_manifest(processed: dict, urls: list[str]) -> dict:
+    """
+    Upload response: `url` (the largest WebP, what product.image_url stores),
+    plus srcset strings per format for <picture>/<img srcset>.
+    """
+    variants = [
+        {"url": url, "width": v["width"], "height": v["height"], "format": v["format"]}
+        for v, url in zip(processed["variants"], urls)
+    ]
+    sources = {}
+    for v in variants:
+        sources.setdefault(MIME_TYPES[v["format"]], []).append(f"{v['url']} {v['width']}w")
+    webp = [v for v in variants if v["format"] == "webp"]
+    return {
+        "url": webp[-1]["url"],
+        "width": processed["width"],
+        "height": processed["height"],
+        "blurhash": processed["blurhash"],
+        "srcset": ", ".join(sources["image/webp"]),
+        "sources": {mime: ", ".join(entries) for mime, entries in sources.items()},
+        "variants": variants,
+    }
+
+
+def blob_name(url: str) -> str:
+    # Last path segment: the stored file name locally, public_id.ext on Cloudinary
+    return url.rsplit("/", 1)[-1].split("?", 1)[0]
+
+
+def sniff_image_type(head: bytes) -> str | None:
+    for signature, kind in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "avif"
+    return None
+
+
+def too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+        detail=f"File too large (max {UPLOAD_MAX_BYTES // (1024 * 1024)} MB)",
+    )
+
+
+_uploads_in_progress = 0
+
+
+@contextlib.contextmanager
+def upload_slot():
+    """
+    Admit one upload, or answer 429 when UPLOAD_MAX_CONCURRENT are already in progress.
+    """
+    global _uploads_in_progress
+    if _uploads_in_progress >= UPLOAD_MAX_CONCURRENT:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many uploads in progress, please retry shortly",
+            headers={"Retry-After": "2"},
+        )
+    _uploads_in_progress += 1
+    try:
+        yield
+    finally:
+        _uploads_in_progress -= 1
+
+
+async def spool_upload(file: UploadFile, work_dir: str) -> tuple[str, str, int]:
+    """
+    Copy the upload into work_dir chunk by chunk, hashing as it goes.
+    Stops at the first chunk that is not an image or goes over the size limit.
+    Returns (path, sha256, size).
+    """
+    await file.seek(0)
+    path = os.path.join(work_dir, "source")
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as out:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            if size == 0 and sniff_image_type(chunk[:16]) is None:
+                raise HTTPException(
+                    status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                    detail="Only JPEG, PNG, GIF, WebP, AVIF, TIFF and BMP images can be uploaded",
+                )
+            size += len(chunk)
+            if size > UPLOAD_MAX_BYTES:
+                raise too_large()
+            digest.update(chunk)
+            await asyncio.to_thread(out.write, chunk)
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Empty file")
+    return path, digest.hexdigest(), size
+
 
 class StorageService:
     @staticmethod
-    async def upload_file(file: UploadFile, base_url: str = "http://localhost:8000") -> str:
+    async def upload_file(file: UploadFile, base_url: str = "http://localhost:8000", db: AsyncSession = None) -> dict:
         """
-        Uploads a file to Cloudinary (if configured) or Local Storage.
-        Returns the public URL of the uploaded file.
+        Resizes an uploaded image into WebP (and optionally AVIF) variants and
+        stores them on Cloudinary (if configured) or Local Storage.
+        Files are content-addressed: a file uploaded before returns its stored
+        manifest without being processed or stored again.
+        Returns the manifest from build_manifest.
         """
-        if USE_CLOUD:
-            return await StorageService._upload_to_cloudinary(file)
-        else:
-            return await StorageService._upload_local(file, base_url)
+        os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+        work_dir = tempfile.mkdtemp(dir=UPLOAD_TMP_DIR)
+        try:
+            source, digest, size = await spool_upload(file, work_dir)
+
+            if db is not None:
+                manifest = await StorageService._reuse(db, digest)
+                if manifest is not None:
+                    return manifest
+
+            try:
+                processed = await process_upload(source, work_dir)
+            except InvalidImage as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except ImageWorkersUnavailable as e:
+                raise HTTPException(status_code=503, detail=str(e))
+
+            if USE_CLOUD:
+                store = StorageService._upload_to_cloudinary
+            else:
+                store = lambda variant: StorageService._upload_local(variant, base_url)
+            urls = await asyncio.gather(*[store(v) for v in processed["variants"]])
+        finally:
+            await asyncio.to_thread(shutil.rmtree, work_dir, True)
+        manifest = build_manifest(processed, urls)
+
+        if db is not None:
+            db.add(StoredBlob(hash=digest, url=manifest["url"], manifest=manifest, size=size))
+            try:
+                await db.commit()
+            except IntegrityError:
+                # The same file was uploaded concurrently and stored first by the other request
+                await db.rollback()
+                return await StorageService._reuse(db, digest) or manifest
+        return manifest
+
+    @staticmethod
+    async def _reuse(db: AsyncSession, digest: str) -> dict | None:
+        result = await db.execute(
+            update(StoredBlob)
+            .where(StoredBlob.hash == digest)
+            .values(upload_count=StoredBlob.upload_count + 1)
+            .returning(StoredBlob.manifest)
+        )
+        manifest = result.scalar()
+        await db.commit()
+        return manifest
 
     @staticmethod
-    async def _upload_to_cloudinary(file: UploadFile) -> str:
-        # Read file into memory
-        content = await file.read()
-        
+    async def _upload_to_cloudinary(variant: dict) -> str:
         def upload_sync():
-            # Cloudinary upload accepts file-like object or byte array
-            response = cloudinary.uploader.upload(content, folder="the-set-web")
+            # Streams the file from disk in chunks. The public id is the
+            # content hash, so an existing asset is left as it is.
+            response = cloudinary.uploader.upload_large(
+                variant["path"],
+                folder=CLOUDINARY_FOLDER,
+                public_id=os.path.splitext(variant["name"])[0],
+                # upload_large would otherwise store the file as "raw"
+                resource_type=CLOUDINARY_RESOURCE_TYPE,
+                overwrite=False,
+                chunk_size=CLOUDINARY_CHUNK_SIZE,
+            )
             return response["secure_url"]
 
         # Run blocking upload in thread
         return await asyncio.to_thread(upload_sync)
 
     @staticmethod
-    async def _upload_local(file: UploadFile, base_url: str) -> str:
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-        
-        # Reset file cursor just in case
-        await file.seek(0)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        if not base_url or "localhost" in base_url and not USE_CLOUD:
-            # If no base_url provided or still pointing to localhost in production, 
-            # we might want to return a relative path or try to get the real URL
-            pass
-
-        return f"{base_url.rstrip('/')}/static/{unique_filename}"
+    async def _upload_local(variant: dict, base_url: str) -> str:
+        file_path = os.path.join(UPLOAD_DIR, variant["name"])
+
+        def move_sync():
+            # Same name means same bytes, so an existing file is already right.
+            # The move is a rename, so readers never see a partial file.
+            if not os.path.exists(file_path):
+                shutil.move(variant["path"], file_path)
+
+        await asyncio.to_thread(move_sync)
+        return f"{base_url.rstrip('/')}/static/{variant['name']}"
+
+
+async def referenced_names(db: AsyncSession) -> set[str]:
+    """
+    File names referenced anywhere an image URL is kept: products (main and
+    additional images), categories, brand logos and site settings.
+    """
+    names = set()
+    result = await db.execute(select(Product.image_url, Product.additional_images))
+    for image_url, additional in result:
+        for url in [image_url, *(additional or [])]:
+            if url:
+                names.add(blob_name(url))
+    for column in (Category.image_url, Brand.logo_url):
+        result = await db.execute(select(column).where(column.is_not(None)))
+        names.update(blob_name(url) for url in result.scalars())
+    # Settings hold free-form values (JSON, HTML); anything that looks like a file name counts
+    result = await db.execute(select(SiteSetting.value))
+    for value in result.scalars():
+        for token in (value or "").replace('"', " ").replace("'", " ").split():
+            names.add(blob_name(token))
+    return names
+
+
+async def collect_garbage(db: AsyncSession, min_age: timedelta = timedelta(hours=24), dry_run: bool = False) -> dict:
+    """
+    Delete stored blobs that nothing references. Uploads younger than min_age
+    are kept: they may be about to be attached to a product. Local files
+    outside the blob index (uploads from before content addressing) are
+    collected the same way.
+    """
+    referenced = await referenced_names(db)
+    cutoff = datetime.utcnow() - min_age
+    keep_files, doomed = set(), []
+
+    for blob in (await db.execute(select(StoredBlob))).scalars():
+        files = {blob_name(v["url"]) for v in blob.manifest["variants"]}
+        if files & referenced or blob.created_at > cutoff:
+            keep_files |= files
+        else:
+            doomed.append((blob, files))
+
+    deleted_files = set()
+    for blob, files in doomed:
+        # Identical variants of different uploads share a file
+        deleted_files |= files - keep_files
+        if not dry_run:
+            await db.delete(blob)
+
+    if not USE_CLOUD:
+        names = set(os.listdir(UPLOAD_DIR))
+        for name in names:
+            path = os.path.join(UPLOAD_DIR, name)
+            if (
+                not name.endswith(PRECOMPRESSED_SUFFIXES)
+                and name not in referenced and name not in keep_files and os.path.isfile(path)
+                and datetime.utcfromtimestamp(os.path.getmtime(path)) < cutoff
+            ):
+                deleted_files.add(name)
+        # Precompressed copies (x.svg.br, x.svg.gz) go with the file they were made from
+        for name in names:
+            if name.endswith(PRECOMPRESSED_SUFFIXES):
+                original = name.rsplit(".", 1)[0]
+                if original in deleted_files or original not in names:
+                    deleted_files.add(name)
+
+    if not dry_run:
+        for name in deleted_files:
+            if USE_CLOUD:
+                await asyncio.to_thread(
+                    cloudinary.uploader.destroy, f"{CLOUDINARY_FOLDER}/{os.path.splitext(name)[0]}",
+                    resource_type=CLOUDINARY_RESOURCE_TYPE,
+                )
+            else:
+                try:
+                    os.remove(os.path.join(UPLOAD_DIR, name))
+                except FileNotFoundError:
+                    pass
+        await db.commit()
+    return {"blobs": len(doomed), "files": sorted(deleted_files)}
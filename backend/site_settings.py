@@ -0,0 +1,101 @@
+import os
+import time
+from types import MappingProxyType
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from cache import TableVersions, table_versions
+from http_cache import content_etag
+from models import SiteSetting
+
+# Upper bound on a snapshot's age, in case an invalidation from another
+# process is lost; writes retire it straight away
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "300"))
+
+
+async def upsert_settings(db: AsyncSession, values: dict[str, str]):
+    """
+    Insert or update every setting in a single INSERT .. ON CONFLICT.
+    """
+    if not values:
+        return
+    insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    # Keys in order, so concurrent writers lock rows in the same order
+    statement = insert(SiteSetting).values([{"key": k, "value": values[k]} for k in sorted(values)])
+    statement = statement.on_conflict_do_update(
+        index_elements=[SiteSetting.key],
+        set_={"value": statement.excluded.value},
+    )
+    await db.execute(statement)
+
+
+class SettingsSnapshot:
+    """
+    Read-only view of every setting, tagged with the settings table version it
+    was built from. Never modified: a write builds a new one and swaps it in.
+    """
+    def __init__(self, values: dict[str, str], version: tuple, ttl: float = SETTINGS_CACHE_TTL):
+        self.values = MappingProxyType(dict(values))
+        self.items = tuple({"key": k, "value": v} for k, v in self.values.items())
+        self.version = version
+        self.expires_at = time.monotonic() + ttl
+        self.etag = content_etag(self.items)
+
+
+class SettingsStore:
+    """
+    Process-wide settings snapshot. Reads are a dict lookup while the snapshot
+    matches the settings table version and is younger than the TTL; any bump of
+    that version (a write here, or an invalidation from another process) makes
+    the next read reload it. Callers pass a primary session: a snapshot loaded
+    from a lagging replica would be served until the next write.
+    """
+    def __init__(self, versions: TableVersions = table_versions, ttl: float = SETTINGS_CACHE_TTL):
+        self.versions = versions
+        self.ttl = ttl
+        self._snapshot: SettingsSnapshot | None = None
+
+    def current(self) -> SettingsSnapshot | None:
+        snapshot = self._snapshot
+        if (
+            snapshot is not None and snapshot.version == self.versions.get("settings")
+            and snapshot.expires_at > time.monotonic()
+        ):
+            return snapshot
+        return None
+
+    async def get(self, db: AsyncSession) -> SettingsSnapshot:
+        snapshot = self.current()
+        if snapshot is None:
+            version = self.versions.get("settings")
+            result = await db.execute(select(SiteSetting.key, SiteSetting.value).order_by(SiteSetting.key))
+            # Tagged with the version from before the load, so a write that
+            # lands meanwhile leaves this snapshot already stale
+            snapshot = SettingsSnapshot(dict(result.all()), version, self.ttl)
+            self._snapshot = snapshot
+        return snapshot
+
+    async def update(self, db: AsyncSession, values: dict[str, str]) -> SettingsSnapshot:
+        """
+        Upsert `values`, commit, and publish the new snapshot.
+        """
+        base = await self.get(db)
+        await upsert_settings(db, values)
+        await db.commit()
+        # No await from here on, so the check, bump and swap happen as one step
+        unchanged = base.version == self.versions.get("settings")
+        self.versions.bump("settings")
+        if not unchanged:
+            # Another write landed while ours was in flight; read back both
+            return await self.get(db)
+        snapshot = SettingsSnapshot(dict(sorted({**base.values, **values}.items())), self.versions.get("settings"), self.ttl)
+        self._snapshot = snapshot
+        return snapshot
+
+    def clear(self):
+        self._snapshot = None
+
+
+settings_store = SettingsStore()
@@ -0,0 +1,88 @@
+import os
+import re
+import stat
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+# Uploads named by the hash of their bytes (services/storage.py) never change,
+# so browsers and a CDN may keep them forever. Anything else gets a short TTL.
+STATIC_CACHE_CONTROL_IMMUTABLE = os.getenv("STATIC_CACHE_CONTROL_IMMUTABLE", "public, max-age=31536000, immutable")
+STATIC_CACHE_CONTROL = os.getenv("STATIC_CACHE_CONTROL", "public, max-age=3600")
+
+CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{32}\.[a-z0-9]+$")
+
+# Precompressed siblings, best first: x.svg -> x.svg.br / x.svg.gz
+PRECOMPRESSED = [("br", ".br"), ("gzip", ".gz")]
+PRECOMPRESSED_SUFFIXES = tuple(suffix for _, suffix in PRECOMPRESSED)
+
+
+def cache_control(path: str) -> str:
+    if CONTENT_ADDRESSED.match(os.path.basename(path)):
+        return STATIC_CACHE_CONTROL_IMMUTABLE
+    return STATIC_CACHE_CONTROL
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        name, _, q = params.strip().partition("=")
+        try:
+            weight = float(q) if name.strip() == "q" else 1.0
+        except ValueError:
+            weight = 1.0
+        if coding.strip() and weight > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles with Cache-Control per file, and .br/.gz siblings (written by
+    scripts/precompress_uploads.py) served in place of the file when the
+    client accepts them. Range requests and conditional GETs are handled by
+    Starlette's FileResponse, which also hands the file to the server for
+    zero-copy sending when the server supports the ASGI pathsend extension.
+    """
+
+    def _find_precompressed(self, path: str, encodings: set[str]):
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            return None
+        for encoding, suffix in PRECOMPRESSED:
+            if encoding not in encodings:
+                continue
+            sibling = full_path + suffix
+            try:
+                sibling_stat = os.stat(sibling)
+            except OSError:
+                continue
+            # A sibling older than its file was made from a previous version
+            if stat.S_ISREG(sibling_stat.st_mode) and sibling_stat.st_mtime >= stat_result.st_mtime:
+                return sibling, sibling_stat, encoding
+        return None
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        headers = Headers(scope=scope)
+        found = None
+        # Byte ranges are always of the file itself, never of a compressed copy
+        if scope["method"] in ("GET", "HEAD") and "range" not in headers:
+            encodings = accepted_encodings(headers.get("accept-encoding", ""))
+            if encodings:
+                found = await anyio.to_thread.run_sync(self._find_precompressed, path, encodings)
+
+        if found is not None:
+            full_path, stat_result, encoding = found
+            response = self.file_response(full_path, stat_result, scope)
+            if isinstance(response, FileResponse):
+                response.headers["Content-Encoding"] = encoding
+        else:
+            response = await super().get_response(path, scope)
+
+        response.headers["Cache-Control"] = cache_control(path)
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
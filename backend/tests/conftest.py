@@ -17,6 +17,10 @@ engine = create_async_engine(
 )
 TestingSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Same SQL/pool instrumentation as the application engine
+import metrics
+metrics.instrument_engine(engine)
+
 @pytest_asyncio.fixture(scope="function")
 async def db_session():
     """Create a fresh database session for each test."""
@@ -36,6 +40,14 @@ async def client(db_session):
         yield db_session
 
     app.dependency_overrides[get_db] = override_get_db
+
+    # Every test starts on an empty database, so drop anything cached by the last one
+    from cache import catalog_cache
+    from auth import user_cache
+    from site_settings import settings_store
+    catalog_cache.clear()
+    user_cache.clear()
+    settings_store.clear()
     
     from httpx import ASGITransport
     transport = ASGITransport(app=app)
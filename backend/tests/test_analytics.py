@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import update
+
+import analytics
+from analytics import rebuild_rollups
+from models import Brand, Category, Product, Order
+
+customer = {
+    "email": "buyer@test.com", "firstName": "T", "lastName": "B",
+    "address": "1 Avenue", "city": "Fes", "country": "MA", "zip": "30000"
+}
+
+
+async def _seed(db):
+    rings, watches = Category(name="Rings"), Category(name="Watches")
+    brand = Brand(name="Atlas")
+    db.add_all([rings, watches, brand])
+    await db.flush()
+    ring = Product(name="Ring", price=100.0, stock=50, category_id=rings.id, brand_id=brand.id)
+    watch = Product(name="Watch", price=250.0, stock=50, category_id=watches.id)
+    db.add_all([ring, watch])
+    await db.flush()
+    ids = ring.id, watch.id
+    await db.commit()
+    return ids
+
+
+@pytest.mark.asyncio
+async def test_orders_update_rollups_and_backfill_matches(client: AsyncClient, db_session, admin_token):
+    ring, watch = await _seed(db_session)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    for items in (
+        [{"product_id": ring, "quantity": 2}, {"product_id": watch, "quantity": 1}],
+        [{"product_id": ring, "quantity": 1}],
+    ):
+        response = await client.post("/orders/", json={"items": items, **customer})
+        assert response.status_code == 200
+
+    response = await client.get("/analytics/sales", headers=headers)
+    [today] = response.json()
+    assert (today["orders"], today["units"], today["revenue"]) == (2, 4, 550.0)
+
+    response = await client.get("/analytics/sales?group_by=product", headers=headers)
+    assert [(r["name"], r["orders"], r["units"], r["revenue"]) for r in response.json()] == [
+        ("Ring", 2, 3, 300.0), ("Watch", 1, 1, 250.0)
+    ]
+    response = await client.get("/analytics/sales?group_by=brand", headers=headers)
+    assert [(r["id"] is None, r["name"], r["revenue"]) for r in response.json()] == [
+        (False, "Atlas", 300.0), (True, None, 250.0)
+    ]
+    incremental = (await client.get("/analytics/sales?group_by=category", headers=headers)).json()
+
+    # Rebuilding from the order tables gives the same numbers, in small batches too
+    await rebuild_rollups(db_session, batch_size=1)
+    assert (await client.get("/analytics/sales?group_by=category", headers=headers)).json() == incremental
+
+
+@pytest.mark.asyncio
+async def test_sales_by_day_respects_the_date_range(client: AsyncClient, db_session, admin_token):
+    ring, _ = await _seed(db_session)
+    for _ in range(3):
+        await client.post("/orders/", json={"items": [{"product_id": ring, "quantity": 1}], **customer})
+    # Move two orders into the past and rebuild
+    await db_session.execute(update(Order).where(Order.id <= 2).values(created_at=datetime(2024, 5, 1, 23, 59)))
+    await db_session.commit()
+    await rebuild_rollups(db_session)
+
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await client.get("/analytics/sales?date_from=2024-05-01&date_to=2024-05-31", headers=headers)
+    assert response.json() == [{"day": "2024-05-01", "id": None, "name": None, "orders": 2, "units": 2, "revenue": 200.0}]
+
+    response = await client.get("/analytics/sales", headers=headers)
+    assert [r["orders"] for r in response.json()] == [2, 1]
+    # A limit keeps the most recent days
+    response = await client.get("/analytics/sales?limit=1", headers=headers)
+    assert [r["orders"] for r in response.json()] == [1]
+
+
+@pytest.mark.asyncio
+async def test_sales_analytics_is_admin_only(client: AsyncClient, regular_user_token):
+    response = await client.get("/analytics/sales", headers={"Authorization": f"Bearer {regular_user_token}"})
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_rebuild_counts_orders_placed_mid_run_once(client: AsyncClient, db_session, admin_token, monkeypatch):
+    ring, _ = await _seed(db_session)
+    order = {"items": [{"product_id": ring, "quantity": 1}], **customer}
+    for _ in range(2):
+        await client.post("/orders/", json=order)
+
+    # An order arrives (and updates the live rollups) while the rebuild is on its first batch
+    orders_rollup = analytics._orders_rollup
+    placed = []
+
+    async def place_order_mid_run(db, orders):
+        if not placed:
+            placed.append((await client.post("/orders/", json=order)).status_code)
+        return await orders_rollup(db, orders)
+
+    monkeypatch.setattr(analytics, "_orders_rollup", place_order_mid_run)
+    assert await rebuild_rollups(db_session, batch_size=1) == 3
+    assert placed == [200]
+
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    [today] = (await client.get("/analytics/sales", headers=headers)).json()
+    assert (today["orders"], today["units"], today["revenue"]) == (3, 3, 300.0)
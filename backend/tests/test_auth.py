@@ -25,3 +25,47 @@ async def test_protected_route_access(client: AsyncClient, admin_token):
     # Access without token
     response = await client.get("/users/")
     assert response.status_code == 401
+
+@pytest.mark.asyncio
+async def test_authenticated_user_is_cached(client: AsyncClient, admin_token):
+    from auth import user_cache
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    await client.get("/users/me", headers=headers)
+    hits = user_cache.hits
+    response = await client.get("/users/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["username"] == "pytest_admin"
+    assert user_cache.hits == hits + 1
+
+@pytest.mark.asyncio
+async def test_user_changes_apply_despite_cache(client: AsyncClient, admin_token, regular_user_token):
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    user_headers = {"Authorization": f"Bearer {regular_user_token}"}
+    me = await client.get("/users/me", headers=user_headers)
+    user_id = me.json()["id"]
+
+    # Deactivation is visible on the very next request
+    await client.put(f"/users/{user_id}", json={"is_active": False}, headers=admin_headers)
+    response = await client.get("/users/me", headers=user_headers)
+    assert response.status_code == 400
+    await client.put(f"/users/{user_id}", json={"is_active": True}, headers=admin_headers)
+    assert (await client.get("/users/me", headers=user_headers)).status_code == 200
+
+    # A password change revokes tokens issued with the old password
+    await client.put(f"/users/{user_id}/password", json={"password": "new-secret"}, headers=admin_headers)
+    response = await client.get("/users/me", headers=user_headers)
+    assert response.status_code == 401
+
+    response = await client.post("/token", data={"username": "user", "password": "new-secret"})
+    new_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert (await client.get("/users/me", headers=new_headers)).status_code == 200
+
+@pytest.mark.asyncio
+async def test_login_rejected_fast_when_hashing_saturated(client: AsyncClient, admin_token, monkeypatch):
+    import auth
+    monkeypatch.setattr(auth, "PASSWORD_HASH_MAX_PENDING", 0)
+
+    response = await client.post("/token", data={"username": "pytest_admin", "password": "admin123"})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
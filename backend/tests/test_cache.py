@@ -0,0 +1,45 @@
+import pytest
+from httpx import AsyncClient
+
+from cache import ReadCache, TableVersions, catalog_cache
+
+
+@pytest.mark.asyncio
+async def test_catalog_served_from_cache_until_write(client: AsyncClient, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    await client.post("/categories/", json={"name": "Rings"}, headers=headers)
+    await client.post("/products/", json={"name": "Ring", "price": 50, "stock": 2, "category_id": 1}, headers=headers)
+
+    first = await client.get("/catalog/")
+    misses = catalog_cache.misses
+    second = await client.get("/catalog/")
+    assert second.json() == first.json()
+    assert catalog_cache.misses == misses
+    assert catalog_cache.hits >= 1
+
+    # A write bumps the products version, so the next read goes to the database
+    await client.put("/products/1", json={"price": 75}, headers=headers)
+    third = await client.get("/catalog/")
+    assert third.json()[0]["price"] == 75
+    assert catalog_cache.misses == misses + 1
+
+    stats = await client.get("/cache/stats", headers=headers)
+    assert stats.status_code == 200
+    assert stats.json()["catalog"]["hits"] == catalog_cache.hits
+
+
+@pytest.mark.asyncio
+async def test_read_cache_lru_and_versions():
+    cache = ReadCache(maxsize=2, ttl=60, versions=TableVersions())
+    cache.set("a", ("products",), 1)
+    cache.set("b", ("brands",), 2)
+    assert cache.get("a", ("products",)) == 1
+
+    # "b" is now least recently used and gets evicted
+    cache.set("c", ("products",), 3)
+    assert cache.get("b", ("brands",)) is None
+    assert cache.evictions == 1
+
+    cache.invalidate("products")
+    assert cache.get("a", ("products",)) is None
+    assert cache.get("c", ("products",)) is None
@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database import engine_options, configure_sqlite, pool_report
+
+
+def test_engine_options_size_the_pool_except_for_memory_sqlite():
+    memory = engine_options("sqlite+aiosqlite://")
+    assert "pool_size" not in memory
+    assert memory["connect_args"]["check_same_thread"] is False
+
+    file_db = engine_options("sqlite+aiosqlite:///./pos.db")
+    assert file_db["pool_size"] >= 1
+    assert file_db["pool_pre_ping"] is True
+
+    postgres = engine_options("postgresql+asyncpg://u:p@db/shop")
+    assert postgres["connect_args"]["prepared_statement_cache_size"] > 0
+    assert "pool_recycle" in postgres
+
+
+@pytest.mark.asyncio
+async def test_file_sqlite_uses_wal_and_busy_timeout(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'wal.db'}"
+    engine = create_async_engine(url, **engine_options(url))
+    configure_sqlite(engine)
+    async with engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+        assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() > 0
+    report = pool_report(engine)
+    assert report["pool"] == "AsyncAdaptedQueuePool"
+    assert "pool_size" in report
+    await engine.dispose()
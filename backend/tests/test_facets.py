@@ -0,0 +1,65 @@
+import pytest
+from httpx import AsyncClient
+
+from models import Product
+
+
+@pytest.mark.asyncio
+async def test_catalog_filters_and_facets(client: AsyncClient, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    await client.post("/categories/", json={"name": "Rings"}, headers=headers)
+    await client.post("/categories/", json={"name": "Watches"}, headers=headers)
+    products = [
+        {"name": "Ring A", "price": 80, "stock": 3, "category_id": 1},
+        {"name": "Ring B", "price": 450, "stock": 0, "category_id": 1},
+        {"name": "Ring C", "price": 1500, "stock": 1, "category_id": 1},
+        {"name": "Watch A", "price": 2500, "stock": 2, "category_id": 2},
+    ]
+    for product in products:
+        await client.post("/products/", json=product, headers=headers)
+
+    response = await client.get("/catalog/", params={"category_id": 1, "min_price": 100, "in_stock": True})
+    assert [p["name"] for p in response.json()] == ["Ring C"]
+
+    response = await client.get("/catalog/", params=[("category_id", 1), ("category_id", 2), ("max_price", 500)])
+    assert [p["name"] for p in response.json()] == ["Ring A", "Ring B"]
+
+    response = await client.get("/catalog/facets", params={"category_id": 1, "in_stock": True})
+    assert response.status_code == 200
+    facets = response.json()
+    assert facets["total"] == 2
+    # Category counts ignore the category filter itself but respect the others
+    assert {f["value"]: f["count"] for f in facets["categories"]} == {1: 2, 2: 1}
+    # Stock counts ignore the stock filter but respect the category
+    assert (facets["in_stock"], facets["out_of_stock"]) == (2, 1)
+    assert [(r["min"], r["count"]) for r in facets["price_ranges"]] == [(0, 1), (1000, 1)]
+
+
+@pytest.mark.asyncio
+async def test_price_ranges_skip_unpriced_products(client: AsyncClient, db_session):
+    db_session.add_all([Product(name="Priced", price=20, stock=1), Product(name="Unpriced", price=None, stock=1)])
+    await db_session.commit()
+
+    facets = (await client.get("/catalog/facets")).json()
+    assert facets["total"] == 2
+    assert [(r["min"], r["count"]) for r in facets["price_ranges"]] == [(0, 1)]
+
+
+@pytest.mark.asyncio
+async def test_catalog_can_return_its_facets(client: AsyncClient, db_session):
+    db_session.add_all([Product(name="Ring", price=80, stock=1), Product(name="Watch", price=2500, stock=0)])
+    await db_session.commit()
+
+    plain = await client.get("/catalog/", params={"in_stock": True})
+    assert [p["name"] for p in plain.json()] == ["Ring"]
+
+    response = await client.get("/catalog/", params={"in_stock": True, "include_facets": True})
+    body = response.json()
+    assert body["items"] == plain.json()
+    assert body["facets"] == (await client.get("/catalog/facets", params={"in_stock": True})).json()
+    assert (body["facets"]["in_stock"], body["facets"]["out_of_stock"]) == (1, 1)
+    # Its own validator, covering both parts
+    assert response.headers["etag"] != plain.headers["etag"]
+    revalidate = {"If-None-Match": response.headers["etag"]}
+    again = await client.get("/catalog/", params={"in_stock": True, "include_facets": True}, headers=revalidate)
+    assert again.status_code == 304
@@ -0,0 +1,59 @@
+import pytest
+from httpx import AsyncClient
+
+import fast_json
+from cache import catalog_cache
+from fast_json import to_dict
+from models import Brand, Category, Product
+from schemas import ProductResponseFull
+
+customer = {
+    "email": "buyer@test.com", "firstName": "Test", "lastName": "Buyer",
+    "address": "1 Avenue", "city": "Casablanca", "country": "MA", "zip": "20000"
+}
+
+
+def test_to_dict_matches_validated_model():
+    category = Category(id=1, name="Watches")
+    product = Product(
+        id=7, name="Watch", price=250.0, stock=2, specs={"case": "steel"}, additional_images=["/static/a.webp"],
+        category_id=1, brand_id=None, category=category, brand=None,
+    )
+    expected = ProductResponseFull.model_validate(product).model_dump(mode="json")
+    assert to_dict(ProductResponseFull, product) == expected
+
+
+@pytest.mark.asyncio
+async def test_fast_path_returns_the_same_json(client: AsyncClient, db_session, admin_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    category = Category(name="Watches")
+    brand = Brand(name="Tissot")
+    db_session.add_all([category, brand])
+    await db_session.flush()
+    db_session.add_all([
+        Product(name=f"Watch {i}", price=100 + i, stock=5, category_id=category.id, brand_id=brand.id,
+                description="Sapphire", specs={"size": i})
+        for i in range(3)
+    ])
+    await db_session.commit()
+    await client.post("/orders/", json={"items": [{"product_id": 1, "quantity": 1}], **customer}, headers=headers)
+    await client.post("/wishlist/", json={"product_id": 2}, headers=headers)
+
+    paths = ["/catalog/?limit=2", "/catalog/search?q=watch", "/products/?limit=2", "/orders/", "/wishlist/"]
+    slow = {}
+    for path in paths:
+        slow[path] = await client.get(path, headers=headers)
+
+    monkeypatch.setattr(fast_json, "FAST_JSON", True)
+    catalog_cache.clear()
+    for path in paths:
+        fast = await client.get(path, headers=headers)
+        assert fast.status_code == 200
+        assert fast.json() == slow[path].json(), path
+        for header in ("x-next-cursor", "etag", "cache-control"):
+            assert fast.headers.get(header) == slow[path].headers.get(header), (path, header)
+
+    # Cursor pages still chain on the fast path
+    cursor = slow["/catalog/?limit=2"].headers["x-next-cursor"]
+    response = await client.get(f"/catalog/?limit=2&cursor={cursor}")
+    assert [p["name"] for p in response.json()] == ["Watch 2"]
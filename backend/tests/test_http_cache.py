@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+from httpx import AsyncClient
+
+from cache import table_versions
+
+
+@pytest.mark.asyncio
+async def test_catalog_conditional_get(client: AsyncClient, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    await client.post("/categories/", json={"name": "Watches"}, headers=headers)
+    await client.post("/products/", json={"name": "Watch", "price": 900, "stock": 1, "category_id": 1}, headers=headers)
+
+    response = await client.get("/catalog/")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"]
+
+    response = await client.get("/catalog/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    # Weak validators and lists of tags are accepted too
+    response = await client.get("/catalog/", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert response.status_code == 304
+
+    await client.put("/products/1", json={"stock": 0}, headers=headers)
+    response = await client.get("/catalog/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()[0]["stock"] == 0
+
+
+@pytest.mark.asyncio
+async def test_settings_conditional_get(client: AsyncClient):
+    response = await client.get("/settings/")
+    etag = response.headers["etag"]
+    assert (await client.get("/settings/", headers={"If-None-Match": etag})).status_code == 304
+
+    await client.put("/settings/", json=[{"key": "hero_title", "value": "Maison"}])
+    response = await client.get("/settings/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == [{"key": "hero_title", "value": "Maison"}]
+
+
+@pytest.mark.asyncio
+async def test_last_modified_is_withheld_until_its_second_is_over(client: AsyncClient, monkeypatch):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    # A write in the current second: a second one could land in it too
+    monkeypatch.setitem(table_versions._modified, "brands", now + timedelta(seconds=5))
+    response = await client.get("/brands/")
+    assert "last-modified" not in response.headers
+    stamp = format_datetime(now, usegmt=True)
+    assert (await client.get("/brands/", headers={"If-Modified-Since": stamp})).status_code == 200
+
+    earlier = now - timedelta(seconds=10)
+    monkeypatch.setitem(table_versions._modified, "brands", earlier)
+    response = await client.get("/brands/")
+    assert response.headers["last-modified"] == format_datetime(earlier, usegmt=True)
+    since = {"If-Modified-Since": response.headers["last-modified"]}
+    assert (await client.get("/brands/", headers=since)).status_code == 304
+    # The ETag decides when both are sent
+    both = {**since, "If-None-Match": '"stale"'}
+    assert (await client.get("/brands/", headers=both)).status_code == 200
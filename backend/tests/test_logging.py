@@ -0,0 +1,30 @@
+import json
+import logging
+
+import log_config
+from log_config import JsonFormatter, log_request, _parse_sample_rates
+
+
+def test_sample_rates_use_longest_prefix(monkeypatch):
+    monkeypatch.setattr(log_config, "LOG_SAMPLE_RATES", _parse_sample_rates("/catalog/=0.1, /catalog/search=1,/static/=0"))
+    assert log_config.sample_rate("/catalog/search") == 1.0
+    assert log_config.sample_rate("/catalog/12") == 0.1
+    assert log_config.sample_rate("/orders/") == log_config.LOG_SAMPLE_RATE
+
+
+def test_sampled_out_requests_still_log_server_errors(monkeypatch, caplog):
+    monkeypatch.setattr(log_config, "LOG_SAMPLE_RATES", _parse_sample_rates("/catalog/=0"))
+    with caplog.at_level(logging.INFO, logger="access"):
+        log_request("GET", "/catalog/", "/catalog/", 200, 0.004)
+        log_request("GET", "/catalog/", "/catalog/", 503, 0.120)
+    assert [r.fields["status"] for r in caplog.records] == [503]
+    assert caplog.records[0].fields["duration_ms"] == 120.0
+
+
+def test_json_formatter_emits_fields():
+    record = logging.LogRecord("access", logging.INFO, __file__, 1, "request", None, None)
+    record.fields = {"status": 200, "route": "/catalog/"}
+    line = json.loads(JsonFormatter().format(record))
+    assert line["msg"] == "request"
+    assert line["status"] == 200 and line["route"] == "/catalog/"
+    assert line["level"] == "info"
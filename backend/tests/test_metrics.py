@@ -0,0 +1,52 @@
+import pytest
+from httpx import AsyncClient
+
+from metrics import Histogram
+
+
+def _sample(body: str, series: str) -> float:
+    for line in body.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_routes_and_queries(client: AsyncClient):
+    catalog_ok = 'http_requests_total{method="GET",route="/catalog/",status="200"}'
+    unmatched = 'http_requests_total{method="GET",route="unmatched",status="404"}'
+    catalog_latency = 'http_request_duration_seconds_count{method="GET",route="/catalog/"}'
+    no_queries = 'db_queries_per_request_bucket{route="/catalog/",le="0"}'
+    before = (await client.get("/metrics")).text
+
+    await client.get("/catalog/")
+    await client.get("/catalog/")
+    await client.get("/no-such-route")
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+
+    assert _sample(body, catalog_ok) - _sample(before, catalog_ok) == 2
+    assert _sample(body, unmatched) - _sample(before, unmatched) == 1
+    assert _sample(body, catalog_latency) - _sample(before, catalog_latency) == 2
+    assert _sample(body, "http_requests_in_flight") == 1  # the scrape itself
+    # The first catalog read queried the database, the second was a cache hit
+    assert _sample(body, no_queries) - _sample(before, no_queries) == 1
+    assert "db_pool_checkout_wait_seconds_count" in body
+    assert 'cache_hits_total{cache="catalog"}' in body
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe("/x", value=value)
+    samples = list(histogram.samples())
+    assert samples == [
+        'latency_seconds_bucket{route="/x",le="0.1"} 2',
+        'latency_seconds_bucket{route="/x",le="1.0"} 3',
+        'latency_seconds_bucket{route="/x",le="+Inf"} 4',
+        'latency_seconds_sum{route="/x"} 3.65',
+        'latency_seconds_count{route="/x"} 4',
+    ]
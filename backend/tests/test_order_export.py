@@ -0,0 +1,76 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+from httpx import AsyncClient
+
+from models import Category, Product, Order, OrderItem
+
+
+async def _seed_orders(db):
+    category = Category(name="Watches")
+    db.add(category)
+    await db.flush()
+    product = Product(name="Montre, \"Classique\"", price=250.0, stock=10, category_id=category.id)
+    db.add(product)
+    await db.flush()
+    orders = [
+        Order(total_amount=500.0, status="completed", created_at=datetime(2024, 1, 5), customer_email="a@x.ma"),
+        Order(total_amount=250.0, status="pending", created_at=datetime(2024, 2, 5), customer_email="b@x.ma"),
+        Order(total_amount=0.0, status="cancelled", created_at=datetime(2024, 3, 5), customer_email="c@x.ma",
+              customer_first_name="=HYPERLINK(\"http://x\")", customer_last_name="-Smith"),
+    ]
+    db.add_all(orders)
+    await db.flush()
+    db.add_all([
+        OrderItem(order_id=orders[0].id, product_id=product.id, quantity=1, price_at_time=250.0),
+        OrderItem(order_id=orders[0].id, product_id=product.id, quantity=1, price_at_time=250.0),
+        OrderItem(order_id=orders[1].id, product_id=product.id, quantity=1, price_at_time=250.0),
+    ])
+    await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_export_csv_has_one_row_per_item(client: AsyncClient, db_session, admin_token):
+    await _seed_orders(db_session)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    response = await client.get("/orders/export?format=csv", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "attachment" in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [r["customer_email"] for r in rows] == ["a@x.ma", "a@x.ma", "b@x.ma", "c@x.ma"]
+    assert rows[0]["product_name"] == 'Montre, "Classique"'
+    assert rows[3]["product_id"] == ""
+    # Formula-like text is neutralised; numbers are left alone
+    assert rows[3]["customer_first_name"] == "'=HYPERLINK(\"http://x\")"
+    assert rows[3]["customer_last_name"] == "'-Smith"
+    assert rows[0]["total_amount"] == "500.0"
+
+
+@pytest.mark.asyncio
+async def test_export_ndjson_nests_items_and_filters(client: AsyncClient, db_session, admin_token):
+    await _seed_orders(db_session)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    response = await client.get("/orders/export?format=ndjson", headers=headers)
+    orders = [json.loads(line) for line in response.text.splitlines()]
+    assert [len(o["items"]) for o in orders] == [2, 1, 0]
+    assert orders[0]["created_at"] == "2024-01-05T00:00:00"
+    assert orders[2]["customer_first_name"] == "=HYPERLINK(\"http://x\")"
+
+    response = await client.get(
+        "/orders/export?format=ndjson&created_from=2024-01-01&created_to=2024-03-01&status=pending",
+        headers=headers
+    )
+    orders = [json.loads(line) for line in response.text.splitlines()]
+    assert [o["customer_email"] for o in orders] == ["b@x.ma"]
+
+
+@pytest.mark.asyncio
+async def test_export_is_admin_only(client: AsyncClient, regular_user_token):
+    response = await client.get("/orders/export", headers={"Authorization": f"Bearer {regular_user_token}"})
+    assert response.status_code == 403
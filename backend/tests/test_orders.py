@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.future import select
+
+from main import app
+from database import Base, get_db
+from models import Category, Product, OrderItem
+
+customer = {
+    "email": "buyer@test.com",
+    "firstName": "Test",
+    "lastName": "Buyer",
+    "address": "1 Avenue",
+    "city": "Casablanca",
+    "country": "MA",
+    "zip": "20000"
+}
+
+
+async def _seed_product(db, stock: int, price: float = 100.0) -> int:
+    category = Category(name="Necklaces")
+    db.add(category)
+    await db.flush()
+    product = Product(name="Pearl Necklace", price=price, stock=stock, category_id=category.id)
+    db.add(product)
+    await db.flush()
+    product_id = product.id
+    await db.commit()
+    return product_id
+
+
+@pytest.mark.asyncio
+async def test_create_order_merges_lines_and_deducts_stock(client: AsyncClient, db_session):
+    product_id = await _seed_product(db_session, stock=5, price=40.0)
+
+    response = await client.post("/orders/", json={
+        "items": [{"product_id": product_id, "quantity": 1}, {"product_id": product_id, "quantity": 2}],
+        **customer
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_amount"] == 120.0
+    assert [(i["product_id"], i["quantity"]) for i in data["items"]] == [(product_id, 3)]
+
+    response = await client.get(f"/products/{product_id}")
+    assert response.json()["stock"] == 2
+
+
+@pytest.mark.asyncio
+async def test_create_order_reports_shortage_per_item(client: AsyncClient, db_session):
+    product_id = await _seed_product(db_session, stock=1)
+
+    response = await client.post("/orders/", json={"items": [{"product_id": product_id, "quantity": 2}], **customer})
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert detail["items"] == [{"product_id": product_id, "name": "Pearl Necklace", "requested": 2, "available": 1}]
+
+    response = await client.post("/orders/", json={"items": [{"product_id": 999, "quantity": 1}], **customer})
+    assert response.status_code == 404
+
+    # Nothing was deducted by the failed attempts
+    response = await client.get(f"/products/{product_id}")
+    assert response.json()["stock"] == 1
+
+
+@pytest.mark.asyncio
+async def test_parallel_checkouts_do_not_oversell(tmp_path):
+    # A file database with one session per request, so checkouts really run concurrently
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'orders.db'}", connect_args={"timeout": 30})
+    sessions = async_sessionmaker(bind=engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with sessions() as db:
+        product_id = await _seed_product(db, stock=3)
+
+    async def per_request_db():
+        async with sessions() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = per_request_db
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            responses = await asyncio.gather(*[
+                client.post("/orders/", json={"items": [{"product_id": product_id, "quantity": 1}], **customer})
+                for _ in range(12)
+            ])
+    finally:
+        app.dependency_overrides.clear()
+
+    statuses = [r.status_code for r in responses]
+    assert statuses.count(200) == 3
+    assert statuses.count(400) == 9
+
+    async with sessions() as db:
+        product = (await db.execute(select(Product).where(Product.id == product_id))).scalars().first()
+        sold = (await db.execute(select(OrderItem.quantity))).scalars().all()
+    assert product.stock == 0
+    assert sum(sold) == 3
+    await engine.dispose()
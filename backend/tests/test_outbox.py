@@ -0,0 +1,256 @@
+import asyncio
+import json
+from datetime import datetime
+
+import httpx
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.future import select
+
+from models import Category, Product, OutboxEvent
+from outbox import OutboxWorker, PermanentError, enqueue
+from services.facebook_capi import fb_capi, hash_user_data
+from services.facebook_post import facebook_service
+from services.graph import raise_for_graph_status
+
+customer = {
+    "email": "Buyer@Test.com", "firstName": "T", "lastName": "B",
+    "address": "1 Avenue", "city": "Tanger", "country": "MA", "zip": "90000"
+}
+
+
+class GraphStandIn:
+    """Answers like graph.facebook.com, with scripted status codes."""
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        status = self.statuses.pop(0) if self.statuses else 200
+        return httpx.Response(status, json={"id": "1_2", "events_received": 1})
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    def install(*statuses):
+        stand_in = GraphStandIn(*statuses)
+        monkeypatch.setattr("services.graph._client", httpx.AsyncClient(transport=httpx.MockTransport(stand_in)))
+        for service in (fb_capi, facebook_service):
+            monkeypatch.setattr(service, "access_token", "token")
+        monkeypatch.setattr(fb_capi, "pixel_id", "42")
+        monkeypatch.setattr(fb_capi, "enabled", True)
+        monkeypatch.setattr(facebook_service, "page_id", "7")
+        return stand_in
+    return install
+
+
+def _worker(db_session, capi_batch_size: int = 500):
+    worker = OutboxWorker(async_sessionmaker(bind=db_session.bind, expire_on_commit=False))
+    worker.register("facebook_capi", fb_capi.deliver_batch, concurrency=2, batch_size=capi_batch_size)
+    worker.register("facebook_post", facebook_service.deliver)
+    return worker
+
+
+async def _events(db_session):
+    db_session.expire_all()
+    return (await db_session.execute(select(OutboxEvent).order_by(OutboxEvent.id))).scalars().all()
+
+
+async def _make_due(db_session):
+    await db_session.execute(update(OutboxEvent).values(next_attempt_at=datetime.utcnow()))
+    await db_session.commit()
+
+
+@pytest.mark.asyncio
+async def test_order_purchase_event_is_queued_and_retried(client: AsyncClient, db_session, graph):
+    stand_in = graph(503)
+    category = Category(name="Rings")
+    db_session.add(category)
+    await db_session.flush()
+    db_session.add(Product(name="Ring", price=80.0, stock=3, category_id=category.id))
+    await db_session.commit()
+
+    response = await client.post("/orders/", json={"items": [{"product_id": 1, "quantity": 2}], **customer})
+    assert response.status_code == 200
+    # Nothing went out during the request
+    assert stand_in.requests == []
+    [event] = await _events(db_session)
+    assert event.endpoint == "facebook_capi"
+
+    worker = _worker(db_session)
+    assert await worker.run_once() == 1
+    [event] = await _events(db_session)
+    assert (event.status, event.attempts) == ("pending", 1)
+    assert "503" in event.last_error
+    # Backing off: not due yet
+    assert await worker.run_once() == 0
+
+    await _make_due(db_session)
+    assert await worker.run_once() == 1
+    assert await _events(db_session) == []
+
+    body = json.loads(stand_in.requests[-1].content)
+    assert stand_in.requests[-1].url.path == "/v19.0/42/events"
+    [sent] = body["data"]
+    assert sent["custom_data"]["order_id"] == "1"
+    assert sent["custom_data"]["value"] == 160.0
+    assert sent["user_data"]["em"] == hash_user_data({"em": ["buyer@test.com"]})["em"]
+
+
+@pytest.mark.asyncio
+async def test_rejected_post_is_dead_lettered_and_can_be_requeued(client: AsyncClient, db_session, admin_token, graph):
+    stand_in = graph(400)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    category = Category(name="Watches")
+    db_session.add(category)
+    await db_session.commit()
+
+    response = await client.post("/products/", headers=headers, json={
+        "name": "Watch", "price": 300, "stock": 1, "category_id": 1, "image_url": "/static/watch.jpg"
+    })
+    assert response.status_code == 200
+
+    worker = _worker(db_session)
+    await worker.run_once()
+    [event] = await _events(db_session)
+    assert (event.status, event.attempts) == ("dead", 1)
+    # Local images cannot be fetched by Facebook, so the post went to the feed
+    assert stand_in.requests[0].url.path == "/v19.0/7/feed"
+    assert b"access_token=token" in stand_in.requests[0].content
+    assert "token" not in json.dumps(event.payload)
+
+    response = await client.get("/outbox/stats", headers=headers)
+    assert response.json() == {"facebook_post": {"dead": 1}}
+    response = await client.post("/outbox/retry", headers=headers)
+    assert response.json() == {"requeued": 1}
+    assert await worker.run_once() == 1
+    assert await _events(db_session) == []
+
+
+@pytest.mark.asyncio
+async def test_worker_limits_concurrency_and_gives_up_after_max_attempts(db_session, monkeypatch):
+    monkeypatch.setattr("outbox.OUTBOX_MAX_ATTEMPTS", 2)
+    running, peak = 0, 0
+
+    async def flaky(payload):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if payload["fail"]:
+            raise RuntimeError("graph unavailable")
+
+    worker = OutboxWorker(async_sessionmaker(bind=db_session.bind, expire_on_commit=False))
+    worker.register("slow", flaky, concurrency=2)
+    for i in range(6):
+        enqueue(db_session, "slow", {"fail": i == 0})
+    await db_session.commit()
+
+    assert await worker.run_once() == 6
+    assert peak == 2
+    [event] = await _events(db_session)
+    assert (event.status, event.attempts) == ("pending", 1)
+
+    await _make_due(db_session)
+    await worker.run_once()
+    [event] = await _events(db_session)
+    assert (event.status, event.attempts) == ("dead", 2)
+
+
+@pytest.mark.parametrize("status, error", [
+    (400, {"message": "(#4) Application request limit reached", "code": 4, "is_transient": True}),
+    (403, {"message": "(#32) Page request limit reached", "code": 32}),
+    (400, {"message": "(#613) Calls to this api have exceeded the rate limit.", "code": 613}),
+    (400, {"message": "Service temporarily unavailable", "code": 999, "is_transient": True}),
+])
+def test_graph_throttling_is_retryable_whatever_the_status(status, error):
+    response = httpx.Response(status, json={"error": {"type": "OAuthException", **error}})
+    with pytest.raises(RuntimeError) as raised:
+        raise_for_graph_status(response)
+    assert not isinstance(raised.value, PermanentError)
+
+
+def test_graph_rejections_are_permanent():
+    for response in (
+        httpx.Response(400, json={"error": {"message": "Invalid parameter", "code": 100, "is_transient": False}}),
+        httpx.Response(401, json={"error": {"message": "Invalid OAuth access token", "code": 190}}),
+        httpx.Response(400, text="not json"),
+    ):
+        with pytest.raises(PermanentError):
+            raise_for_graph_status(response)
+
+
+@pytest.mark.asyncio
+async def test_missing_credentials_are_a_permanent_failure(monkeypatch):
+    monkeypatch.setattr(fb_capi, "enabled", False)
+    with pytest.raises(PermanentError):
+        await fb_capi.deliver({"event_name": "Purchase"})
+
+
+@pytest.mark.asyncio
+async def test_capi_events_are_batched_and_settled_together(db_session, graph):
+    stand_in = graph()
+    for i in range(10):
+        enqueue(db_session, "facebook_capi", fb_capi.build_event("Purchase", {"order_id": str(i)}))
+    await db_session.commit()
+
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement.lstrip().split()[0].upper())
+    event.listen(db_session.bind.sync_engine, "before_cursor_execute", record)
+    try:
+        await _worker(db_session, capi_batch_size=4).run_once()
+    finally:
+        event.remove(db_session.bind.sync_engine, "before_cursor_execute", record)
+    assert await _events(db_session) == []
+    assert sorted(len(json.loads(r.content)["data"]) for r in stand_in.requests) == [2, 4, 4]
+    # One claim, then one DELETE for every delivered event
+    assert statements == ["SELECT", "UPDATE", "DELETE"]
+
+
+@pytest.mark.asyncio
+async def test_rejected_batch_only_dead_letters_the_bad_event(db_session, graph):
+    stand_in = graph()
+
+    def reject_bad(request: httpx.Request) -> httpx.Response:
+        stand_in.requests.append(request)
+        events = json.loads(request.content)["data"]
+        if any(e["custom_data"].get("bad") for e in events):
+            return httpx.Response(400, json={"error": {"message": "Invalid parameter", "code": 100}})
+        return httpx.Response(200, json={"events_received": len(events)})
+
+    import services.graph
+    services.graph._client = httpx.AsyncClient(transport=httpx.MockTransport(reject_bad))
+    for i in range(3):
+        enqueue(db_session, "facebook_capi", fb_capi.build_event("Purchase", {"bad": i == 1}))
+    await db_session.commit()
+
+    await _worker(db_session).run_once()
+    [event] = await _events(db_session)
+    assert event.status == "dead"
+    assert event.payload["custom_data"]["bad"] is True
+    # The rejected batch, then its halves [0] and [1, 2], then [1, 2] on their own
+    assert [len(json.loads(r.content)["data"]) for r in stand_in.requests] == [3, 1, 2, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_throttled_batch_is_retried_whole(db_session, graph):
+    stand_in = graph()
+
+    def throttle(request: httpx.Request) -> httpx.Response:
+        stand_in.requests.append(request)
+        return httpx.Response(400, json={"error": {"message": "(#4) Application request limit reached", "code": 4}})
+
+    import services.graph
+    services.graph._client = httpx.AsyncClient(transport=httpx.MockTransport(throttle))
+    for i in range(4):
+        enqueue(db_session, "facebook_capi", fb_capi.build_event("Purchase", {"order_id": str(i)}))
+    await db_session.commit()
+
+    await _worker(db_session).run_once()
+    # One request, no fan-out; every event waits for its retry
+    assert [len(json.loads(r.content)["data"]) for r in stand_in.requests] == [4]
+    assert {(e.status, e.attempts) for e in await _events(db_session)} == {("pending", 1)}
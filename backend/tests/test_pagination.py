@@ -0,0 +1,69 @@
+import pytest
+from httpx import AsyncClient
+
+from pagination import NEXT_CURSOR_HEADER
+
+
+async def _create_products(client: AsyncClient, headers: dict, count: int):
+    await client.post("/categories/", json={"name": "Paged Category"}, headers=headers)
+    for i in range(count):
+        await client.post(
+            "/products/",
+            json={"name": f"Paged {i}", "price": 10 + i, "stock": 5, "category_id": 1},
+            headers=headers
+        )
+
+
+@pytest.mark.asyncio
+async def test_catalog_cursor_pagination(client: AsyncClient, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    await _create_products(client, headers, 5)
+
+    seen = []
+    cursor = None
+    for _ in range(5):
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/catalog/", params=params)
+        assert response.status_code == 200
+        seen.extend(p["id"] for p in response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            break
+
+    assert seen == sorted(seen)
+    assert len(seen) == 5 and len(set(seen)) == 5
+
+    # Legacy skip/limit still works
+    response = await client.get("/products/", params={"skip": 4, "limit": 2})
+    assert [p["id"] for p in response.json()] == seen[4:]
+
+
+@pytest.mark.asyncio
+async def test_orders_cursor_pagination(client: AsyncClient, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    await _create_products(client, headers, 1)
+    customer = {
+        "email": "c@test.com", "firstName": "C", "lastName": "T",
+        "address": "1 Street", "city": "Rabat", "country": "MA", "zip": "10000"
+    }
+    for _ in range(3):
+        response = await client.post("/orders/", json={"items": [{"product_id": 1, "quantity": 1}], **customer})
+        assert response.status_code == 200
+
+    first = await client.get("/orders/", params={"limit": 2}, headers=headers)
+    assert len(first.json()) == 2
+    cursor = first.headers[NEXT_CURSOR_HEADER]
+
+    second = await client.get("/orders/", params={"limit": 2, "cursor": cursor}, headers=headers)
+    assert len(second.json()) == 1
+    assert NEXT_CURSOR_HEADER not in second.headers
+    ids = [o["id"] for o in first.json() + second.json()]
+    assert len(set(ids)) == 3
+
+
+@pytest.mark.asyncio
+async def test_invalid_cursor(client: AsyncClient):
+    response = await client.get("/catalog/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
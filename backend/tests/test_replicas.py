@@ -0,0 +1,97 @@
+import time
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+
+from database import READ_PRIMARY_UNTIL_HEADER, Base, ReplicaSet, replicas
+from models import Category, Product
+from site_settings import upsert_settings
+
+
+async def _seed_replica(replica, product_name: str):
+    async with replica.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with replica.sessions() as db:
+        category = Category(name="Rings")
+        db.add(category)
+        await db.flush()
+        db.add(Product(name=product_name, price=10, stock=1, category_id=category.id))
+        await db.commit()
+
+
+@pytest_asyncio.fixture
+async def two_replicas(tmp_path, monkeypatch):
+    replica_set = ReplicaSet([
+        f"sqlite+aiosqlite:///{tmp_path / 'replica_a.db'}",
+        f"sqlite+aiosqlite:///{tmp_path / 'replica_b.db'}",
+    ])
+    for replica, name in zip(replica_set.replicas, ("Replica A", "Replica B")):
+        await _seed_replica(replica, name)
+    monkeypatch.setattr(replicas, "replicas", replica_set.replicas)
+    yield replica_set
+    for replica in replica_set.replicas:
+        await replica.engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_reads_rotate_over_replicas_and_writes_pin_to_primary(client: AsyncClient, db_session, two_replicas):
+    category = Category(name="Rings")
+    db_session.add(category)
+    await db_session.flush()
+    db_session.add(Product(name="Primary", price=10, stock=5, category_id=category.id))
+    await db_session.commit()
+
+    names = {(await client.get("/products/1")).json()["name"] for _ in range(2)}
+    assert names == {"Replica A", "Replica B"}
+
+    response = await client.get("/products/1", headers={"X-Read-Primary": "1"})
+    assert response.json()["name"] == "Primary"
+
+    # A write keeps the writing client's reads on the primary while replicas catch up
+    response = await client.post("/orders/", json={
+        "items": [{"product_id": 1, "quantity": 1}],
+        "email": "a@b.c", "firstName": "A", "lastName": "B",
+        "address": "x", "city": "y", "country": "MA", "zip": "1"
+    }, headers={"Origin": "https://shop.onrender.com"})
+    assert response.status_code == 200
+    # Readable by the cross-site frontend
+    assert READ_PRIMARY_UNTIL_HEADER.lower() in response.headers["access-control-expose-headers"].lower()
+    until = response.headers[READ_PRIMARY_UNTIL_HEADER]
+    assert int(until) > time.time()
+    # Cross-site browsers keep no cookies, so the pin must survive without them
+    client.cookies.clear()
+    data = (await client.get("/products/1", headers={READ_PRIMARY_UNTIL_HEADER: until})).json()
+    assert (data["name"], data["stock"]) == ("Primary", 4)
+
+    # Everyone else still reads from the replicas
+    assert (await client.get("/products/1")).json()["name"].startswith("Replica")
+
+    # An expired pin is ignored
+    expired = {READ_PRIMARY_UNTIL_HEADER: str(int(time.time()) - 1)}
+    assert (await client.get("/products/1", headers=expired)).json()["name"].startswith("Replica")
+
+
+@pytest.mark.asyncio
+async def test_login_does_not_pin_to_primary(client: AsyncClient, admin_token, two_replicas):
+    response = await client.post("/token", data={"username": "pytest_admin", "password": "admin123"})
+    assert response.status_code == 200
+    assert READ_PRIMARY_UNTIL_HEADER not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_least_connections_picks_the_idlest_replica(two_replicas):
+    two_replicas.selection = "least_connections"
+    first, second = two_replicas.replicas
+    first.in_use = 3
+    assert two_replicas.choose() is second
+    second.in_use = 5
+    assert two_replicas.choose() is first
+
+
+@pytest.mark.asyncio
+async def test_settings_snapshot_is_loaded_from_the_primary(client: AsyncClient, db_session, two_replicas):
+    await upsert_settings(db_session, {"hero_title": "Maison"})
+    await db_session.commit()
+    # The replicas have no settings yet; the snapshot must not be built from them
+    assert (await client.get("/settings/")).json() == [{"key": "hero_title", "value": "Maison"}]
@@ -0,0 +1,37 @@
+import pytest
+from httpx import AsyncClient
+
+
+@pytest.mark.asyncio
+async def test_catalog_search_ranks_and_tracks_writes(client: AsyncClient, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    await client.post("/categories/", json={"name": "Bagues"}, headers=headers)
+    await client.post("/categories/", json={"name": "Colliers"}, headers=headers)
+    products = [
+        {"name": "Bague Solitaire Diamant", "description": "Or blanc 18 carats", "price": 1200, "stock": 2, "category_id": 1},
+        {"name": "Collier Perles", "description": "Perles et fermoir en diamant", "price": 800, "stock": 3, "category_id": 2},
+        {"name": "Bracelet Jonc", "description": "Or jaune", "price": 500, "stock": 1, "category_id": 1},
+    ]
+    for product in products:
+        assert (await client.post("/products/", json=product, headers=headers)).status_code == 200
+
+    # A match in the name outranks a match in the description; prefixes match
+    response = await client.get("/catalog/search", params={"q": "diam"})
+    assert response.status_code == 200
+    assert [p["name"] for p in response.json()] == ["Bague Solitaire Diamant", "Collier Perles"]
+
+    # Category names are searchable and all terms must match
+    response = await client.get("/catalog/search", params={"q": "bagues jaune"})
+    assert [p["name"] for p in response.json()] == ["Bracelet Jonc"]
+
+    # Operators in user input are treated as plain words
+    response = await client.get("/catalog/search", params={"q": 'perles" * ('})
+    assert [p["name"] for p in response.json()] == ["Collier Perles"]
+
+    await client.put("/products/3", json={"name": "Bracelet Rivière"}, headers=headers)
+    response = await client.get("/catalog/search", params={"q": "riviere"})
+    assert [p["id"] for p in response.json()] == [3]
+
+    await client.delete("/products/1", headers=headers)
+    response = await client.get("/catalog/search", params={"q": "diamant"})
+    assert [p["id"] for p in response.json()] == [2]
@@ -0,0 +1,80 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+
+from site_settings import settings_store
+
+
+class _Statements:
+    def __init__(self, engine):
+        self.engine = engine.sync_engine
+        self.seen = []
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self.seen
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.seen.append(statement)
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_is_one_upsert(client: AsyncClient, db_session):
+    await client.put("/settings/", json=[{"key": "hero_title", "value": "Maison"}])
+
+    with _Statements(db_session.bind) as seen:
+        response = await client.put("/settings/", json=[
+            {"key": "hero_title", "value": "Atelier"},
+            {"key": "footer", "value": "draft"},
+            {"key": "footer", "value": "(c) 2026"},
+            {"key": "banner", "value": "Sale"},
+        ])
+    assert response.status_code == 200
+    assert response.json() == [
+        {"key": "banner", "value": "Sale"},
+        {"key": "footer", "value": "(c) 2026"},
+        {"key": "hero_title", "value": "Atelier"},
+    ]
+    writes = [s for s in seen if s.lstrip().upper().startswith("INSERT")]
+    assert len(writes) == 1 and "ON CONFLICT" in writes[0]
+    # The snapshot was current, so nothing is read back
+    assert not [s for s in seen if s.lstrip().upper().startswith("SELECT")]
+
+
+@pytest.mark.asyncio
+async def test_reads_are_served_from_the_snapshot(client: AsyncClient, db_session):
+    await client.put("/settings/", json=[{"key": "hero_title", "value": "Maison"}])
+    settings_store.clear()
+
+    assert (await client.get("/settings/")).json() == [{"key": "hero_title", "value": "Maison"}]
+    with _Statements(db_session.bind) as seen:
+        assert (await client.get("/settings/")).status_code == 200
+        response = await client.get("/settings/hero_title")
+        assert (await client.get("/settings/missing")).status_code == 404
+    assert response.json() == {"key": "hero_title", "value": "Maison"}
+    assert seen == []
+
+    # A version bump from elsewhere (another process's write) retires the snapshot
+    snapshot = settings_store.current()
+    settings_store.versions.bump("settings")
+    assert settings_store.current() is None
+    assert (await client.get("/settings/hero_title")).json()["value"] == "Maison"
+    assert settings_store.current() is not snapshot
+    with pytest.raises(TypeError):
+        settings_store.current().values["hero_title"] = "changed"
+
+
+@pytest.mark.asyncio
+async def test_snapshot_expires_after_the_ttl(client: AsyncClient):
+    await client.put("/settings/", json=[{"key": "hero_title", "value": "Maison"}])
+    snapshot = settings_store.current()
+    assert snapshot is not None
+
+    # Even without any invalidation, an old snapshot is reloaded
+    snapshot.expires_at = 0
+    assert settings_store.current() is None
+    assert (await client.get("/settings/hero_title")).json()["value"] == "Maison"
+    assert settings_store.current() is not snapshot
@@ -0,0 +1,66 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+
+from models import Brand, Category, Product
+from search import search_index
+
+
+async def _seed(db):
+    category = Category(name="Watches")
+    brand = Brand(name="Tissot")
+    db.add_all([category, brand])
+    await db.flush()
+    db.add_all([
+        Product(name=f"Watch {i}", price=100 + i, stock=5, category_id=category.id, brand_id=brand.id,
+                description="Sapphire crystal " * 50, specs={"size": i}, image_url=f"/static/{i}.webp")
+        for i in range(3)
+    ])
+    await db.commit()
+    # A fresh identity map, as in a real request
+    db.expunge_all()
+
+
+@pytest.mark.asyncio
+async def test_catalog_fields_limit_columns_and_shape(client: AsyncClient, db_session):
+    await _seed(db_session)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_session.bind.sync_engine, "before_cursor_execute", record)
+    try:
+        response = await client.get("/catalog/?fields=name,price,image_url,brand&limit=2")
+    finally:
+        event.remove(db_session.bind.sync_engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": 1, "name": "Watch 0", "price": 100.0, "image_url": "/static/0.webp", "brand": {"id": 1, "name": "Tissot", "logo_url": None}},
+        {"id": 2, "name": "Watch 1", "price": 101.0, "image_url": "/static/1.webp", "brand": {"id": 1, "name": "Tissot", "logo_url": None}},
+    ]
+    products_select = next(s for s in statements if "FROM products" in s)
+    assert "description" not in products_select and "specs" not in products_select
+    assert not any("FROM categories" in s for s in statements)
+
+    cursor = response.headers["x-next-cursor"]
+    response = await client.get(f"/catalog/?fields=name&limit=2&cursor={cursor}")
+    assert response.json() == [{"id": 3, "name": "Watch 2"}]
+
+    # The full product is still the default
+    assert "description" in (await client.get("/catalog/?limit=1")).json()[0]
+
+
+@pytest.mark.asyncio
+async def test_catalog_fields_validation_and_search(client: AsyncClient, db_session):
+    await _seed(db_session)
+    await search_index.rebuild(db_session)
+    await db_session.commit()
+    response = await client.get("/catalog/?fields=name,password")
+    assert response.status_code == 422
+    assert "password" in response.json()["detail"]
+
+    response = await client.get("/catalog/search?q=watch&fields=name,category")
+    assert response.status_code == 200
+    assert {tuple(sorted(p)) for p in response.json()} == {("category", "id", "name")}
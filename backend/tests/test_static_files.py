@@ -0,0 +1,74 @@
+import gzip
+import os
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient, ASGITransport
+
+from static_files import CachedStaticFiles, STATIC_CACHE_CONTROL, STATIC_CACHE_CONTROL_IMMUTABLE, accepted_encodings
+
+HASHED = "0123456789abcdef0123456789abcdef.svg"
+SVG = b"<svg xmlns='http://www.w3.org/2000/svg'>" + b"<rect width='10' height='10'/>" * 100 + b"</svg>"
+
+
+@pytest_asyncio.fixture
+async def static(tmp_path):
+    (tmp_path / HASHED).write_bytes(SVG)
+    (tmp_path / f"{HASHED}.gz").write_bytes(gzip.compress(SVG))
+    (tmp_path / "legacy-upload.txt").write_bytes(b"0123456789")
+    async with AsyncClient(transport=ASGITransport(app=CachedStaticFiles(directory=tmp_path)), base_url="http://test") as client:
+        yield client, tmp_path
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, deflate, br;q=1.0") == {"gzip", "deflate", "br"}
+    assert accepted_encodings("br;q=0, gzip") == {"gzip"}
+    assert accepted_encodings("") == set()
+
+
+@pytest.mark.asyncio
+async def test_content_addressed_files_are_immutable(static):
+    client, _ = static
+    response = await client.get(f"/{HASHED}", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == STATIC_CACHE_CONTROL_IMMUTABLE
+    assert "content-encoding" not in response.headers
+    assert response.content == SVG
+
+    response = await client.get("/legacy-upload.txt")
+    assert response.headers["cache-control"] == STATIC_CACHE_CONTROL
+
+    revalidated = await client.get("/legacy-upload.txt", headers={"If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_precompressed_sibling_is_served(static):
+    client, tmp_path = static
+    # httpx decodes gzip transparently; compare with what is on disk instead
+    response = await client.get(f"/{HASHED}", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"] == "image/svg+xml"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == os.path.getsize(tmp_path / f"{HASHED}.gz")
+    assert response.content == SVG
+
+    # A copy older than its file is stale and ignored
+    old = os.path.getmtime(tmp_path / HASHED) - 60
+    os.utime(tmp_path / f"{HASHED}.gz", (old, old))
+    response = await client.get(f"/{HASHED}", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_range_requests_return_partial_content(static):
+    client, _ = static
+    response = await client.get("/legacy-upload.txt", headers={"Range": "bytes=2-5", "Accept-Encoding": "gzip"})
+    assert response.status_code == 206
+    assert response.content == b"2345"
+    assert response.headers["content-range"] == "bytes 2-5/10"
+
+    response = await client.get(f"/{HASHED}", headers={"Range": "bytes=0-3", "Accept-Encoding": "gzip"})
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+    assert response.content == SVG[:4]
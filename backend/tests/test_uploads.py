@@ -0,0 +1,280 @@
+import io
+import os
+import struct
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+from PIL import Image
+from sqlalchemy import update
+from sqlalchemy.future import select
+
+import services.images
+import services.storage
+from models import Category, Product, StoredBlob
+from services.storage import blob_name, collect_garbage
+from services.images import blurhash, _base83
+
+
+def _photo(width: int, height: int, image_format: str = "JPEG", **save_args) -> bytes:
+    image = Image.new("RGB", (width, height))
+    for x in range(0, width, 10):
+        for y in range(0, height, 10):
+            image.paste((x % 256, y % 256, (x + y) % 256), (x, y, x + 10, y + 10))
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **save_args)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(services.storage, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(services.storage, "UPLOAD_TMP_DIR", str(tmp_path / "tmp"))
+    (tmp_path / "uploads").mkdir()
+    return tmp_path / "uploads"
+
+
+@pytest.mark.asyncio
+async def test_upload_returns_srcset_manifest(client: AsyncClient, upload_dir):
+    exif = Image.Exif()
+    exif[0x010F] = "SecretCam"  # Make
+    data = _photo(1200, 800, exif=exif.tobytes())
+
+    response = await client.post("/upload/", files={"file": ("photo.jpg", data, "image/jpeg")})
+    assert response.status_code == 200
+    manifest = response.json()
+
+    assert (manifest["width"], manifest["height"]) == (1200, 800)
+    assert [(v["width"], v["height"]) for v in manifest["variants"]] == [(320, 213), (640, 427), (1024, 683), (1200, 800)]
+    assert manifest["url"] == manifest["variants"][-1]["url"]
+    assert manifest["url"].startswith("http://test/static/") and manifest["url"].endswith(".webp")
+    assert manifest["srcset"].split(", ")[0].endswith(" 320w")
+    assert manifest["sources"]["image/webp"] == manifest["srcset"]
+    assert len(manifest["blurhash"]) == 28
+
+    stored = sorted(upload_dir.iterdir())
+    assert len(stored) == 4
+    for path in stored:
+        with Image.open(path) as variant:
+            assert variant.format == "WEBP"
+            assert not variant.getexif()
+        assert b"SecretCam" not in path.read_bytes()
+
+
+@pytest.mark.asyncio
+async def test_wide_upload_gets_each_variant_once(client: AsyncClient, upload_dir):
+    response = await client.post("/upload/", files={"file": ("wide.png", _photo(2000, 1000, "PNG"), "image/png")})
+    assert response.status_code == 200
+    manifest = response.json()
+    assert [v["width"] for v in manifest["variants"]] == [320, 640, 1024, 1600]
+    assert len(list(upload_dir.iterdir())) == 4
+
+
+@pytest.mark.asyncio
+async def test_upload_rejects_non_images_by_content(client: AsyncClient, upload_dir):
+    # The name and content type claim an image; the bytes decide
+    response = await client.post("/upload/", files={"file": ("photo.jpg", b"%PDF-1.7 ...", "image/jpeg")})
+    assert response.status_code == 415
+    # Right signature, broken image
+    response = await client.post("/upload/", files={"file": ("photo.jpg", b"\xff\xd8\xff\xe0garbage", "image/jpeg")})
+    assert response.status_code == 400
+    assert list(upload_dir.iterdir()) == []
+    assert list((upload_dir.parent / "tmp").iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_upload_size_and_concurrency_limits(client: AsyncClient, upload_dir, monkeypatch):
+    import main
+    data = _photo(800, 600)
+
+    # Declared too large: refused before the body is read
+    monkeypatch.setattr(main, "UPLOAD_MAX_BYTES", 100)
+    monkeypatch.setattr(main, "UPLOAD_FORM_OVERHEAD", 0)
+    response = await client.post("/upload/", files={"file": ("big.jpg", data, "image/jpeg")})
+    assert response.status_code == 413
+
+    # Found too large while streaming it in
+    monkeypatch.setattr(main, "UPLOAD_MAX_BYTES", 10 * len(data))
+    monkeypatch.setattr(services.storage, "UPLOAD_MAX_BYTES", len(data) - 1)
+    monkeypatch.setattr(services.storage, "UPLOAD_CHUNK_SIZE", 1024)
+    response = await client.post("/upload/", files={"file": ("big.jpg", data, "image/jpeg")})
+    assert response.status_code == 413
+    assert list((upload_dir.parent / "tmp").iterdir()) == []
+
+    monkeypatch.setattr(services.storage, "_uploads_in_progress", services.storage.UPLOAD_MAX_CONCURRENT)
+    response = await client.post("/upload/", files={"file": ("a.jpg", data, "image/jpeg")})
+    assert response.status_code == 429
+    assert response.headers["retry-after"]
+
+
+def _rgb_profile(red, green, blue) -> bytes:
+    """A minimal ICC v2 display profile with the given XYZ primaries and a 2.2 gamma."""
+    def xyz(*values):
+        return b"XYZ " + bytes(4) + b"".join(struct.pack(">i", round(v * 65536)) for v in values)
+
+    text = b"Test RGB\0"
+    desc = b"desc" + bytes(4) + struct.pack(">I", len(text)) + text + bytes(8) + bytes(3) + bytes(67)
+    desc += bytes(-len(desc) % 4)
+    curve = b"curv" + bytes(4) + struct.pack(">IH", 1, 0x0233) + bytes(2)
+    tags = [(b"desc", desc), (b"wtpt", xyz(0.9642, 1.0, 0.8249)),
+            (b"rXYZ", xyz(*red)), (b"gXYZ", xyz(*green)), (b"bXYZ", xyz(*blue)),
+            (b"rTRC", curve), (b"gTRC", curve), (b"bTRC", curve)]
+    offset = 128 + 4 + 12 * len(tags)
+    table, body = struct.pack(">I", len(tags)), b""
+    for signature, data in tags:
+        table += signature + struct.pack(">II", offset + len(body), len(data))
+        body += data
+    size = offset + len(body)
+    header = (struct.pack(">I", size) + bytes(4) + struct.pack(">I", 0x02100000) + b"mntrRGB XYZ " + bytes(12)
+              + b"acsp" + bytes(24) + bytes(4) + xyz(0.9642, 1.0, 0.8249)[8:] + bytes(48))
+    assert len(header) == 128
+    return header + table + body
+
+
+@pytest.mark.asyncio
+async def test_upload_converts_embedded_colour_profile_to_srgb(client: AsyncClient, upload_dir):
+    # A profile whose red primary is sRGB green: the variants lose the profile,
+    # so unconverted pixels would stay red
+    srgb_red, srgb_green, srgb_blue = (0.4361, 0.2225, 0.0139), (0.3851, 0.7169, 0.0971), (0.1431, 0.0606, 0.7141)
+    buffer = io.BytesIO()
+    Image.new("RGB", (400, 300), (200, 0, 0)).save(buffer, "PNG", icc_profile=_rgb_profile(srgb_green, srgb_red, srgb_blue))
+
+    response = await client.post("/upload/", files={"file": ("p3.png", buffer.getvalue(), "image/png")})
+    assert response.status_code == 200
+    for path in upload_dir.iterdir():
+        with Image.open(path) as variant:
+            assert "icc_profile" not in variant.info
+            r, g, b = variant.convert("RGB").getpixel((10, 10))
+            assert g > 150 and r < 50 and b < 50
+
+
+class _FakePool(Executor):
+    def __init__(self, broken: bool):
+        self.broken, self.closed = broken, False
+
+    def submit(self, fn, *args):
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool("A worker died"))
+        else:
+            future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_broken_image_pool_is_replaced(client: AsyncClient, upload_dir, monkeypatch):
+    pools = [_FakePool(broken=True), _FakePool(broken=False), _FakePool(broken=True), _FakePool(broken=True)]
+    created = iter(pools)
+    monkeypatch.setattr(services.images, "IMAGE_WORKERS", 1)
+    monkeypatch.setattr(services.images, "_executor", None)
+    monkeypatch.setattr(services.images, "ProcessPoolExecutor", lambda max_workers: next(created))
+
+    # The upload is retried on a fresh pool, which later uploads keep using
+    response = await client.post("/upload/", files={"file": ("a.jpg", _photo(400, 300), "image/jpeg")})
+    assert response.status_code == 200
+    assert pools[0].closed and services.images._executor is pools[1]
+    response = await client.post("/upload/", files={"file": ("b.jpg", _photo(500, 300), "image/jpeg")})
+    assert response.status_code == 200
+
+    # Broken again on the retry: give up for now, and start over with the next upload
+    monkeypatch.setattr(services.images, "_executor", None)
+    response = await client.post("/upload/", files={"file": ("c.jpg", _photo(600, 300), "image/jpeg")})
+    assert response.status_code == 503
+    assert pools[2].closed and pools[3].closed and services.images._executor is None
+
+
+def test_blurhash_encodes_component_count_and_average_colour():
+    hash_ = blurhash(Image.new("RGB", (40, 30), (255, 0, 0)))
+    # Size flag for 4x3 components, then the DC (average) colour in four digits
+    assert len(hash_) == 28
+    assert hash_[0] == _base83(3 + 2 * 9, 1)
+    assert hash_[2:6] == _base83(0xFF0000, 4)
+
+
+@pytest.mark.asyncio
+async def test_duplicate_upload_reuses_stored_blob(client: AsyncClient, db_session, upload_dir):
+    data = _photo(700, 500, "PNG")
+    first = (await client.post("/upload/", files={"file": ("a.png", data, "image/png")})).json()
+    files = sorted(upload_dir.iterdir())
+    second = (await client.post("/upload/", files={"file": ("copy-of-a.png", data, "image/png")})).json()
+
+    assert second == first
+    assert sorted(upload_dir.iterdir()) == files
+    [blob] = (await db_session.execute(select(StoredBlob))).scalars().all()
+    assert (blob.url, blob.upload_count, blob.size) == (first["url"], 2, len(data))
+    # Files are named by the hash of their own bytes
+    assert all(len(os.path.splitext(p.name)[0]) == 32 for p in files)
+
+
+@pytest.mark.asyncio
+async def test_garbage_collection_keeps_referenced_and_recent_uploads(client: AsyncClient, db_session, upload_dir):
+    kept = (await client.post("/upload/", files={"file": ("k.jpg", _photo(400, 300), "image/jpeg")})).json()
+    dropped = (await client.post("/upload/", files={"file": ("d.jpg", _photo(500, 300), "image/jpeg")})).json()
+    fresh = (await client.post("/upload/", files={"file": ("f.jpg", _photo(600, 300), "image/jpeg")})).json()
+    legacy = upload_dir / "0b4e7a0e-legacy.png"
+    legacy.write_bytes(b"old upload")
+    old = (datetime.utcnow() - timedelta(days=3)).timestamp()
+    os.utime(legacy, (old, old))
+    # Precompressed copies follow the file they were made from
+    legacy_gz = upload_dir / f"{legacy.name}.gz"
+    legacy_gz.write_bytes(b"gz")
+    kept_gz = upload_dir / f"{blob_name(kept['url'])}.gz"
+    kept_gz.write_bytes(b"gz")
+    os.utime(kept_gz, (old, old))
+
+    category = Category(name="Rings")
+    db_session.add(category)
+    await db_session.flush()
+    db_session.add(Product(name="Ring", price=1, stock=1, category_id=category.id, additional_images=[kept["url"]]))
+    await db_session.execute(
+        update(StoredBlob).where(StoredBlob.url != fresh["url"]).values(created_at=datetime.utcnow() - timedelta(days=3))
+    )
+    await db_session.commit()
+
+    preview = await collect_garbage(db_session, dry_run=True)
+    assert len(list(upload_dir.iterdir())) == 9
+
+    result = await collect_garbage(db_session)
+    assert result == preview
+    assert result["blobs"] == 1
+    def names(manifest):
+        return {blob_name(v["url"]) for v in manifest["variants"]}
+
+    assert set(result["files"]) == names(dropped) | {legacy.name, legacy_gz.name}
+    assert {p.name for p in upload_dir.iterdir()} == names(kept) | names(fresh) | {kept_gz.name}
+    blobs = {b.url for b in (await db_session.execute(select(StoredBlob))).scalars()}
+    assert blobs == {kept["url"], fresh["url"]}
+
+
+@pytest.mark.asyncio
+async def test_cloudinary_uploads_and_deletes_name_the_image_resource_type(client: AsyncClient, db_session, upload_dir, monkeypatch):
+    uploads, destroyed = [], []
+
+    def upload_large(path, **options):
+        uploads.append(options)
+        name = f"{options['public_id']}.{path.rsplit('.', 1)[-1]}"
+        return {"secure_url": f"https://res.cloudinary.com/demo/image/upload/v1/{options['folder']}/{name}"}
+
+    def destroy(public_id, **options):
+        destroyed.append((public_id, options))
+        return {"result": "ok"}
+
+    monkeypatch.setattr(services.storage, "USE_CLOUD", True)
+    monkeypatch.setattr(services.storage.cloudinary.uploader, "upload_large", upload_large)
+    monkeypatch.setattr(services.storage.cloudinary.uploader, "destroy", destroy)
+
+    manifest = (await client.post("/upload/", files={"file": ("d.jpg", _photo(400, 300), "image/jpeg")})).json()
+    assert manifest["url"].startswith("https://res.cloudinary.com/")
+    assert {(u["folder"], u["resource_type"]) for u in uploads} == {("the-set-web", "image")}
+    await db_session.execute(update(StoredBlob).values(created_at=datetime.utcnow() - timedelta(days=3)))
+    await db_session.commit()
+
+    await collect_garbage(db_session)
+    assert sorted(destroyed) == sorted(
+        (f"the-set-web/{u['public_id']}", {"resource_type": "image"}) for u in uploads
+    )
@@ -0,0 +1,77 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import text
+
+from database import create_missing_indexes
+from models import Brand, Category, Product
+
+
+async def _seed_products(db, count: int) -> list[int]:
+    category = Category(name="Watches")
+    brand = Brand(name="Tissot")
+    db.add_all([category, brand])
+    await db.flush()
+    products = [Product(name=f"Watch {i}", price=100 + i, stock=1, category_id=category.id, brand_id=brand.id) for i in range(count)]
+    db.add_all(products)
+    await db.flush()
+    ids = [p.id for p in products]
+    await db.commit()
+    return ids
+
+
+@pytest.mark.asyncio
+async def test_wishlist_add_is_insert_or_ignore(client: AsyncClient, db_session, regular_user_token):
+    headers = {"Authorization": f"Bearer {regular_user_token}"}
+    first, second = await _seed_products(db_session, 2)
+
+    response = await client.post("/wishlist/", json={"product_id": first}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["product"]["brand"]["name"] == "Tissot"
+    assert response.json()["product"]["category"]["name"] == "Watches"
+    response = await client.post("/wishlist/", json={"product_id": first}, headers=headers)
+    assert response.status_code == 400
+    # Unknown products are refused without leaving a row behind
+    response = await client.post("/wishlist/", json={"product_id": 9999}, headers=headers)
+    assert response.status_code == 404
+    assert (await db_session.execute(text("SELECT COUNT(*) FROM wishlists WHERE product_id = 9999"))).scalar() == 0
+    await client.post("/wishlist/", json={"product_id": second}, headers=headers)
+
+    full = (await client.get("/wishlist/", headers=headers)).json()
+    assert [item["product"]["id"] for item in full] == [first, second]
+    assert (await client.get("/wishlist/?fields=ids", headers=headers)).json() == [first, second]
+    assert (await client.get("/wishlist/?fields=name", headers=headers)).status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_wishlist_batch_sync(client: AsyncClient, db_session, regular_user_token):
+    headers = {"Authorization": f"Bearer {regular_user_token}"}
+    ids = await _seed_products(db_session, 4)
+    await client.post("/wishlist/", json={"product_id": ids[0]}, headers=headers)
+
+    # Guest wishlist merged at login: one already saved, one repeated, one unknown product
+    response = await client.post(
+        "/wishlist/batch", json={"product_ids": [ids[0], ids[1], ids[2], ids[2], 9999]}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json() == {"added": 2, "removed": 0, "product_ids": ids[:3]}
+
+    response = await client.request("DELETE", "/wishlist/batch", json={"product_ids": [ids[0], ids[3]]}, headers=headers)
+    assert response.json() == {"added": 0, "removed": 1, "product_ids": ids[1:3]}
+
+    response = await client.post("/wishlist/batch", json={"product_ids": list(range(501))}, headers=headers)
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_unique_index_collapses_existing_duplicates(db_session):
+    ids = await _seed_products(db_session, 1)
+    await db_session.execute(text("DROP INDEX uq_wishlists_user_product"))
+    for _ in range(3):
+        await db_session.execute(text("INSERT INTO wishlists (user_id, product_id) VALUES (1, :p)"), {"p": ids[0]})
+    await db_session.execute(text("INSERT INTO wishlists (user_id, product_id) VALUES (2, :p)"), {"p": ids[0]})
+    await db_session.commit()
+
+    connection = await db_session.connection()
+    await connection.run_sync(create_missing_indexes)
+    rows = (await db_session.execute(text("SELECT id, user_id FROM wishlists ORDER BY id"))).all()
+    assert [tuple(r) for r in rows] == [(1, 1), (4, 2)]
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from sqlalchemy import delete, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload
+
+from models import Product, Wishlist
+
+
+def _insert(db: AsyncSession):
+    return postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+
+
+def wishlist_query():
+    # Every join is many-to-one, so this is one row per wishlist entry.
+    # Inner join: entries whose product was deleted are left out.
+    return select(Wishlist).options(
+        joinedload(Wishlist.product, innerjoin=True).joinedload(Product.category),
+        joinedload(Wishlist.product, innerjoin=True).joinedload(Product.brand),
+    )
+
+
+async def product_ids(db: AsyncSession, user_id: int) -> list[int]:
+    result = await db.execute(
+        select(Wishlist.product_id)
+        .join(Product, Product.id == Wishlist.product_id)
+        .where(Wishlist.user_id == user_id)
+        .order_by(Wishlist.id)
+    )
+    return list(result.scalars())
+
+
+async def add_product(db: AsyncSession, user_id: int, product_id: int) -> int | None:
+    """
+    Insert one entry. Returns its id, or None when the product was already in
+    the wishlist or does not exist; the unique index and the product row
+    decide, so there is no lookup first.
+    """
+    source = select(literal(user_id), Product.id, literal(datetime.utcnow())).where(Product.id == product_id)
+    statement = _insert(db)(Wishlist).from_select(["user_id", "product_id", "created_at"], source)
+    result = await db.execute(
+        statement.on_conflict_do_nothing(index_elements=[Wishlist.user_id, Wishlist.product_id]).returning(Wishlist.id)
+    )
+    return result.scalar()
+
+
+async def product_exists(db: AsyncSession, product_id: int) -> bool:
+    return (await db.execute(select(Product.id).where(Product.id == product_id))).first() is not None
+
+
+async def add_products(db: AsyncSession, user_id: int, ids: list[int]) -> int:
+    """
+    Add every existing product in `ids` in one INSERT .. SELECT, skipping those
+    already in the wishlist. Returns the number added.
+    """
+    if not ids:
+        return 0
+    source = select(literal(user_id), Product.id, literal(datetime.utcnow())).where(Product.id.in_(set(ids)))
+    statement = _insert(db)(Wishlist).from_select(["user_id", "product_id", "created_at"], source)
+    result = await db.execute(
+        statement.on_conflict_do_nothing(index_elements=[Wishlist.user_id, Wishlist.product_id])
+    )
+    return result.rowcount
+
+
+async def remove_products(db: AsyncSession, user_id: int, ids: list[int]) -> int:
+    if not ids:
+        return 0
+    result = await db.execute(
+        delete(Wishlist).where(Wishlist.user_id == user_id, Wishlist.product_id.in_(set(ids)))
+    )
+    return result.rowcount
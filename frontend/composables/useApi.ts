@@ -1,19 +1,45 @@
 import type { Product, Brand, Category, StoreLocation, Order, OrderCreate, TokenResponse, User } from '~/types'
 
+// Writes answer with X-Read-Primary-Until (a Unix time). Sending it back until
+// then keeps this browser's reads on the primary database, so a read replica
+// that has not caught up yet never hides a change it just made. Only the
+// browser ever writes, so server-side rendering never sets it.
+const READ_PRIMARY_HEADER = 'X-Read-Primary-Until'
+let readPrimaryUntil = 0
+
+const withReadPin = <T extends Record<string, any>>(options: T = {} as T) => ({
+    ...options,
+    onRequest({ options: request }: { options: any }) {
+        if (readPrimaryUntil > Date.now() / 1000) {
+            const headers = new Headers(request.headers)
+            headers.set(READ_PRIMARY_HEADER, String(readPrimaryUntil))
+            request.headers = headers
+        }
+    },
+    onResponse({ response }: { response: Response }) {
+        const until = Number(response.headers.get(READ_PRIMARY_HEADER))
+        if (import.meta.client && until > readPrimaryUntil) {
+            readPrimaryUntil = until
+        }
+    }
+})
+
+const api = <T = any>(url: string, options: Record<string, any> = {}) => $fetch<T>(url, withReadPin(options))
+
 export const useApi = () => {
     const config = useRuntimeConfig()
     // Prioritize runtime config apiBase, fallback to localhost for local dev/prerender if not set
     const baseUrl = config.public.apiBase || 'http://localhost:8000'
 
-    const ping = () => $fetch(`${baseUrl}/`, { method: 'GET' })
+    const ping = () => api(`${baseUrl}/`, { method: 'GET' })
 
 
     // Catalog
-    const getProducts = () => useFetch<Product[]>(`${baseUrl}/products/`)
-    const getProduct = (id: number) => useFetch<Product>(`${baseUrl}/products/${id}`)
+    const getProducts = () => useFetch<Product[]>(`${baseUrl}/products/`, withReadPin())
+    const getProduct = (id: number) => useFetch<Product>(`${baseUrl}/products/${id}`, withReadPin())
     const createProduct = (product: Partial<Product>) => {
         const auth = useAuthStore()
-        return $fetch<Product>(`${baseUrl}/products/`, {
+        return api<Product>(`${baseUrl}/products/`, {
             method: 'POST',
             body: product,
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
@@ -21,7 +47,7 @@ export const useApi = () => {
     }
     const updateProduct = (id: number, product: Partial<Product>) => {
         const auth = useAuthStore()
-        return $fetch<Product>(`${baseUrl}/products/${id}`, {
+        return api<Product>(`${baseUrl}/products/${id}`, {
             method: 'PUT',
             body: product,
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
@@ -29,17 +55,17 @@ export const useApi = () => {
     }
     const deleteProduct = (id: number) => {
         const auth = useAuthStore()
-        return $fetch(`${baseUrl}/products/${id}`, {
+        return api(`${baseUrl}/products/${id}`, {
             method: 'DELETE',
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
         })
     }
 
     // Brands
-    const getBrands = () => useFetch<Brand[]>(`${baseUrl}/brands/`)
+    const getBrands = () => useFetch<Brand[]>(`${baseUrl}/brands/`, withReadPin())
     const createBrand = (data: Partial<Brand>) => {
         const auth = useAuthStore()
-        return $fetch<Brand>(`${baseUrl}/brands/`, {
+        return api<Brand>(`${baseUrl}/brands/`, {
             method: 'POST',
             body: data,
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
@@ -47,22 +73,22 @@ export const useApi = () => {
     }
     const deleteBrand = (id: number) => {
         const auth = useAuthStore()
-        return $fetch(`${baseUrl}/brands/${id}`, {
+        return api(`${baseUrl}/brands/${id}`, {
             method: 'DELETE',
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
         })
     }
 
     // Categories
-    const getCategories = () => useFetch<Category[]>(`${baseUrl}/categories/`, {
+    const getCategories = () => useFetch<Category[]>(`${baseUrl}/categories/`, withReadPin({
         onResponseError({ response: _response }) {
             // console.warn('Failed to fetch categories:', _response.statusText)
         }
-    })
+    }))
 
     const createCategory = (data: Partial<Category>) => {
         const auth = useAuthStore()
-        return $fetch<Category>(`${baseUrl}/categories/`, {
+        return api<Category>(`${baseUrl}/categories/`, {
             method: 'POST',
             body: data,
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
@@ -70,7 +96,7 @@ export const useApi = () => {
     }
     const deleteCategory = (id: number) => {
         const auth = useAuthStore()
-        return $fetch(`${baseUrl}/categories/${id}`, {
+        return api(`${baseUrl}/categories/${id}`, {
             method: 'DELETE',
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
         })
@@ -78,10 +104,10 @@ export const useApi = () => {
 
 
     // Stores
-    const getStores = () => useFetch<StoreLocation[]>(`${baseUrl}/stores/`)
+    const getStores = () => useFetch<StoreLocation[]>(`${baseUrl}/stores/`, withReadPin())
     const createStore = (data: any) => {
         const auth = useAuthStore()
-        return $fetch<StoreLocation>(`${baseUrl}/stores/`, {
+        return api<StoreLocation>(`${baseUrl}/stores/`, {
             method: 'POST',
             body: data,
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
@@ -89,7 +115,7 @@ export const useApi = () => {
     }
     const deleteStore = (id: number) => {
         const auth = useAuthStore()
-        return $fetch(`${baseUrl}/stores/${id}`, {
+        return api(`${baseUrl}/stores/${id}`, {
             method: 'DELETE',
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
         })
@@ -97,9 +123,9 @@ export const useApi = () => {
 
 
     // Orders
-    const getOrders = () => useFetch<Order[]>(`${baseUrl}/orders/`)
+    const getOrders = () => useFetch<Order[]>(`${baseUrl}/orders/`, withReadPin())
     const createOrder = (order: OrderCreate): Promise<Order> => {
-        return $fetch<Order>(`${baseUrl}/orders/`, {
+        return api<Order>(`${baseUrl}/orders/`, {
             method: 'POST',
             body: order,
         })
@@ -111,7 +137,7 @@ export const useApi = () => {
         formData.append('username', username)
         formData.append('password', password)
 
-        return $fetch<TokenResponse>(`${baseUrl}/token`, {
+        return api<TokenResponse>(`${baseUrl}/token`, {
             method: 'POST',
             body: formData,
         })
@@ -119,14 +145,14 @@ export const useApi = () => {
 
     const getUsers = () => {
         const auth = useAuthStore()
-        return useFetch<User[]>(`${baseUrl}/users/`, {
+        return useFetch<User[]>(`${baseUrl}/users/`, withReadPin({
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
-        })
+        }))
     }
 
     const createUser = (userData: any) => {
         const auth = useAuthStore()
-        return $fetch<User>(`${baseUrl}/users/`, {
+        return api<User>(`${baseUrl}/users/`, {
             method: 'POST',
             body: userData,
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
@@ -135,7 +161,7 @@ export const useApi = () => {
 
     const updateUser = (userId: number, userData: any) => {
         const auth = useAuthStore()
-        return $fetch<User>(`${baseUrl}/users/${userId}`, {
+        return api<User>(`${baseUrl}/users/${userId}`, {
             method: 'PUT',
             body: userData,
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
@@ -144,7 +170,7 @@ export const useApi = () => {
 
     const deleteUser = (userId: number) => {
         const auth = useAuthStore()
-        return $fetch(`${baseUrl}/users/${userId}`, {
+        return api(`${baseUrl}/users/${userId}`, {
             method: 'DELETE',
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
         })
@@ -152,7 +178,7 @@ export const useApi = () => {
 
     const updateUserPassword = (userId: number, password: string) => {
         const auth = useAuthStore()
-        return $fetch<User>(`${baseUrl}/users/${userId}/password`, {
+        return api<User>(`${baseUrl}/users/${userId}/password`, {
             method: 'PUT',
             body: { password },
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
@@ -160,7 +186,7 @@ export const useApi = () => {
     }
 
     const getCurrentUser = (token: string) => {
-        return $fetch<User>(`${baseUrl}/users/me`, {
+        return api<User>(`${baseUrl}/users/me`, {
             headers: {
                 Authorization: `Bearer ${token}`,
             },
@@ -168,23 +194,23 @@ export const useApi = () => {
     }
 
     // Settings (CMS)
-    const getSettings = () => useFetch<any[]>(`${baseUrl}/settings/`, {
+    const getSettings = () => useFetch<any[]>(`${baseUrl}/settings/`, withReadPin({
         onResponseError({ response: _response }) {
             // Suppress errors during build/prerender to prevent build failure
             // console.warn('Failed to fetch settings:', _response.statusText)
         }
-    })
-    const updateSettings = (settings: { key: string, value: string }[]) => $fetch<any[]>(`${baseUrl}/settings/`, {
+    }))
+    const updateSettings = (settings: { key: string, value: string }[]) => api<any[]>(`${baseUrl}/settings/`, {
         method: 'PUT',
         body: settings
     })
 
-    const verifyPassword = (password: string) => $fetch(`${baseUrl}/auth/verify-password`, {
+    const verifyPassword = (password: string) => api(`${baseUrl}/auth/verify-password`, {
         method: 'POST',
         body: { password }
     })
 
-    const verifySuperCredentials = (credentials: any) => $fetch(`${baseUrl}/auth/verify-super-credentials`, {
+    const verifySuperCredentials = (credentials: any) => api(`${baseUrl}/auth/verify-super-credentials`, {
         method: 'POST',
         body: credentials
     })
@@ -192,13 +218,13 @@ export const useApi = () => {
     // Wishlist
     const getWishlist = () => {
         const auth = useAuthStore()
-        return useFetch<any[]>(`${baseUrl}/wishlist/`, {
+        return useFetch<any[]>(`${baseUrl}/wishlist/`, withReadPin({
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
-        })
+        }))
     }
     const addToWishlistApi = (productId: number) => {
         const auth = useAuthStore()
-        return $fetch(`${baseUrl}/wishlist/`, {
+        return api(`${baseUrl}/wishlist/`, {
             method: 'POST',
             body: { product_id: productId },
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
@@ -206,7 +232,7 @@ export const useApi = () => {
     }
     const removeFromWishlistApi = (productId: number) => {
         const auth = useAuthStore()
-        return $fetch(`${baseUrl}/wishlist/${productId}`, {
+        return api(`${baseUrl}/wishlist/${productId}`, {
             method: 'DELETE',
             headers: auth.token ? { Authorization: `Bearer ${auth.token}` } : undefined
         })
@@ -246,7 +272,7 @@ export const useApi = () => {
         uploadImage: async (file: File) => {
             const formData = new FormData()
             formData.append('file', file)
-            const result = await $fetch<{ url: string }>(`${baseUrl}/upload/`, {
+            const result = await api<{ url: string }>(`${baseUrl}/upload/`, {
                 method: 'POST',
                 body: formData
             })